@@ -5,10 +5,10 @@ from typing import Any, List, Tuple
 import math
 
 # External libraries
-from finta import TA
 import numpy as np
 import pandas as pd
 
+from harvest import indicators
 from harvest.utils import *
 from harvest.plugin._base import Plugin
 
@@ -37,11 +37,16 @@ class BaseAlgo:
         self.interval = None
         self.aggregations = None
         self.watchlist = []
+        # Indicators computed for each symbol in the watchlist, as dicts of
+        # the name of the indicator and its parameters, e.g.
+        # {"name": "bbands", "period": 20, "dev": 2.0}. See declare_indicators.
+        self.indicators = []
 
     def config(self):
         self.interval = None
         self.aggregations = None
         self.watchlist = []
+        self.indicators = []
 
     def setup(self):
         pass
@@ -335,11 +340,42 @@ class BaseAlgo:
                 interval = self.trader.interval[symbol]["interval"]
             else:
                 interval = interval_string_to_enum(interval)
-            if prices == None:
-                prices = self.trader.storage.load(symbol, interval)[symbol][ref]
 
         return symbol, interval, ref, prices
 
+    def declare_indicators(self):
+        """
+        Declares the indicators listed in self.indicators to the trader for
+        each symbol in the watchlist. The indicators of a symbol are then
+        computed together, sharing intermediates such as the moving averages
+        of sma, bbands, ema and macd, when any of them is first used after a
+        new data point is stored.
+        """
+        for spec in self.indicators:
+            params = dict(spec)
+            name = params.pop("name")
+            ref = params.pop("ref", "close")
+            interval = params.pop("interval", None)
+            for symbol in self.watchlist:
+                if interval is None:
+                    symbol_interval = self.trader.interval[symbol]["interval"]
+                else:
+                    symbol_interval = interval_string_to_enum(interval)
+                self.trader.indicators.declare(
+                    symbol, symbol_interval, name, ref, **params
+                )
+
+    def _stream(self, name, symbol, interval, ref, size, **params):
+        """
+        Returns the values of an indicator computed by the streaming
+        indicators of the trader, see harvest.indicators, or None if there
+        are less than size data points.
+        """
+        values = self.trader.indicators.compute(symbol, interval, name, ref, **params)
+        if values is None or len(values) < size:
+            return None
+        return values
+
     def rsi(
         self,
         symbol: str = None,
@@ -362,19 +398,18 @@ class BaseAlgo:
             symbol, interval, ref, prices
         )
 
+        if prices is None:
+            values = self._stream("rsi", symbol, interval, ref, period, period=period)
+            if values is None:
+                debugger.warning("Not enough data to calculate RSI, returning None")
+                return None
+            return values[:, 0]
+
         if len(prices) < period:
             debugger.warning("Not enough data to calculate RSI, returning None")
             return None
 
-        ohlc = pd.DataFrame(
-            {
-                "close": np.array(prices),
-                "open": np.zeros(len(prices)),
-                "high": np.zeros(len(prices)),
-                "low": np.zeros(len(prices)),
-            }
-        )
-        return TA.RSI(ohlc, period=period).to_numpy()
+        return indicators.rsi(prices, period)
 
     def sma(
         self,
@@ -398,19 +433,18 @@ class BaseAlgo:
             symbol, interval, ref, prices
         )
 
+        if prices is None:
+            values = self._stream("sma", symbol, interval, ref, period, period=period)
+            if values is None:
+                debugger.warning("Not enough data to calculate SMA, returning None")
+                return None
+            return values[:, 0]
+
         if len(prices) < period:
             debugger.warning("Not enough data to calculate SMA, returning None")
             return None
 
-        ohlc = pd.DataFrame(
-            {
-                "close": np.array(prices),
-                "open": np.zeros(len(prices)),
-                "high": np.zeros(len(prices)),
-                "low": np.zeros(len(prices)),
-            }
-        )
-        return TA.SMA(ohlc, period=period).to_numpy()
+        return indicators.sma(prices, period)
 
     def ema(
         self,
@@ -434,19 +468,18 @@ class BaseAlgo:
             symbol, interval, ref, prices
         )
 
+        if prices is None:
+            values = self._stream("ema", symbol, interval, ref, period, period=period)
+            if values is None:
+                debugger.warning("Not enough data to calculate EMA, returning None")
+                return None
+            return values[:, 0]
+
         if len(prices) < period:
             debugger.warning("Not enough data to calculate EMA, returning None")
             return None
 
-        ohlc = pd.DataFrame(
-            {
-                "close": np.array(prices),
-                "open": np.zeros(len(prices)),
-                "high": np.zeros(len(prices)),
-                "low": np.zeros(len(prices)),
-            }
-        )
-        return TA.EMA(ohlc, period=period).to_numpy()
+        return indicators.ema(prices, period)
 
     def bbands(
         self,
@@ -472,22 +505,185 @@ class BaseAlgo:
             symbol, interval, ref, prices
         )
 
+        if prices is None:
+            values = self._stream(
+                "bbands", symbol, interval, ref, period, period=period, dev=dev
+            )
+            if values is None:
+                debugger.warning("Not enough data to calculate BBands, returning None")
+                return None, None, None
+            t, m, b = values.T
+            return t, m, b
+
         if len(prices) < period:
             debugger.warning("Not enough data to calculate BBands, returning None")
             return None, None, None
 
-        ohlc = pd.DataFrame(
-            {
-                "close": np.array(prices),
-                "open": np.zeros(len(prices)),
-                "high": np.zeros(len(prices)),
-                "low": np.zeros(len(prices)),
-            }
+        return indicators.bbands(prices, period, dev)
+
+    def macd(
+        self,
+        symbol: str = None,
+        fast: int = 12,
+        slow: int = 26,
+        signal: int = 9,
+        interval: Interval = None,
+        ref: str = "close",
+        prices=None,
+    ) -> Tuple[np.array, np.array]:
+        """Calculate MACD
+
+        :param str? symbol:    Symbol to perform calculation on. defaults to first symbol in watchlist
+        :param int? fast:      Period of the fast EMA. defaults to 12
+        :param int? slow:      Period of the slow EMA. defaults to 26
+        :param int? signal:    Period of the EMA of the signal line. defaults to 9
+        :param str? interval:  Interval to perform the calculation. defaults to interval of algorithm
+        :param str? ref:       'close', 'open', 'high', or 'low'. defaults to 'close'
+        :param list? prices:    When specified, this function will use the values provided in the
+                                list to perform calculations and ignore other parameters. defaults to None
+        :returns: A tuple of numpy lists, the MACD and signal line values
+        """
+        symbol, interval, ref, prices = self._default_param(
+            symbol, interval, ref, prices
+        )
+
+        if prices is None:
+            values = self._stream(
+                "macd", symbol, interval, ref, slow, fast=fast, slow=slow, signal=signal
+            )
+            if values is None:
+                debugger.warning("Not enough data to calculate MACD, returning None")
+                return None, None
+            line, signal_line = values.T
+            return line, signal_line
+
+        if len(prices) < slow:
+            debugger.warning("Not enough data to calculate MACD, returning None")
+            return None, None
+
+        return indicators.macd(prices, fast, slow, signal)
+
+    def _panel(self, symbols, interval, ref, period):
+        """
+        Returns the index and the values of a field of several symbols,
+        aligned on the union of their timestamps, or None if there are less
+        than period data points. Missing data points are filled with the
+        last known value of the symbol.
+        """
+        if self.trader is None:
+            raise Exception("Batch indicators need the data of a trader")
+        if symbols is None:
+            symbols = self.watchlist
+        if interval is None:
+            interval = self.trader.interval[symbols[0]]["interval"]
+        else:
+            interval = interval_string_to_enum(interval)
+
+        index, values = self.trader.storage.load_panel(
+            symbols, interval, fields=[ref], fill="ffill"
         )
+        if len(index) < period:
+            return None
+        return symbols, index_utc_to_local(index, self.trader.timezone), values[..., 0]
 
-        t, m, b = TA.BBANDS(
-            ohlc, period=period, std_multiplier=dev, MA=TA.SMA(ohlc, period)
-        ).T.to_numpy()
+    def rsi_all(
+        self,
+        symbols: List[str] = None,
+        period: int = 14,
+        interval: Interval = None,
+        ref: str = "close",
+    ) -> pd.DataFrame:
+        """Calculate RSI of several symbols at once
+
+        :param list? symbols:   Symbols to perform calculation on. defaults to the watchlist
+        :param int? period:     Period of RSI. defaults to 14
+        :param str? interval:   Interval to perform the calculation. defaults to interval of the first symbol
+        :param str? ref:        'close', 'open', 'high', or 'low'. defaults to 'close'
+        :returns: A dataframe of RSI values, with a row per symbol and a column per timestamp
+        """
+        panel = self._panel(symbols, interval, ref, period)
+        if panel is None:
+            debugger.warning("Not enough data to calculate RSI, returning None")
+            return None
+        symbols, index, values = panel
+        return pd.DataFrame(
+            indicators.rsi(values, period), index=symbols, columns=index
+        )
+
+    def sma_all(
+        self,
+        symbols: List[str] = None,
+        period: int = 14,
+        interval: Interval = None,
+        ref: str = "close",
+    ) -> pd.DataFrame:
+        """Calculate SMA of several symbols at once
+
+        :param list? symbols:  Symbols to perform calculation on. defaults to the watchlist
+        :param int? period:    Period of SMA. defaults to 14
+        :param str? interval:  Interval to perform the calculation. defaults to interval of the first symbol
+        :param str? ref:       'close', 'open', 'high', or 'low'. defaults to 'close'
+        :returns: A dataframe of SMA values, with a row per symbol and a column per timestamp
+        """
+        panel = self._panel(symbols, interval, ref, period)
+        if panel is None:
+            debugger.warning("Not enough data to calculate SMA, returning None")
+            return None
+        symbols, index, values = panel
+        return pd.DataFrame(
+            indicators.sma(values, period), index=symbols, columns=index
+        )
+
+    def ema_all(
+        self,
+        symbols: List[str] = None,
+        period: int = 14,
+        interval: Interval = None,
+        ref: str = "close",
+    ) -> pd.DataFrame:
+        """Calculate EMA of several symbols at once
+
+        :param list? symbols:  Symbols to perform calculation on. defaults to the watchlist
+        :param int? period:    Period of EMA. defaults to 14
+        :param str? interval:  Interval to perform the calculation. defaults to interval of the first symbol
+        :param str? ref:       'close', 'open', 'high', or 'low'. defaults to 'close'
+        :returns: A dataframe of EMA values, with a row per symbol and a column per timestamp
+        """
+        panel = self._panel(symbols, interval, ref, period)
+        if panel is None:
+            debugger.warning("Not enough data to calculate EMA, returning None")
+            return None
+        symbols, index, values = panel
+        return pd.DataFrame(
+            indicators.ema(values, period), index=symbols, columns=index
+        )
+
+    def bbands_all(
+        self,
+        symbols: List[str] = None,
+        period: int = 14,
+        interval: Interval = None,
+        ref: str = "close",
+        dev: float = 1.0,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Calculate Bollinger Bands of several symbols at once
+
+        :param list? symbols:  Symbols to perform calculation on. defaults to the watchlist
+        :param int? period:    Period of BBands. defaults to 14
+        :param str? interval:  Interval to perform the calculation. defaults to interval of the first symbol
+        :param str? ref:       'close', 'open', 'high', or 'low'. defaults to 'close'
+        :param float? dev:         Standard deviation of the bands. defaults to 1.0
+        :returns: A tuple of dataframes of BBand top, average, and bottom values, each with a row per symbol and a column per timestamp
+        """
+        panel = self._panel(symbols, interval, ref, period)
+        if panel is None:
+            debugger.warning("Not enough data to calculate BBands, returning None")
+            return None, None, None
+        symbols, index, values = panel
+        t, m, b = (
+            pd.DataFrame(band, index=symbols, columns=index)
+            for band in indicators.bbands(values, period, dev)
+        )
         return t, m, b
 
     def crossover(self, prices_0, prices_1):
@@ -558,7 +754,8 @@ class BaseAlgo:
         if symbol is None:
             symbol = self.watchlist[0]
         if len(symbol) <= 6:
-            return self.trader.storage.load(symbol, self.interval)[symbol]["close"][-1]
+            df = self.trader.storage.load_last(symbol, self.interval, 1)
+            return df[symbol]["close"].iloc[-1]
         for p in self.trader.option_positions:
             if p["occ_symbol"] == symbol:
                 return p["current_price"] * p["multiplier"]
@@ -567,14 +764,14 @@ class BaseAlgo:
     def get_asset_price_list(
         self, symbol: str = None, interval: str = None, ref: str = "close"
     ):
-        """Returns a list of recent prices for an asset.
+        """Returns the recent prices of an asset as a read-only numpy array.
 
         This function is not compatible with options.
 
         :param str? symbol:     Symbol of stock or crypto asset. defaults to first symbol in watchlist
         :param str? interval:   Interval of data. defaults to the interval of the algorithm
         :param str? ref:        'close', 'open', 'high', or 'low'. defaults to 'close'
-        :returns: List of prices
+        :returns: Array of prices
         """
         if symbol is None:
             symbol = self.watchlist[0]
@@ -583,7 +780,7 @@ class BaseAlgo:
         else:
             interval = interval_string_to_enum(interval)
         if len(symbol) <= 6:
-            return list(self.trader.storage.load(symbol, interval)[symbol][ref])
+            return self.trader.storage.load_array(symbol, interval, ref)
         debugger.warning("Price list not available for options")
         return None
 
@@ -610,8 +807,9 @@ class BaseAlgo:
         if interval is None:
             interval = self.interval
         if len(symbol) <= 6:
-            df = self.trader.storage.load(symbol, interval).iloc[[-1]][symbol]
-            return pandas_timestamp_to_local(df, self.trader.timezone)
+            return self.trader.storage.load_local(
+                symbol, interval, self.trader.timezone, n=1
+            )
         debugger.warning("Candles not available for options")
         return None
 
@@ -639,8 +837,7 @@ class BaseAlgo:
             symbol = self.watchlist[0]
         if interval is None:
             interval = self.interval
-        df = self.trader.storage.load(symbol, interval)[symbol]
-        return pandas_timestamp_to_local(df, self.trader.timezone)
+        return self.trader.storage.load_local(symbol, interval, self.trader.timezone)
 
     def get_asset_returns(self, symbol=None) -> float:
         """Returns the return of a specified asset.
@@ -0,0 +1,768 @@
+import math
+import inspect
+from collections import deque
+from functools import partial
+from threading import Lock
+from typing import Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from harvest.storage.ring_storage import CandleRing
+from harvest.utils import *
+
+"""
+This module computes technical indicators.
+
+The kernels, sma, ema, rsi, bbands, macd, atr and vwap, compute an indicator
+over whole series held in NumPy arrays. They take a 1-D array of values or a
+2-D array with one row per symbol, and compute the indicator along the last
+axis, so a batch of symbols is evaluated in one pass. NaN values are ignored
+by the exponential averages and make the windows containing them NaN, as in
+pandas.
+
+The streaming indicators compute an indicator one data point at a time.
+Each indicator keeps the state it needs, such as the sum of the values in
+its period, so that adding a data point takes O(1) instead of going over
+the whole series again. The values match the ones of the kernels. The last
+update can be undone in O(1) as well, so that a revised last data point
+does not require going over the series again.
+
+The IndicatorEngine of the trader keeps an indicator per symbol, interval,
+input field and parameters, and feeds it the data points stored since it
+was last used. The indicators an algo declares in config are computed
+together by a Pipeline, which shares the intermediates they have in common.
+"""
+
+
+def _filter(values: np.ndarray, decay: float) -> np.ndarray:
+    """
+    Returns y along the last axis of values, where y[t] = values[t] +
+    decay * y[t - 1]. Each block of the series is computed with a cumulative
+    sum of the values scaled by the inverse powers of decay, with blocks
+    short enough for the powers not to overflow.
+    """
+    if decay == 0:
+        return values.copy()
+    size = values.shape[-1]
+    block = max(int(100 * math.log(10) / -math.log(decay)), 1)
+    powers = decay ** np.arange(min(block, size) + 1)
+    result = np.empty_like(values)
+    carry = None
+    for start in range(0, size, block):
+        chunk = values[..., start : start + block]
+        n = chunk.shape[-1]
+        filtered = np.cumsum(chunk / powers[:n], axis=-1) * powers[:n]
+        if carry is not None:
+            filtered += carry[..., None] * powers[1 : n + 1]
+        result[..., start : start + n] = filtered
+        carry = filtered[..., -1]
+    return result
+
+
+def _ewm(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponentially weighted mean along the last axis, as pandas'
+    ewm(alpha=alpha, adjust=True).mean(). NaN values are left out of the
+    mean, and the mean is NaN until the first value that is not NaN.
+    """
+    missing = np.isnan(values)
+    numerator = _filter(np.where(missing, 0.0, values), 1 - alpha)
+    denominator = _filter((~missing).astype(np.float64), 1 - alpha)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _rolling(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Returns the windows of period values ending at each data point, and an
+    array of NaN to hold the results of the data points without a window.
+    """
+    shape = values.shape[:-1] + (min(period - 1, values.shape[-1]),)
+    if values.shape[-1] < period:
+        return None, np.full(shape, np.nan)
+    return sliding_window_view(values, period, axis=-1), np.full(shape, np.nan)
+
+
+def sma(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """
+    Simple moving average, NaN until period values are available.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    windows, head = _rolling(values, period)
+    if windows is None:
+        return head
+    return np.concatenate([head, windows.mean(axis=-1)], axis=-1)
+
+
+def ema(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """
+    Exponential moving average with a span of period, as pandas'
+    ewm(span=period, adjust=True).
+    """
+    return _ewm(np.asarray(values, dtype=np.float64), 2 / (period + 1))
+
+
+def rsi(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """
+    Relative strength index, with the gains and losses averaged as in
+    pandas' ewm(alpha=1 / period, adjust=True).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    delta = np.diff(values, axis=-1, prepend=np.nan)
+    gain = _ewm(np.where(delta < 0, 0.0, delta), 1 / period)
+    loss = _ewm(np.where(delta > 0, 0.0, -delta), 1 / period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 - 100 / (1 + gain / loss)
+
+
+def bbands(
+    values: np.ndarray, period: int = 14, dev: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bollinger bands around the simple moving average, dev sample standard
+    deviations away from it. Returns the upper, middle and lower bands.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    windows, head = _rolling(values, period)
+    if windows is None:
+        return head, head.copy(), head.copy()
+    middle = windows.mean(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = windows.std(axis=-1, ddof=1)
+    return (
+        np.concatenate([head, middle + dev * std], axis=-1),
+        np.concatenate([head, middle], axis=-1),
+        np.concatenate([head, middle - dev * std], axis=-1),
+    )
+
+
+def macd(
+    values: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Moving average convergence divergence: the difference between the
+    exponential moving averages of spans fast and slow. Returns the MACD
+    and its exponential moving average of span signal.
+    """
+    line = ema(values, fast) - ema(values, slow)
+    return line, ema(line, signal)
+
+
+def atr(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14
+) -> np.ndarray:
+    """
+    Average true range: the simple moving average of the largest of the
+    range of each data point and the distances between its high and low
+    and the previous close.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    previous = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    ranges = np.stack(
+        [np.abs(high - low), np.abs(high - previous), np.abs(previous - low)]
+    )
+    # The first data point has no previous close
+    ranges[1:, ..., 0] = np.nan
+    with np.errstate(invalid="ignore"):
+        return sma(np.fmax.reduce(ranges, axis=0), period)
+
+
+def vwap(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray
+) -> np.ndarray:
+    """
+    Volume weighted average price of the typical price, the mean of the high,
+    low and close, since the first data point.
+    """
+    typical = (
+        np.asarray(high, dtype=np.float64)
+        + np.asarray(low, dtype=np.float64)
+        + np.asarray(close, dtype=np.float64)
+    ) / 3
+    volume = np.asarray(volume, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.cumsum(volume * typical, axis=-1) / np.cumsum(volume, axis=-1)
+
+
+class Indicator:
+    """
+    The base class of the streaming indicators.
+    """
+
+    # Names of the values returned by update
+    outputs = ["value"]
+
+    def __init__(self, period: int):
+        self.period = period
+
+    def update(self, value: float) -> Tuple[float, ...]:
+        """
+        Adds the next value of the series and returns the values of the
+        outputs at that data point.
+        """
+        raise NotImplementedError
+
+    def revert(self) -> None:
+        """
+        Undoes the last update, e.g. before adding the revised value of the
+        last data point. Only the last update can be undone.
+        """
+        raise NotImplementedError
+
+
+class SMA(Indicator):
+    """
+    Simple moving average, NaN until period values are added.
+    """
+
+    def __init__(self, period: int = 14):
+        super().__init__(period)
+        self.window = deque()
+        self.sum = 0.0
+        self.count = 0
+        # The sum and count before the last update and the value it evicted
+        # from the window, if any
+        self.undo = None
+
+    def update(self, value: float) -> Tuple[float]:
+        undo = (self.sum, self.count)
+        self.window.append(value)
+        self.sum += value
+        evicted = ()
+        if len(self.window) > self.period:
+            evicted = (self.window.popleft(),)
+            self.sum -= evicted[0]
+        self.undo = undo + (evicted,)
+        # Recompute the sum once every period values so that rounding
+        # errors do not accumulate
+        self.count += 1
+        if self.count % self.period == 0:
+            self.sum = math.fsum(self.window)
+        if len(self.window) < self.period:
+            return (np.nan,)
+        return (self.sum / self.period,)
+
+    def revert(self) -> None:
+        self.sum, self.count, evicted = self.undo
+        self.window.pop()
+        self.window.extendleft(evicted)
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average with a span of period, computed with the
+    weights of pandas' ewm(adjust=True).
+    """
+
+    def __init__(self, period: int = 14):
+        super().__init__(period)
+        self.decay = 1 - 2 / (period + 1)
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.undo = None
+
+    def update(self, value: float) -> Tuple[float]:
+        self.undo = (self.numerator, self.denominator)
+        self.numerator = value + self.decay * self.numerator
+        self.denominator = 1 + self.decay * self.denominator
+        return (self.numerator / self.denominator,)
+
+    def revert(self) -> None:
+        self.numerator, self.denominator = self.undo
+
+
+class RSI(Indicator):
+    """
+    Relative strength index, with the gains and losses averaged as in
+    pandas' ewm(alpha=1 / period, adjust=True). Since both averages have
+    the same weights, only the weighted sums are kept.
+    """
+
+    def __init__(self, period: int = 14):
+        super().__init__(period)
+        self.decay = 1 - 1 / period
+        self.previous = None
+        self.gain = 0.0
+        self.loss = 0.0
+        self.undo = None
+
+    def update(self, value: float) -> Tuple[float]:
+        self.undo = (self.previous, self.gain, self.loss)
+        previous, self.previous = self.previous, value
+        if previous is None:
+            return (np.nan,)
+        delta = value - previous
+        self.gain = max(delta, 0.0) + self.decay * self.gain
+        self.loss = max(-delta, 0.0) + self.decay * self.loss
+        if self.loss == 0:
+            return (np.nan if self.gain == 0 else 100.0,)
+        rs = self.gain / self.loss
+        return (100 - 100 / (1 + rs),)
+
+    def revert(self) -> None:
+        self.previous, self.gain, self.loss = self.undo
+
+
+class RollingVariance(Indicator):
+    """
+    Sample variance of the last period values, NaN until period values are
+    added.
+    """
+
+    def __init__(self, period: int = 14):
+        super().__init__(period)
+        self.window = deque()
+        # Mean and sum of the squared differences from the mean of the
+        # values in the window, updated as in Welford's algorithm
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.count = 0
+        # The state before the last update and the value it evicted from
+        # the window, if any
+        self.undo = None
+
+    def update(self, value: float) -> Tuple[float]:
+        undo = (self.mean, self.m2, self.count)
+        evicted = ()
+        self.window.append(value)
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            evicted = (old,)
+            mean = self.mean + (value - old) / self.period
+            self.m2 += (value - old) * (value - mean + old - self.mean)
+            self.mean = mean
+        else:
+            delta = value - self.mean
+            self.mean += delta / len(self.window)
+            self.m2 += delta * (value - self.mean)
+        self.undo = undo + (evicted,)
+        self.count += 1
+        if self.count % self.period == 0:
+            window = np.fromiter(self.window, dtype=np.float64)
+            self.mean = window.mean()
+            self.m2 = float(((window - self.mean) ** 2).sum())
+
+        if len(self.window) < self.period or self.period < 2:
+            return (np.nan,)
+        return (max(self.m2, 0.0) / (self.period - 1),)
+
+    def revert(self) -> None:
+        self.mean, self.m2, self.count, evicted = self.undo
+        self.window.pop()
+        self.window.extendleft(evicted)
+
+
+def _bands(dev: float, mean: float, variance: float) -> Tuple[float, float, float]:
+    std = math.sqrt(variance)
+    return (mean + dev * std, mean, mean - dev * std)
+
+
+class BBands(Indicator):
+    """
+    Bollinger bands around the simple moving average, dev sample standard
+    deviations away from it.
+    """
+
+    outputs = ["upper", "middle", "lower"]
+
+    def __init__(self, period: int = 14, dev: float = 1.0):
+        super().__init__(period)
+        self.dev = dev
+        self.variance = RollingVariance(period)
+
+    def update(self, value: float) -> Tuple[float, float, float]:
+        (variance,) = self.variance.update(value)
+        if np.isnan(variance):
+            return (np.nan, np.nan, np.nan)
+        return _bands(self.dev, self.variance.mean, variance)
+
+    def revert(self) -> None:
+        self.variance.revert()
+
+
+class MACD(Indicator):
+    """
+    Moving average convergence divergence: the difference between the
+    exponential moving averages of spans fast and slow, and its exponential
+    moving average of span signal.
+    """
+
+    outputs = ["macd", "signal"]
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        super().__init__(slow)
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, value: float) -> Tuple[float, float]:
+        line = self.fast.update(value)[0] - self.slow.update(value)[0]
+        return (line, self.signal.update(line)[0])
+
+    def revert(self) -> None:
+        self.fast.revert()
+        self.slow.revert()
+        self.signal.revert()
+
+
+class _Combine:
+    """
+    A node of a Pipeline computing its outputs from the outputs of other
+    nodes, without state of its own.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def update(self, *values: float) -> Tuple[float, ...]:
+        return self.function(*values)
+
+    def revert(self) -> None:
+        pass
+
+
+class Pipeline(Indicator):
+    """
+    Computes several indicators over the same series as a graph of nodes,
+    so that the intermediates they have in common, such as the rolling mean
+    of sma and bbands or the EMAs of ema and macd, are computed once per
+    data point. The outputs are the outputs of every indicator, in order.
+    """
+
+    def __init__(self, specs: tuple):
+        """
+        :specs: the name and the parameters of each indicator, as pairs of a
+            name and a tuple of (parameter, value) pairs
+        """
+        super().__init__(1)
+        # The nodes in the order they are updated and the keys of the nodes
+        # whose first output is their input. The series is the node "value".
+        self.nodes = {}
+        # The node and the columns of the outputs of each indicator
+        self.columns = {}
+        self.outputs = []
+        for name, params in specs:
+            node = self._build(name, **dict(params))
+            first = len(self.outputs)
+            self.outputs += IndicatorEngine.indicators[name].outputs
+            self.columns[(name, params)] = (node, slice(first, len(self.outputs)))
+
+    def _add(self, key: tuple, node, *inputs: tuple) -> tuple:
+        if key not in self.nodes:
+            self.nodes[key] = (node, inputs)
+        return key
+
+    def _build(self, name: str, **params) -> tuple:
+        """
+        Adds the nodes computing an indicator and returns the key of the node
+        holding its outputs.
+        """
+        if name == "sma":
+            return self._add(("sma", params["period"]), SMA(**params), "value")
+        if name == "ema":
+            return self._ema(params["period"], "value")
+        if name == "rsi":
+            return self._add(("rsi", params["period"]), RSI(**params), "value")
+        if name == "bbands":
+            period = params["period"]
+            return self._add(
+                ("bbands", period, params["dev"]),
+                _Combine(partial(_bands, params["dev"])),
+                self._add(("sma", period), SMA(period), "value"),
+                self._add(("variance", period), RollingVariance(period), "value"),
+            )
+        if name == "macd":
+            fast, slow = params["fast"], params["slow"]
+            line = self._add(
+                ("macd", fast, slow),
+                _Combine(lambda fast, slow: (fast - slow,)),
+                self._ema(fast, "value"),
+                self._ema(slow, "value"),
+            )
+            return self._add(
+                ("macd", fast, slow, params["signal"]),
+                _Combine(lambda line, signal: (line, signal)),
+                line,
+                self._ema(params["signal"], line),
+            )
+        raise Exception(f"Indicator {name} cannot be added to a pipeline")
+
+    def _ema(self, period: int, source) -> tuple:
+        return self._add(("ema", period, source), EMA(period), source)
+
+    def update(self, value: float) -> Tuple[float, ...]:
+        results = {"value": (value,)}
+        for key, (node, inputs) in self.nodes.items():
+            results[key] = node.update(*(results[i][0] for i in inputs))
+        outputs = []
+        for node, _ in self.columns.values():
+            outputs += results[node]
+        return tuple(outputs)
+
+    def revert(self) -> None:
+        for node, _ in self.nodes.values():
+            node.revert()
+
+
+class _Stream:
+    """
+    The state of an indicator computed over a series of the storage.
+    """
+
+    def __init__(self, indicator: Indicator, ring: CandleRing):
+        self.indicator = indicator
+        # The values of the outputs at each data point
+        self.ring = ring
+        self.last_value = None
+
+
+class IndicatorCache:
+    """
+    Memoizes the values of the indicators computed by the engine. There is
+    one entry per symbol, interval, indicator, field and parameters, tagged
+    with the version of the series and the timestamp of its last data point.
+    An entry is only returned while the series has the same version, so it
+    is invalidated as soon as a new data point is stored.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key: tuple, version: int) -> np.ndarray:
+        """
+        Returns the values cached for the given version of the series, or
+        None if there are none.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(
+        self, key: tuple, version: int, timestamp: dt.datetime, values: np.ndarray
+    ) -> None:
+        with self.lock:
+            self.entries[key] = (version, timestamp, values)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries = {}
+
+    def info(self) -> dict:
+        """
+        Returns the number of hits and misses, the hit rate and the number of
+        cached entries.
+        """
+        with self.lock:
+            calls = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / calls if calls else 0.0,
+                "entries": len(self.entries),
+            }
+
+
+class IndicatorEngine:
+    """
+    Keeps the streaming indicators computed over the series of a storage.
+    """
+
+    indicators = {
+        "sma": SMA,
+        "ema": EMA,
+        "rsi": RSI,
+        "bbands": BBands,
+        "macd": MACD,
+        "pipeline": Pipeline,
+    }
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.streams = {}
+        self.cache = IndicatorCache()
+        # The indicators declared for each symbol, interval and field, which
+        # are computed by a single pipeline
+        self.pipelines = {}
+        # The default parameters of each indicator
+        self.defaults = {}
+        self.lock = Lock()
+
+    def _params(self, name: str, params: dict) -> tuple:
+        """
+        Returns the parameters of an indicator with the defaults of the ones
+        that are not given, so that the same indicator has the same key.
+        """
+        if name not in self.defaults:
+            if name not in self.indicators:
+                raise Exception(f"Unknown indicator {name}")
+            signature = inspect.signature(self.indicators[name])
+            self.defaults[name] = {
+                param.name: param.default
+                for param in signature.parameters.values()
+                if param.default is not param.empty
+            }
+        params = self.defaults[name] | params
+        return tuple(sorted(params.items()))
+
+    def declare(
+        self,
+        symbol: str,
+        interval: Interval,
+        name: str,
+        ref: str = "close",
+        **params,
+    ) -> None:
+        """
+        Declares an indicator that is computed over a series. The indicators
+        declared for the same series and field are computed together, see
+        Pipeline, and their values are cached each time one of them is
+        computed.
+        """
+        params = self._params(name, params)
+        with self.lock:
+            specs = self.pipelines.get((symbol, interval, ref), ())
+            if (name, params) in specs:
+                return
+            self.streams.pop(self._pipeline_key(symbol, interval, ref), None)
+            self.pipelines[(symbol, interval, ref)] = specs + ((name, params),)
+
+    def _pipeline_key(self, symbol: str, interval: Interval, ref: str) -> tuple:
+        specs = self.pipelines.get((symbol, interval, ref), ())
+        return (symbol, interval, "pipeline", ref, (("specs", specs),))
+
+    def compute(
+        self,
+        symbol: str,
+        interval: Interval,
+        name: str,
+        ref: str = "close",
+        **params,
+    ) -> np.ndarray:
+        """
+        Returns the values of an indicator at the data points of a series,
+        as a read-only array with a column per output of the indicator, or
+        None if the series is empty. Only the data points stored since the
+        last call with the same arguments are added to the indicator, and
+        the array is shared by the calls made until a new data point is
+        stored.
+        :name: 'sma', 'ema', 'rsi', 'bbands' or 'macd'
+        :ref: the field of the series the indicator is computed on
+        :params: the arguments of the indicator, e.g. period
+        """
+        params = self._params(name, params)
+        key = (symbol, interval, name, ref, params)
+        with self.lock:
+            version = self.storage.version(symbol, interval)
+            values = self.cache.get(key, version)
+            if values is not None:
+                return values
+
+            specs = self.pipelines.get((symbol, interval, ref), ())
+            if (name, params) not in specs:
+                return self._compute(key, version)[0]
+
+            # The declared indicators of the series are computed together,
+            # and the values of each of them are cached
+            pipeline = self._pipeline_key(symbol, interval, ref)
+            values, timestamp = self._compute(pipeline, version)
+            if values is None:
+                return None
+            columns = self.streams[pipeline].indicator.columns
+            for (other, other_params), (_, column) in columns.items():
+                self.cache.put(
+                    (symbol, interval, other, ref, other_params),
+                    version,
+                    timestamp,
+                    values[:, column],
+                )
+            return values[:, columns[(name, params)][1]]
+
+    def _compute(self, key: tuple, version: int) -> Tuple[np.ndarray, dt.datetime]:
+        """
+        Updates the stream of an indicator and caches its values. Returns the
+        values and the timestamp of the last data point, or None and None if
+        the series is empty.
+        """
+        stream = self._update(key, self.streams.get(key))
+        if stream is None:
+            self.streams.pop(key, None)
+            return None, None
+        self.streams[key] = stream
+        first, last = stream.ring.window()
+        values = stream.ring.values[first:last].copy()
+        values.flags.writeable = False
+        timestamp = stream.ring.to_index(last - 1, last)[0]
+        self.cache.put(key, version, timestamp, values)
+        return values, timestamp
+
+    def _update(self, key: tuple, stream: _Stream) -> _Stream:
+        """
+        Adds the data points stored since the last update to a stream. The
+        stream is rebuilt from the whole series if the data points it was
+        computed on changed, e.g. because the series was reset.
+        """
+        symbol, interval, name, ref, params = key
+        data = None
+        if stream is not None and len(stream.ring):
+            first, last = stream.ring.window()
+            last = stream.ring.to_index(last - 1, last)[0]
+            data = self.storage.load(symbol, interval, start=last)
+            if data is None or data.empty or data.index[0] != last:
+                data = None
+            elif data[symbol][ref].iloc[0] != stream.last_value:
+                # The last data point was revised
+                stream.indicator.revert()
+            else:
+                data = data.iloc[1:]
+
+        if data is None:
+            data = self.storage.load(symbol, interval)
+            if data is None or data.empty:
+                return None
+            indicator = self.indicators[name](**dict(params))
+            limit_size = self.storage.limit_size
+            ring = CandleRing(
+                indicator.outputs,
+                (
+                    self.storage.queue_size
+                    if limit_size
+                    else max(self.storage.queue_size, len(data))
+                ),
+                fixed=limit_size,
+                tz=data.index.tz,
+                index_name=data.index.name,
+            )
+            stream = _Stream(indicator, ring)
+
+        if data.empty:
+            return stream
+        values = data[symbol][ref].to_numpy(dtype=np.float64)
+        outputs = np.empty((len(values), len(stream.ring.fields)))
+        for i, value in enumerate(values):
+            outputs[i] = stream.indicator.update(value)
+        stream.ring.write(data.index.asi8, outputs)
+        stream.last_value = values[-1]
+        return stream
+
+    def reset(self) -> None:
+        """
+        Drops every indicator, e.g. after the storage is replaced.
+        """
+        with self.lock:
+            self.streams = {}
+            self.cache.clear()
+
+    def cache_info(self) -> dict:
+        """
+        Returns the statistics of the cache, see IndicatorCache.info.
+        """
+        return self.cache.info()
@@ -1,5 +1,9 @@
 from harvest.storage.base_storage import BaseStorage
 from harvest.storage.csv_storage import CSVStorage
 from harvest.storage.pickle_storage import PickleStorage
+from harvest.storage.ring_storage import RingStorage
+from harvest.storage.archive_storage import ArchiveStorage
+from harvest.storage.tiered_storage import TieredStorage
+from harvest.storage.shared_storage import SharedMemoryStorage
 
 from harvest.storage.base_logger import BaseLogger
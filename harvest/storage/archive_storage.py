@@ -0,0 +1,279 @@
+import re
+import json
+import zlib
+import struct
+from os import listdir, makedirs
+from os.path import isfile, join
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from harvest.storage import BaseStorage, PickleStorage
+from harvest.utils import *
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+This module implements a compressed columnar archive format for candles.
+
+A file holds a magic string, a JSON header describing the series, and one
+compressed chunk per column. Timestamps are stored as the delta of their
+deltas, which is zero for evenly spaced candles. Columns whose values have
+a fixed number of decimals, such as prices in cents, are stored as the
+deltas of the values scaled to integers. Other columns are stored as the
+XOR of the bits of consecutive values, which is mostly zeros for slowly
+changing values, as in Gorilla. Before compression, the bytes
+of the encoded values are regrouped by significance so that the zeros end
+up next to each other. Chunks are compressed with zstandard if it is
+installed and with zlib otherwise.
+"""
+
+MAGIC = b"HRVARCH1"
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    """
+    Groups the n-th bytes of every 8 byte value together.
+    """
+    return values.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(buffer: bytes, rows: int) -> np.ndarray:
+    data = np.frombuffer(buffer, dtype=np.uint8).reshape(8, rows)
+    return np.ascontiguousarray(data.T).view("<u8").ravel()
+
+
+def _compress(buffer: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(buffer)
+    return zlib.compress(buffer, 9)
+
+
+def _decompress(buffer: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard is required to read this archive")
+        return zstandard.ZstdDecompressor().decompress(buffer)
+    return zlib.decompress(buffer)
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    # Maps small negative numbers to small positive ones
+    return ((values << 1) ^ (values >> 63)).view("<u8")
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    sign = (values & np.uint64(1)).view("<i8")
+    return (values >> np.uint64(1)).view("<i8") ^ -sign
+
+
+def _encode_timestamps(timestamps: np.ndarray) -> np.ndarray:
+    encoded = timestamps.astype("<i8")
+    if len(encoded) > 1:
+        encoded[1:] = np.diff(timestamps)
+    if len(encoded) > 2:
+        encoded[2:] = np.diff(encoded[1:])
+    return _zigzag(encoded)
+
+
+def _decode_timestamps(encoded: np.ndarray) -> np.ndarray:
+    encoded = _unzigzag(encoded)
+    if len(encoded) > 2:
+        encoded[1:] = np.cumsum(encoded[1:])
+    return np.cumsum(encoded)
+
+
+def _decimals(values: np.ndarray):
+    """
+    Returns the smallest number of decimals, up to 8, the values can be
+    written with exactly, or None.
+    """
+    for decimals in range(9):
+        scaled = np.round(values * 10**decimals)
+        if np.all(np.abs(scaled) < 2**52) and np.array_equal(
+            scaled / 10**decimals, values
+        ):
+            return decimals
+    return None
+
+
+def _encode_values(values: np.ndarray) -> tuple:
+    """
+    Returns the encoding of a column and its encoded values.
+    """
+    values = values.astype("<f8")
+    decimals = _decimals(values)
+    if decimals is not None:
+        encoded = np.round(values * 10**decimals).astype("<i8")
+        encoded[1:] = np.diff(encoded)
+        return ["delta", decimals], _zigzag(encoded)
+
+    bits = values.view("<u8")
+    encoded = bits.copy()
+    encoded[1:] ^= bits[:-1]
+    return ["xor"], encoded
+
+
+def _decode_values(encoding: list, encoded: np.ndarray) -> np.ndarray:
+    if encoding[0] == "delta":
+        return np.cumsum(_unzigzag(encoded)) / 10 ** encoding[1]
+    return np.bitwise_xor.accumulate(encoded).view("<f8")
+
+
+def encode(data: pd.DataFrame, codec: str = None) -> bytes:
+    """
+    Encodes a dataframe of candles in the archive format.
+    :data: a dataframe with a datetime index, and either candle fields or a
+        symbol and candle fields as columns
+    :codec: 'zstd' or 'zlib'. Defaults to 'zstd' if zstandard is installed.
+    """
+    if codec is None:
+        codec = "zlib" if zstandard is None else "zstd"
+    symbol = None
+    if isinstance(data.columns, pd.MultiIndex):
+        symbol = data.columns[0][0]
+        data = data[symbol]
+
+    encodings, chunks = [], [_shuffle(_encode_timestamps(data.index.asi8))]
+    for column in data.columns:
+        encoding, encoded = _encode_values(data[column].to_numpy())
+        encodings.append(encoding)
+        chunks.append(_shuffle(encoded))
+
+    header = {
+        "rows": len(data),
+        "symbol": symbol,
+        "fields": [str(c) for c in data.columns],
+        "dtypes": [str(t) for t in data.dtypes],
+        "encodings": encodings,
+        "tz": None if data.index.tz is None else str(data.index.tz),
+        "index_name": data.index.name,
+        "codec": codec,
+    }
+
+    header = json.dumps(header).encode()
+    buffer = [MAGIC, struct.pack("<I", len(header)), header]
+    for chunk in chunks:
+        chunk = _compress(chunk, codec)
+        buffer += [struct.pack("<Q", len(chunk)), chunk]
+    return b"".join(buffer)
+
+
+def decode(buffer: bytes) -> pd.DataFrame:
+    """
+    Decodes a dataframe encoded with encode.
+    """
+    if buffer[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not an archive of candles")
+    offset = len(MAGIC)
+    (size,) = struct.unpack_from("<I", buffer, offset)
+    header = json.loads(buffer[offset + 4 : offset + 4 + size])
+    offset += 4 + size
+
+    columns = []
+    for _ in range(len(header["fields"]) + 1):
+        (size,) = struct.unpack_from("<Q", buffer, offset)
+        chunk = _decompress(buffer[offset + 8 : offset + 8 + size], header["codec"])
+        columns.append(_unshuffle(chunk, header["rows"]))
+        offset += 8 + size
+
+    index = pd.DatetimeIndex(
+        _decode_timestamps(columns[0]).view("datetime64[ns]"),
+        name=header["index_name"],
+    )
+    if header["tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(header["tz"])
+    data = pd.DataFrame(
+        {
+            field: _decode_values(encoding, values).astype(dtype)
+            for field, dtype, encoding, values in zip(
+                header["fields"], header["dtypes"], header["encodings"], columns[1:]
+            )
+        },
+        index=index,
+    )
+    if header["symbol"] is not None:
+        data.columns = pd.MultiIndex.from_product([[header["symbol"]], data.columns])
+    return data
+
+
+def write_archive(data: pd.DataFrame, path: str, codec: str = None) -> None:
+    with open(path, "wb") as f:
+        f.write(encode(data, codec))
+
+
+def read_archive(path: str) -> pd.DataFrame:
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+
+def export_archive(storage: BaseStorage, save_dir: str, codec: str = None) -> None:
+    """
+    Writes every series held by a storage to {save_dir}/{symbol}@{interval}.hca
+    """
+    makedirs(save_dir, exist_ok=True)
+    for (symbol, interval), data in storage.snapshot().items():
+        write_archive(
+            data,
+            join(save_dir, f"{symbol}@{interval_enum_to_string(interval)}.hca"),
+            codec,
+        )
+
+
+def import_archive(storage: BaseStorage, save_dir: str) -> None:
+    """
+    Stores the series of the archive files written by export_archive.
+    """
+    for file in listdir(save_dir):
+        file_search = re.search(r"^(.+)@([-\w]+)\.hca$", file)
+        if file_search is None or not isfile(join(save_dir, file)):
+            continue
+        symbol, interval = file_search.group(1), file_search.group(2)
+        if re.match(r"^-?\d+$", interval):
+            interval = int(interval)
+        else:
+            interval = interval_string_to_enum(interval)
+        storage.store(symbol, interval, read_archive(join(save_dir, file)))
+
+
+class ArchiveStorage(PickleStorage):
+    """
+    An extension of the pickle storage that saves snapshots in the
+    compressed archive format instead of pickle files.
+    """
+
+    ext = "hca"
+
+    def __init__(
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        wal: bool = False,
+        compact_rows: int = 1000,
+        evict_after: float = None,
+        memory_budget: int = None,
+        codec: str = None,
+    ):
+        """
+        :codec: 'zstd' or 'zlib'. Defaults to 'zstd' if zstandard is installed.
+        """
+        self.codec = codec
+        super().__init__(
+            save_dir,
+            queue_size,
+            limit_size,
+            wal,
+            compact_rows,
+            evict_after,
+            memory_budget,
+        )
+
+    def _read_snapshot(self, path: str) -> pd.DataFrame:
+        return read_archive(path)
+
+    def _write_snapshot(self, data: pd.DataFrame, path: str) -> None:
+        write_archive(data, path, self.codec)
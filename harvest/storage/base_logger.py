@@ -1,6 +1,10 @@
+import json
+import atexit
 import pandas as pd
 import datetime as dt
-from threading import Lock
+from os.path import isfile
+from queue import Queue
+from threading import Lock, Thread
 from typing import Tuple
 
 from harvest.utils import *
@@ -11,21 +15,82 @@ nor not limited to:
     - Buy/sell history
     - Portfolio value
     - Account equity
+
+Transactions are kept as one list per column, so adding a transaction is
+amortized O(1), and the dataframe is only built when it is requested. If a
+save path is given, every transaction is also appended to it as a line of
+JSON by a background thread, and the file is read back on startup.
 """
 
 
 class BaseLogger:
-    def __init__(self):
+
+    columns = ["action", "asset_type", "symbol", "timestamp", "price"]
+
+    def __init__(self, save_path: str = None):
         """
         Initialize a lock used to make this class thread safe since it is
         expected that multiple users will be reading and writing to this
         storage simultaneously.
+
+        :save_path: the path of the file transactions are appended to. If
+            the file exists, the transactions in it are loaded.
         """
         self.storage_lock = Lock()
-        self.transactions = pd.DataFrame(
-            columns=["action", "asset_type", "symbol", "timestamp", "price"]
-        )
-        # self.transactions.set_index(["timestamp"], inplace=True)
+        self.log = {column: [] for column in self.columns}
+        # The dataframe built by the last call to get_transactions, and the
+        # number of transactions it holds.
+        self.transactions = None
+        self.transactions_size = 0
+
+        self.save_path = save_path
+        if self.save_path is None:
+            return
+        if isfile(self.save_path):
+            self._read()
+        self.queue = Queue()
+        Thread(target=self._write_loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def _read(self) -> None:
+        with open(self.save_path) as f:
+            for line in f:
+                try:
+                    transaction = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash in the middle of a write
+                    debugger.warning(f"Ignoring invalid line in {self.save_path}")
+                    continue
+                transaction["timestamp"] = pd.Timestamp(transaction["timestamp"])
+                for column in self.columns:
+                    self.log[column].append(transaction[column])
+
+    def _write_loop(self) -> None:
+        with open(self.save_path, "a") as f:
+            while True:
+                transaction = self.queue.get()
+                try:
+                    f.write(json.dumps(transaction, default=self._to_json) + "\n")
+                    # Only flush once every queued transaction is written
+                    if self.queue.unfinished_tasks == 1:
+                        f.flush()
+                except Exception as e:
+                    debugger.error(f"Failed to log transaction {transaction}: {e}")
+                finally:
+                    self.queue.task_done()
+
+    def _to_json(self, value):
+        # numpy scalars, e.g. quantities computed with numpy
+        if hasattr(value, "item"):
+            return value.item()
+        return str(value)
+
+    def flush(self) -> None:
+        """
+        Blocks until every transaction has been written to the save path.
+        """
+        if self.save_path is not None:
+            self.queue.join()
 
     def add_transaction(
         self,
@@ -35,23 +100,53 @@ class BaseLogger:
         symbol: str,
         price: float,
     ):
+        transaction = {
+            "action": action,
+            "asset_type": asset_type,
+            "symbol": symbol,
+            "price": price,
+            "timestamp": timestamp,
+        }
         self.storage_lock.acquire()
-        self.transactions = self.transactions.append(
-            {
-                "action": action,
-                "asset_type": asset_type,
-                "symbol": symbol,
-                "price": price,
-                "timestamp": timestamp,
-            },
-            ignore_index=True,
-        )
+        for column in self.columns:
+            self.log[column].append(transaction[column])
+        self.storage_lock.release()
+
+        if self.save_path is not None:
+            transaction["timestamp"] = pd.Timestamp(timestamp).isoformat()
+            self.queue.put(transaction)
+
+    def restore(self, transactions: pd.DataFrame) -> None:
+        """
+        Adds the transactions of a dataframe returned by get_transactions,
+        e.g. from a checkpoint. They are not written to the save path.
+        """
+        self.storage_lock.acquire()
+        for column in self.columns:
+            self.log[column].extend(transactions[column].tolist())
         self.storage_lock.release()
 
     def get_transactions(self) -> pd.DataFrame:
-        return self.transactions
+        self.storage_lock.acquire()
+        size = len(self.log["action"])
+        if self.transactions is None or self.transactions_size != size:
+            self.transactions = pd.DataFrame(
+                {column: self.log[column][:size] for column in self.columns},
+                columns=self.columns,
+            )
+            self.transactions_size = size
+        transactions = self.transactions
+        self.storage_lock.release()
+        return transactions
 
     def get_last_transaction(self):
-        if self.transactions.empty:
-            return None
-        return self.transactions.iloc[-1]
+        self.storage_lock.acquire()
+        size = len(self.log["action"])
+        last = None
+        if size > 0:
+            last = pd.Series(
+                {column: self.log[column][-1] for column in self.columns},
+                name=size - 1,
+            )
+        self.storage_lock.release()
+        return last
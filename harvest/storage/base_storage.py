@@ -1,8 +1,11 @@
 from numpy import ERR_CALL
 import pandas as pd
 import datetime as dt
-from threading import Lock
-from typing import Tuple
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from threading import Condition, Lock, RLock
+from typing import List, Tuple
 import re
 
 from harvest.utils import *
@@ -18,21 +21,284 @@ the following day.
 """
 
 
+class RWLock:
+    """
+    A lock that can be held by many readers at once or by a single writer.
+    Waiting writers keep new readers out so that they are not starved.
+    """
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
 class BaseStorage:
     """
     A basic storage that is thread safe and stores data in memory.
     """
 
-    def __init__(self, queue_size: int = 200, limit_size: bool = True):
+    def __init__(
+        self,
+        queue_size: int = 200,
+        limit_size: bool = True,
+        evict_after=None,
+        memory_budget: int = None,
+    ):
         """
-        Initialize a lock used to make this class thread safe since it is
+        Initialize the locks used to make this class thread safe since it is
         expected that multiple users will be reading and writing to this
-        storage simultaneously.
+        storage simultaneously. Each symbol and interval has its own
+        reader/writer lock so that different series can be read and written
+        in parallel, while storage_lock only guards adding new series.
+
+        :evict_after: if set, series of the catalog that have not been
+            accessed for this many seconds are dropped from memory and read
+            again on their next access
+        :memory_budget: if set, the number of bytes the series held in memory
+            can use. Once it is exceeded, the least recently used series are
+            evicted, see _evict.
         """
         self.storage_lock = Lock()
+        self.series_locks = {}
         self.storage = {}
         self.queue_size = int(queue_size)
         self.limit_size = limit_size
+        # CandleAggregators keyed by (symbol, base interval, target interval)
+        self.aggregators = {}
+
+        # Series saved by a subclass that are only read with _read_series
+        # the first time they are accessed, see _access. The intervals are
+        # indexed by symbol so that the series of a symbol are found without
+        # scanning the whole catalog.
+        self.catalog = {}
+        self.catalog_lock = RLock()
+        self.persisted = set()
+        self.loading = set()
+        self.last_access = {}
+        self.evict_after = evict_after
+        self.last_eviction = time.monotonic()
+
+        # Number of times each series has changed, see version, and the
+        # local time indexes built by load_local keyed by series and timezone
+        self.versions = {}
+        self.local_indexes = {}
+
+        # Size in bytes of the series held in memory, from least to most
+        # recently used, and their total
+        self.memory_budget = memory_budget
+        self.lru = OrderedDict()
+        self.lru_lock = Lock()
+        self.memory_used = 0
+        self.evictions = 0
+
+    def _read_series(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads a series of the catalog. Must be implemented by subclasses that
+        add series to the catalog.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support reading series from a catalog"
+        )
+
+    def _catalog_series(self, symbol: str, interval: Interval) -> None:
+        """
+        Adds a saved series to the catalog so that it is read on first access.
+        """
+        with self.catalog_lock:
+            self._add_to_catalog(symbol, interval)
+            self.persisted.add((symbol, interval))
+
+    def _add_to_catalog(self, symbol: str, interval: Interval) -> None:
+        """
+        Adds a series to the catalog. Must be called while holding catalog_lock.
+        """
+        self.catalog.setdefault(symbol, set()).add(interval)
+
+    def _in_catalog(self, symbol: str, interval: Interval) -> bool:
+        """
+        Returns True if the series is in the catalog, in constant time.
+        """
+        return interval in self.catalog.get(symbol, ())
+
+    def _remove_from_catalog(self, symbol: str, interval: Interval) -> None:
+        """
+        Removes a series from the catalog. Must be called while holding
+        catalog_lock.
+        """
+        intervals = self.catalog.get(symbol)
+        if intervals is None:
+            return
+        intervals.discard(interval)
+        if not intervals:
+            del self.catalog[symbol]
+
+    def _access(self, symbol: str, interval: Interval = None) -> None:
+        """
+        Called before a series is read or written. Reads the series from the
+        catalog if it has not been read yet, records when it was accessed and
+        evicts the series that have been idle for too long.
+        """
+        if symbol in self.catalog:
+            if interval is not None:
+                keys = (
+                    [(symbol, interval)] if self._in_catalog(symbol, interval) else []
+                )
+            else:
+                with self.catalog_lock:
+                    keys = [(symbol, i) for i in self.catalog.get(symbol, ())]
+            for key in keys:
+                with self.catalog_lock:
+                    # The series is removed from the catalog only once it is
+                    # stored, so other threads wait here until it is ready.
+                    if not self._in_catalog(*key) or key in self.loading:
+                        continue
+                    self.loading.add(key)
+                    try:
+                        data = self._read_series(*key)
+                        BaseStorage.store(self, key[0], key[1], data)
+                        self._remove_from_catalog(*key)
+                    finally:
+                        self.loading.discard(key)
+
+        if interval is not None and (symbol, interval) in self.lru:
+            with self.lru_lock:
+                if (symbol, interval) in self.lru:
+                    self.lru.move_to_end((symbol, interval))
+
+        if self.evict_after is None:
+            return
+        now = time.monotonic()
+        if interval is not None:
+            self.last_access[(symbol, interval)] = now
+        if now - self.last_eviction > self.evict_after:
+            self.last_eviction = now
+            self.evict_idle(self.evict_after)
+
+    def evict_idle(self, max_idle: float) -> None:
+        """
+        Drops the persisted series that have not been accessed for max_idle
+        seconds from memory. They are added back to the catalog, so they
+        are read again on their next access.
+        """
+        now = time.monotonic()
+        for key, accessed in list(self.last_access.items()):
+            if now - accessed <= max_idle or key not in self.persisted:
+                continue
+            self._evict(key)
+            debugger.debug(f"Evicted idle series {key[0]} {key[1]}")
+
+    def _series_bytes(self, symbol: str, interval: Interval) -> int:
+        """
+        Returns the number of bytes a series uses in memory.
+        """
+        data = self.storage.get(symbol, {}).get(interval)
+        return 0 if data is None else int(data.memory_usage(index=True).sum())
+
+    def _touch(self, key: Tuple[str, Interval], resize: bool = False) -> None:
+        """
+        Marks a series as the most recently used one, updating its size if
+        resize is True, and evicts the least recently used series while the
+        memory budget is exceeded.
+        """
+        evicted = []
+        with self.lru_lock:
+            if resize or key not in self.lru:
+                size = self._series_bytes(*key)
+                self.memory_used += size - self.lru.get(key, 0)
+                self.lru[key] = size
+            self.lru.move_to_end(key)
+            if self.memory_budget is not None:
+                while self.memory_used > self.memory_budget and len(self.lru) > 1:
+                    evict, size = self.lru.popitem(last=False)
+                    self.memory_used -= size
+                    evicted.append(evict)
+        for evict in evicted:
+            self._evict(evict)
+
+    def _drop(self, key: Tuple[str, Interval]) -> None:
+        """
+        Drops a series from memory.
+        """
+        with self._series_lock(*key).write():
+            self.storage_lock.acquire()
+            self.storage.get(key[0], {}).pop(key[1], None)
+            if key[0] in self.storage and not self.storage[key[0]]:
+                del self.storage[key[0]]
+            self.storage_lock.release()
+            self._changed(*key)
+        with self.lru_lock:
+            self.memory_used -= self.lru.pop(key, 0)
+        self.last_access.pop(key, None)
+        self._reset_aggregators(*key)
+
+    def _demote(self, symbol: str, interval: Interval) -> bool:
+        """
+        Called before a series is evicted. Returns True if the series can be
+        read again with _read_series after it is dropped from memory.
+        Subclasses can override it to save the series first.
+        """
+        return (symbol, interval) in self.persisted
+
+    def _evict(self, key: Tuple[str, Interval]) -> None:
+        """
+        Drops a series from memory. If it is demoted, it is added back to the
+        catalog so that it is read again on its next access. Otherwise its
+        data is lost.
+        """
+        demoted = self._demote(*key)
+        self._drop(key)
+        self.evictions += 1
+        if demoted:
+            with self.catalog_lock:
+                self._add_to_catalog(*key)
+        else:
+            debugger.warning(
+                f"Evicted {key[0]} {key[1]}, its data is lost since it is not persisted"
+            )
+
+    def memory_info(self) -> dict:
+        """
+        Returns the memory budget, the number of bytes held in memory in total
+        and by each series, and the number of evicted series.
+        """
+        with self.lru_lock:
+            return {
+                "budget": self.memory_budget,
+                "bytes": self.memory_used,
+                "series": dict(self.lru),
+                "evictions": self.evictions,
+            }
 
     def store(
         self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True
@@ -51,45 +317,61 @@ class BaseStorage:
             # cause the data_range function to error.
             return None
 
-        # Removes the seconds and milliseconds
-        # data.index = normalize_pandas_dt_index(data)
-
-        self.storage_lock.acquire()
-
-        if symbol in self.storage:
-            # Handles if we already have data
-            intervals = self.storage[symbol]
-            if interval in intervals:
+        self._access(symbol, interval)
+        with self._series_lock(symbol, interval).write():
+            current = self.storage.get(symbol, {}).get(interval)
+            if current is None:
+                if self.limit_size:
+                    data = data[-self.queue_size :]
+                if len(data) < self.queue_size:
+                    debugger.warning(
+                        f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points"
+                    )
+                # Just add the data into storage
+                self.storage_lock.acquire()
+                self.storage.setdefault(symbol, {})[interval] = data
+                self.storage_lock.release()
+            else:
                 try:
                     # Handles if we have stock data for the given interval
-                    intervals[interval] = self._append(
-                        intervals[interval], data, remove_duplicate=remove_duplicate
+                    data = self._append(
+                        current, data, remove_duplicate=remove_duplicate
                     )
-                    if self.limit_size:
-                        intervals[interval] = intervals[interval][-self.queue_size :]
                 except:
                     raise Exception("Append Failure, case not found!")
-            else:
-                # Add the data as a new interval
-                intervals[interval] = data
-        else:
-            if self.limit_size:
-                data = data[-self.queue_size :]
-            if len(data) < self.queue_size:
-                debugger.warning(
-                    f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points"
-                )
-            # Just add the data into storage
-            self.storage[symbol] = {interval: data}
-
-        cur_len = len(self.storage[symbol][interval])
-        if self.limit_size and cur_len > self.queue_size:
-            # If we have more than N data points, remove the oldest data
-            self.storage[symbol][interval] = self.storage[symbol][interval].iloc[
-                -self.queue_size :
-            ]
+                if self.limit_size:
+                    # If we have more than N data points, remove the oldest data
+                    data = data.iloc[-self.queue_size :]
+                self.storage[symbol][interval] = data
+            self._changed(symbol, interval)
+        self._touch((symbol, interval), resize=True)
 
-        self.storage_lock.release()
+    def _changed(self, symbol: str, interval: Interval) -> None:
+        """
+        Increments the version of a series. Must be called while holding the
+        write lock of the series whenever its data is replaced.
+        """
+        key = (symbol, interval)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def version(self, symbol: str, interval: Interval) -> int:
+        """
+        Returns a number that changes every time the data of the series
+        changes, so that values computed from the data can be cached.
+        """
+        return self.versions.get((symbol, interval), 0)
+
+    def _series_lock(self, symbol: str, interval: Interval) -> RWLock:
+        """
+        Returns the reader/writer lock of the given series, creating it if needed.
+        """
+        key = (symbol, interval)
+        lock = self.series_locks.get(key)
+        if lock is None:
+            self.storage_lock.acquire()
+            lock = self.series_locks.setdefault(key, RWLock())
+            self.storage_lock.release()
+        return lock
 
     def aggregate(
         self,
@@ -100,26 +382,40 @@ class BaseStorage:
     ):
         """
         Aggregates the stock data from the interval specified in 'from' to 'to'.
-
+        Only the base candles stored since the last call are aggregated, see
+        CandleAggregator.
         """
+        key = (symbol, base, target)
         self.storage_lock.acquire()
-        data = self.storage[symbol][base]
-        self.storage[symbol][target] = self._append(
-            self.storage[symbol][target], aggregate_df(data, target), remove_duplicate
-        )
-        cur_len = len(self.storage[symbol][target])
-        if self.limit_size and cur_len > self.queue_size:
-            self.storage[symbol][target] = self.storage[symbol][target].iloc[
-                -self.queue_size :
-            ]
+        if key not in self.aggregators:
+            self.aggregators[key] = (CandleAggregator(target), Lock())
+        aggregator, lock = self.aggregators[key]
         self.storage_lock.release()
 
+        with lock:
+            data = self.load(symbol, base, start=aggregator.last)
+            self.store(symbol, target, aggregator.update(data), remove_duplicate)
+
     def reset(self, symbol: str, interval: Interval):
         """
         Resets to an empty dataframe
         """
+        self._access(symbol, interval)
+        with self._series_lock(symbol, interval).write():
+            self.storage[symbol][interval] = pd.DataFrame()
+            self._changed(symbol, interval)
+        self._touch((symbol, interval), resize=True)
+        self._reset_aggregators(symbol, interval)
+
+    def _reset_aggregators(self, symbol: str, interval: Interval):
+        """
+        Drops the aggregators reading from or writing to the given series
+        since their state no longer matches the stored data.
+        """
         self.storage_lock.acquire()
-        self.storage[symbol][interval] = pd.DataFrame()
+        for key in list(self.aggregators):
+            if key[0] == symbol and interval in key[1:]:
+                del self.aggregators[key]
         self.storage_lock.release()
 
     def load(
@@ -142,20 +438,16 @@ class BaseStorage:
              1 minute
         :start: a datetime object
         """
-        self.storage_lock.acquire()
-
+        self._access(symbol, interval)
         if symbol not in self.storage:
-            self.storage_lock.release()
             return None
 
-        self.storage_lock.release()
-
         if interval is None:
             # If the interval is not given, return the data with the
             # smallest interval that has data in the range.
             intervals = [
                 (interval, interval_to_timedelta(interval))
-                for interval in self.storage[symbol]
+                for interval in list(self.storage[symbol])
             ]
             intervals.sort(key=lambda interval_timedelta: interval_timedelta[1])
             for interval_timedelta in intervals:
@@ -185,18 +477,215 @@ class BaseStorage:
         # else:
         #     data = self.storage[symbol][interval]
         # self.storage_lock.release()
-        data = self.storage[symbol][interval]
-        if no_slice:
+        # Stored dataframes are replaced rather than modified in place, so
+        # the one read under the lock is a consistent snapshot.
+        with self._series_lock(symbol, interval).read():
+            data = self.storage[symbol].get(interval)
+        if data is None:
+            return None
+        if no_slice or data.empty:
             return data
 
-        # If the start and end are not defined, then set them to the
-        # beginning and end of the data.
-        if start is None:
-            start = data.index[0]
-        if end is None:
-            end = data.index[-1]
+        first, last = self._range(data, start, end)
+        return data.iloc[first:last]
+
+    def _epoch(self, timestamp: dt.datetime, tz=None) -> int:
+        """
+        Converts a datetime to int64 nanoseconds comparable to the values of
+        the asi8 of an index with the timezone tz.
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if tz is None:
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.tz_convert(None)
+        elif timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize(tz)
+        return timestamp.value
+
+    def _range(
+        self, data: pd.DataFrame, start: dt.datetime = None, end: dt.datetime = None
+    ) -> Tuple[int, int]:
+        """
+        Returns the positions of the first and one past the last rows of data
+        between start and end, inclusive, found by binary search on the int64
+        timestamps of the index.
+        """
+        epochs = data.index.asi8
+        tz = data.index.tz
+        first = 0 if start is None else epochs.searchsorted(self._epoch(start, tz))
+        last = (
+            len(epochs)
+            if end is None
+            else epochs.searchsorted(self._epoch(end, tz), "right")
+        )
+        return first, max(first, last)
+
+    def load_last(self, symbol: str, interval: Interval, n: int) -> pd.DataFrame:
+        """
+        Loads the latest n data points of the given symbol and interval.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :n: the number of data points
+        """
+        self._access(symbol, interval)
+        with self._series_lock(symbol, interval).read():
+            data = self.storage.get(symbol, {}).get(interval)
+        if data is None or data.empty:
+            return None
+        return data.iloc[-n:]
+
+    def load_asof(
+        self, symbol: str, interval: Interval, timestamp: dt.datetime
+    ) -> pd.DataFrame:
+        """
+        Loads the latest data point at or before the given datetime, as a
+        dataframe with a single row, or None if there is none.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :timestamp: a datetime object
+        """
+        self._access(symbol, interval)
+        with self._series_lock(symbol, interval).read():
+            data = self.storage.get(symbol, {}).get(interval)
+        if data is None or data.empty:
+            return None
+        _, last = self._range(data, None, timestamp)
+        if last == 0:
+            return None
+        return data.iloc[last - 1 : last]
+
+    def load_array(
+        self, symbol: str, interval: Interval, field: str = "close", n: int = None
+    ) -> np.ndarray:
+        """
+        Returns the values of a field as a read-only array. Since stored
+        dataframes are replaced rather than modified, the array is a view
+        of the stored data and not a copy.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :field: 'open', 'high', 'low', 'close' or 'volume'
+        :n: if given, only the latest n values are returned
+        """
+        data = (
+            self.load(symbol, interval)
+            if n is None
+            else self.load_last(symbol, interval, n)
+        )
+        if data is None or data.empty:
+            return np.empty(0)
+        values = data[(symbol, field)].to_numpy().view()
+        values.flags.writeable = False
+        return values
+
+    def load_local(
+        self, symbol: str, interval: Interval, timezone, n: int = None
+    ) -> pd.DataFrame:
+        """
+        Loads the data of a symbol with its timestamps converted to local
+        time, represented as timezone naive datetimes. The converted index
+        of the whole series is cached until the series changes, so it is
+        only built once per new data point.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :timezone: the local timezone
+        :n: if given, only the latest n data points are loaded and converted
+        """
+        if n is not None:
+            data = self.load_last(symbol, interval, n)
+            if data is None or data.empty:
+                return data if data is None else data[symbol]
+            return pandas_timestamp_to_local(data[symbol], timezone)
+
+        # Versions are incremented while holding the write lock, so if the
+        # version did not change during the load, the data matches it.
+        version = self.version(symbol, interval)
+        data = self.load(symbol, interval)
+        if data is None or data.empty:
+            return data if data is None else data[symbol]
+
+        key = (symbol, interval, timezone)
+        cached = self.local_indexes.get(key)
+        if cached is not None and cached[0] == version and len(cached[1]) == len(data):
+            index = cached[1]
+        else:
+            index = index_utc_to_local(data.index, timezone)
+            if version == self.version(symbol, interval):
+                self.local_indexes[key] = (version, index)
+
+        data = data[symbol]
+        data.index = index
+        return data
+
+    def load_panel(
+        self,
+        symbols: List[str],
+        interval: Interval,
+        fields: List[str] = None,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        fill: str = None,
+        as_frame: bool = False,
+    ):
+        """
+        Loads the data of several symbols aligned on the union of their
+        timestamps.
+        :symbols: a list of stocks or cryptos
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :fields: the fields to load. Defaults to open, high, low, close and volume.
+        :start: a datetime object
+        :fill: if 'ffill', missing data points are filled with the last
+            known value of the symbol. Otherwise they are left as NaN.
+        :as_frame: if True, returns a dataframe with the symbols and fields
+            as columns instead of an array
+        :returns: the index of the timestamps and an array of shape
+            (symbols, timestamps, fields), or a dataframe if as_frame is True
+        """
+        if fields is None:
+            fields = ["open", "high", "low", "close", "volume"]
+
+        epochs, arrays, tz = [], [], None
+        for symbol in symbols:
+            data = self.load(symbol, interval, start, end)
+            if data is None or data.empty:
+                epochs.append(np.empty(0, dtype=np.int64))
+                arrays.append(np.empty((0, len(fields))))
+                continue
+            if tz is None:
+                tz = data.index.tz
+            # asi8 of a timezone aware index is in UTC, so symbols with
+            # different timezones are aligned correctly.
+            epochs.append(data.index.asi8)
+            arrays.append(data[symbol].reindex(columns=fields).to_numpy(np.float64))
+
+        # An empty panel is returned if no symbols are given or none has data
+        union = np.unique(np.concatenate([np.empty(0, dtype=np.int64)] + epochs))
+        values = np.full((len(symbols), len(union), len(fields)), np.nan)
+        for i, (epoch, array) in enumerate(zip(epochs, arrays)):
+            values[i, union.searchsorted(epoch)] = array
 
-        return data.loc[start:end]
+        if fill == "ffill" and len(union):
+            # Position of the last known value of each symbol and field
+            positions = np.where(
+                np.isnan(values), 0, np.arange(len(union))[None, :, None]
+            )
+            np.maximum.accumulate(positions, axis=1, out=positions)
+            values = np.take_along_axis(values, positions, axis=1)
+
+        index = pd.DatetimeIndex(union.view("datetime64[ns]"), name="timestamp")
+        if tz is not None:
+            index = index.tz_localize("UTC").tz_convert(tz)
+        if not as_frame:
+            return index, values
+        return pd.DataFrame(
+            values.transpose(1, 0, 2).reshape(len(union), len(symbols) * len(fields)),
+            index=index,
+            columns=pd.MultiIndex.from_product([symbols, fields]),
+        )
 
     def data_range(self, symbol: str, interval: Interval) -> Tuple[dt.datetime]:
         """
@@ -206,10 +695,36 @@ class BaseStorage:
              1 minute
         """
         data = self.load(symbol, interval)
-        if data is None:
+        if data is None or data.empty:
             return None, None
         return data.index[0], data.index[-1]
 
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the data held in memory, keyed by symbol and
+        interval, that can be given to restore.
+        """
+        self.storage_lock.acquire()
+        keys = [(s, i) for s in self.storage for i in self.storage[s]]
+        self.storage_lock.release()
+
+        windows = {}
+        for symbol, interval in keys:
+            data = self.load(symbol, interval)
+            if data is None or data.empty:
+                continue
+            if self.limit_size:
+                data = data.iloc[-self.queue_size :]
+            windows[(symbol, interval)] = data.copy()
+        return windows
+
+    def restore(self, windows: dict) -> None:
+        """
+        Stores the data of a snapshot.
+        """
+        for (symbol, interval), data in windows.items():
+            self.store(symbol, interval, data)
+
     def _append(
         self,
         current_data: pd.DataFrame,
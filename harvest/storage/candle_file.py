@@ -0,0 +1,142 @@
+import os
+from bisect import bisect_left, bisect_right
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from harvest.utils import *
+
+"""
+This module implements a binary file format for candles that is read with
+np.memmap. A file holds a 16 byte header followed by fixed-width records of
+a timestamp and the OHLCV fields, sorted by timestamp. Since the file is
+mapped rather than read, opening it is instant, only the pages that are
+accessed are loaded, and processes reading the same file share the OS
+page cache.
+"""
+
+
+class CandleFile:
+    """
+    A file of fixed-width candle records read through np.memmap.
+    """
+
+    magic = b"HRVCNDL1"
+    header_size = 16
+    fields = ["open", "high", "low", "close", "volume"]
+    dtype = np.dtype([("timestamp", "<i8")] + [(field, "<f8") for field in fields])
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def records(self) -> np.ndarray:
+        """
+        Returns the records of the file as a read-only memory map, or an
+        empty array if the file does not exist.
+        """
+        if not self.exists() or os.path.getsize(self.path) <= self.header_size:
+            return np.empty(0, dtype=self.dtype)
+        with open(self.path, "rb") as f:
+            if f.read(len(self.magic)) != self.magic:
+                raise ValueError(f"{self.path} is not a candle file")
+        return np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.header_size)
+
+    def _to_records(self, df: pd.DataFrame) -> np.ndarray:
+        if isinstance(df.columns, pd.MultiIndex):
+            df = df[df.columns[0][0]]
+        index = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+        records = np.empty(len(df), dtype=self.dtype)
+        records["timestamp"] = index.tz_convert("UTC").asi8
+        for field in self.fields:
+            records[field] = df[field].to_numpy(dtype=np.float64)
+        return records
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        Replaces the content of the file with the candles of df. The new file
+        is moved into place so that processes that already mapped the old
+        one keep a consistent view.
+        """
+        records = self._to_records(df)
+        order = np.argsort(records["timestamp"], kind="mergesort")
+        records = records[order]
+        keep = np.append(records["timestamp"][1:] != records["timestamp"][:-1], True)
+        records = records[keep]
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.magic.ljust(self.header_size, b"\0"))
+            f.write(records.tobytes())
+        os.replace(tmp, self.path)
+
+    def append(self, df: pd.DataFrame) -> None:
+        """
+        Appends the candles of df to the file. If all of them are newer than
+        the last candle of the file, only the new records are written.
+        Otherwise the file is rewritten with the merged candles.
+        """
+        records = self._to_records(df)
+        if len(records) == 0:
+            return
+        current = self.records()
+        if len(current) == 0:
+            self.write(df)
+            return
+
+        last = current["timestamp"][-1]
+        new = np.sort(records["timestamp"])
+        if new[0] > last and np.all(new[1:] > new[:-1]):
+            with open(self.path, "ab") as f:
+                f.write(np.sort(records, order="timestamp").tobytes())
+            return
+
+        merged = np.concatenate([np.asarray(current), records])
+        del current
+        index = pd.to_datetime(merged["timestamp"], utc=True)
+        self.write(pd.DataFrame({f: merged[f] for f in self.fields}, index=index))
+
+    def range(self, records: np.ndarray, start=None, end=None):
+        """
+        Returns the positions of the first and one past the last record
+        between start and end, inclusive. The search only touches the
+        pages visited by the binary search.
+        """
+        # np.searchsorted would first copy the strided timestamp column,
+        # reading every page of the file, so bisect is used instead.
+        timestamps = records["timestamp"]
+        lo = 0 if start is None else bisect_left(timestamps, self._epoch(start))
+        hi = (
+            len(timestamps)
+            if end is None
+            else bisect_right(timestamps, self._epoch(end))
+        )
+        return lo, max(lo, hi)
+
+    def _epoch(self, timestamp: dt.datetime) -> int:
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize("UTC")
+        return timestamp.value
+
+    def read(
+        self, symbol: str, start: dt.datetime = None, end: dt.datetime = None
+    ) -> pd.DataFrame:
+        """
+        Reads the candles between start and end into a dataframe with the
+        same format as the one returned by BaseStorage. Only the records
+        in the range are copied out of the memory map.
+        """
+        records = self.records()
+        lo, hi = self.range(records, start, end)
+        records = records[lo:hi]
+        index = pd.DatetimeIndex(
+            np.array(records["timestamp"]).view("datetime64[ns]"), name="timestamp"
+        ).tz_localize("UTC")
+        df = pd.DataFrame(
+            {field: np.array(records[field]) for field in self.fields}, index=index
+        )
+        df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+        return df
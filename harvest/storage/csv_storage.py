@@ -19,11 +19,22 @@ class CSVStorage(BaseStorage):
     An extension of the basic storage that saves data in csv files.
     """
 
-    def __init__(self, save_dir: str = "data"):
-        super().__init__()
+    def __init__(
+        self,
+        save_dir: str = "data",
+        evict_after: float = None,
+        memory_budget: int = None,
+    ):
+        super().__init__(evict_after=evict_after, memory_budget=memory_budget)
         """
-        Adds a directory to save data to. Loads any data that is currently in the
-        directory.
+        Adds a directory to save data to. The series currently in the
+        directory are added to the catalog and only read the first time
+        they are accessed.
+
+        :evict_after: the number of seconds a series can go unaccessed before
+            it is dropped from memory
+        :memory_budget: the number of bytes the series held in memory can
+            use before the least recently used ones are dropped from memory
         """
         self.save_dir = save_dir
 
@@ -35,12 +46,23 @@ class CSVStorage(BaseStorage):
         for file in files:
             debugger.debug(file)
             file_search = re.search("^([\w]+)@([\w]+).csv$", file)
+            if file_search is None:
+                continue
             symbol, interval = file_search.group(1), file_search.group(2)
             interval = interval_string_to_enum(interval)
-            data = pd.read_csv(join(self.save_dir, file), index_col=0, parse_dates=True)
-            data.index = pd.to_datetime(data.index, unit="s")
-            data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
-            super().store(symbol, interval, data)
+            self._catalog_series(symbol, interval)
+
+    def _path(self, symbol: str, interval: Interval) -> str:
+        return join(self.save_dir, f"{symbol}@{interval_enum_to_string(interval)}.csv")
+
+    def _read_series(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads a series from its csv file.
+        """
+        data = pd.read_csv(self._path(symbol, interval), index_col=0, parse_dates=True)
+        data.index = pd.to_datetime(data.index, unit="s")
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
 
     def store(
         self,
@@ -60,8 +82,10 @@ class CSVStorage(BaseStorage):
         super().store(symbol, interval, data, remove_duplicate)
 
         if not data.empty:
-            self.storage_lock.acquire()
-            self.storage[symbol][interval][symbol].to_csv(
-                self.save_dir + f"/{symbol}@{interval_enum_to_string(interval)}.csv"
-            )
-            self.storage_lock.release()
+            # Hold the series' write lock so that concurrent stores to the
+            # same series do not write the file at the same time.
+            with self._series_lock(symbol, interval).write():
+                self.persisted.add((symbol, interval))
+                self.storage[symbol][interval][symbol].to_csv(
+                    self._path(symbol, interval)
+                )
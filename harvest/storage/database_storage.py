@@ -1,10 +1,15 @@
+import io
 import re
+import time
+import atexit
+import threading
 import pandas as pd
 import datetime as dt
 from typing import Tuple
 
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, func, select, text
 from sqlalchemy import Column, Integer, String, DateTime, Float, String
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from harvest.storage import BaseStorage
@@ -40,16 +45,109 @@ class Asset(Base):
 class DBStorage(BaseStorage):
     """
     An extension of the basic storage that saves data in SQL tables.
+
+    The latest window of each series is kept in memory like in BaseStorage,
+    and reads are served from it when it covers them. The cache assumes this
+    storage is the only writer of its series.
     """
 
-    def __init__(self, db: str = "sqlite:///data.db"):
+    key_columns = ["symbol", "interval", "timestamp"]
+    value_columns = ["open", "close", "high", "low", "volume"]
+
+    def __init__(
+        self,
+        db: str = "sqlite:///data.db",
+        batch_size: int = 10000,
+        copy_threshold: int = 50000,
+        queue_size: int = 200,
+        limit_size: bool = True,
+        memory_budget: int = None,
+        write_behind: bool = False,
+        flush_interval: float = 1.0,
+    ):
         """
         Adds a directory to save data to. Loads any data that is currently in the
         directory.
+
+        :batch_size: the number of rows sent to the database per statement
+        :copy_threshold: the number of rows from which stores to PostgreSQL
+            use COPY instead of INSERT
+        :memory_budget: the number of bytes the cached windows can use. Once
+            it is exceeded, the least recently used series are evicted.
+        :write_behind: if True, stores only update the cache and the rows are
+            written to the database by a background thread every
+            flush_interval seconds
+        """
+        super().__init__(queue_size, limit_size, memory_budget=memory_budget)
+        self.engine = create_engine(db)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(self.engine)
+        self.batch_size = batch_size
+        self.copy_threshold = copy_threshold
+
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        # Timestamp of the first row in the database of each cached series,
+        # or None if the series has no rows
+        self.first = {}
+        self.hits = 0
+        self.misses = 0
+        # Rows stored in write-behind mode that are not written yet
+        self.pending = []
+        self.cache_lock = threading.Lock()
+        self.fill_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        # Set to stop the thread writing the rows in write-behind mode
+        self.closed = threading.Event()
+        self.flush_thread = None
+        if self.write_behind:
+            atexit.register(self.flush)
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
+
+    def _rows(self, symbol: str, interval: str, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converts a dataframe of candles into the rows of the asset table.
+        """
+        df = data[symbol] if isinstance(data.columns, pd.MultiIndex) else data
+        index = normalize_pandas_dt_index(df)
+        # The timestamp column does not hold a timezone, so timestamps are
+        # saved in UTC.
+        if index.tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        rows = pd.DataFrame(
+            {
+                "symbol": symbol,
+                "interval": interval,
+                "timestamp": index,
+                **{c: df[c].to_numpy() for c in self.value_columns},
+            }
+        )
+        return rows
+
+    def _frame(self, symbol: str, rows: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converts rows of the asset table into a dataframe of candles.
         """
-        engine = create_engine(db)
-        Base.metadata.create_all(engine)
-        self.Session = sessionmaker(engine)
+        data = rows.set_index("timestamp")[self.value_columns]
+        data.index = data.index.tz_localize("UTC")
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
+
+    def _upsert(self, dialect: str):
+        """
+        Returns an INSERT statement that updates the row on a conflicting
+        key, or None if the dialect does not support one.
+        """
+        dialects = {"sqlite": sqlite, "postgresql": postgresql}
+        if dialect not in dialects:
+            return None
+        stmt = dialects[dialect].insert(Asset.__table__)
+        return stmt.on_conflict_do_update(
+            index_elements=self.key_columns,
+            set_={c: stmt.excluded[c] for c in self.value_columns},
+        )
 
     def store(
         self,
@@ -59,7 +157,8 @@ class DBStorage(BaseStorage):
         remove_duplicate: bool = True,
     ) -> None:
         """
-        Stores the stock data in the storage dictionary in SQL tables.
+        Stores the stock data in the storage dictionary in SQL tables. The rows
+        are upserted in batches within a single transaction.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be atleast
              1 minute
@@ -67,44 +166,274 @@ class DBStorage(BaseStorage):
             index
         """
 
-        if not data.empty:
-            data.index = normalize_pandas_dt_index(data)
-            data.columns = [column[1] for column in data.columns]
-            data.rename(columns={"open": "open_"}, inplace=True)
-            data["timestamp"] = data.index
-            data["symbol"] = symbol
-            data["interval"] = interval
-            data = data.to_dict("records")
+        if data.empty:
+            return
 
+        key = (symbol, interval)
+        rows = self._rows(symbol, interval, data)
+        self._cache(symbol, interval)
+        super().store(symbol, interval, self._frame(symbol, rows), remove_duplicate)
+        with self.cache_lock:
+            first = pd.Timestamp(rows["timestamp"].min(), tz="UTC")
+            if self.first.get(key) is None or first < self.first[key]:
+                self.first[key] = first
+
+        if self.write_behind:
+            with self.cache_lock:
+                self.pending.append(rows)
+        else:
+            self._write(rows)
+
+    def _write(self, rows: pd.DataFrame) -> None:
+        """
+        Upserts rows into the asset table.
+        """
+        # The same row can not be upserted twice in one statement
+        rows = rows[~rows.duplicated(self.key_columns, keep="last")]
+        dialect = self.engine.dialect.name
+
+        if dialect == "postgresql" and len(rows) >= self.copy_threshold:
+            with self.engine.begin() as connection:
+                self._copy(connection, rows)
+            return
+
+        stmt = self._upsert(dialect)
+        if stmt is None:
             with self.Session.begin() as session:
-                [session.merge(Asset(**d)) for d in data]
-                session.commit()
+                for d in rows.rename(columns={"open": "open_"}).to_dict("records"):
+                    session.merge(Asset(**d))
+            return
 
-    def aggregate(
-        self, symbol: str, base: str, target: str, remove_duplicate: bool = True
-    ):
+        records = rows.to_dict("records")
+        with self.engine.begin() as connection:
+            for i in range(0, len(records), self.batch_size):
+                connection.execute(stmt, records[i : i + self.batch_size])
+
+    def _copy(self, connection, rows: pd.DataFrame) -> None:
         """
-        Aggregates the stock data from the interval specified in 'from' to 'to'.
+        Streams rows into a temporary staging table with COPY and upserts
+        them into the asset table with a single statement.
         """
+        columns = ", ".join(f'"{c}"' for c in rows.columns)
+        connection.execute(
+            text(
+                "CREATE TEMPORARY TABLE asset_staging "
+                "(LIKE asset INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+        buffer = self._copy_buffer(rows)
+
+        sql = f"COPY asset_staging ({columns}) FROM STDIN WITH (FORMAT csv)"
+        cursor = connection.connection.cursor()
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            cursor.copy_expert(sql, buffer)
+        elif hasattr(cursor, "copy"):
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            # pg8000
+            cursor.execute(sql, stream=buffer)
 
-        data = self.load(symbol, base)
-        agg_data = self._append(
-            self.load(symbol, target), aggregate_df(data, target), remove_duplicate
+        updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in self.value_columns)
+        connection.execute(
+            text(
+                f"INSERT INTO asset ({columns}) SELECT {columns} FROM asset_staging "
+                f'ON CONFLICT ("symbol", "interval", "timestamp") DO UPDATE SET {updates}'
+            )
         )
-        self.store(symbol, target, agg_data)
+
+    def _copy_buffer(self, rows: pd.DataFrame) -> io.StringIO:
+        """
+        Writes rows as CSV for COPY. Values are written as they are bound by
+        the upsert statements, so that both key a series the same way:
+        intervals by their integer value rather than the name of the enum,
+        and timestamps in ISO format.
+        """
+        rows = rows.assign(
+            interval=rows["interval"].map(
+                lambda interval: (
+                    int(interval) if isinstance(interval, int) else interval
+                )
+            ),
+            timestamp=rows["timestamp"].map(lambda timestamp: timestamp.isoformat()),
+        )
+        buffer = io.StringIO()
+        rows.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        return buffer
+
+    def flush(self) -> None:
+        """
+        Writes the rows stored in write-behind mode to the database.
+        """
+        with self.flush_lock:
+            with self.cache_lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                self._write(pd.concat(pending))
+            except Exception:
+                with self.cache_lock:
+                    self.pending = pending + self.pending
+                raise
+
+    def _flush_loop(self) -> None:
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                debugger.error(f"Failed to write rows to the database: {e}")
+
+    def close(self) -> None:
+        """
+        Stops writing rows in the background, writes the rows that are still
+        pending and closes the connections to the database.
+        """
+        self.closed.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+            self.flush_thread = None
+            atexit.unregister(self.flush)
+        self.flush()
+        self.engine.dispose()
+
+    def _cache(self, symbol: str, interval: str) -> None:
+        """
+        Reads the latest window of a series into memory if it is not cached.
+        """
+        key = (symbol, interval)
+        if key in self.first:
+            return
+        with self.fill_lock:
+            if key in self.first:
+                return
+            self.flush()
+            first, _ = self._data_range_sql(symbol, interval)
+            if first is not None:
+                window = self._load_last_sql(symbol, interval, self.queue_size)
+                super().store(symbol, interval, window)
+            with self.cache_lock:
+                self.first[key] = first
+        self._touch(key, resize=True)
+
+    def _evict(self, key: Tuple[str, str]) -> None:
+        """
+        Drops the cached window of a series. It is read again from the
+        database the next time the series is accessed.
+        """
+        self._drop(key)
+        with self.cache_lock:
+            self.first.pop(key, None)
+        self.evictions += 1
+
+    def cache_info(self) -> dict:
+        """
+        Returns the number of cache hits and misses, and the number of series
+        and bytes held by the cache.
+        """
+        with self.cache_lock, self.lru_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "series": len(self.lru),
+                "bytes": self.memory_used,
+            }
+
+    def _window(
+        self, symbol: str, interval: str, start: dt.datetime = None, n: int = None
+    ):
+        """
+        Returns the cached window of a series if it holds every row from
+        start, or from the first row if start is None, or at least n rows.
+        Counts the cache hit or miss.
+        """
+        key = (symbol, interval)
+        self._cache(symbol, interval)
+        with self._series_lock(symbol, interval).read():
+            window = self.storage.get(symbol, {}).get(interval)
+        with self.cache_lock:
+            first = self.first.get(key)
+            if first is not None and start is not None:
+                first = max(first, self._to_utc(start))
+            hit = first is None or (
+                window is not None
+                and not window.empty
+                and (window.index[0] <= first or (n is not None and len(window) >= n))
+            )
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            self._touch(key)
+            return window
+        self.flush()
+        return None
 
     def reset(self, symbol: str, interval: str):
         """
         Resets to an empty dataframe
         """
 
+        key = (symbol, interval)
+        with self.cache_lock:
+            self.pending = [
+                rows
+                for rows in self.pending
+                if (rows["symbol"].iloc[0], rows["interval"].iloc[0]) != key
+            ]
+        self._drop(key)
+
         with self.Session.begin() as session:
             session.execute(
                 Asset.__table__.delete().where(
-                    Asset.symbol == symbol and Asset.interval == interval
+                    Asset.symbol == symbol, Asset.interval == interval
                 )
             )
             session.commit()
+        with self.cache_lock:
+            self.first[key] = None
+
+    def _to_db_time(self, timestamp: dt.datetime) -> dt.datetime:
+        """
+        Converts a datetime to the naive UTC datetime saved in the table.
+        """
+        return self._to_utc(timestamp).tz_localize(None).to_pydatetime()
+
+    def _to_utc(self, timestamp: dt.datetime) -> pd.Timestamp:
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is None:
+            return timestamp.tz_localize("UTC")
+        return timestamp.tz_convert("UTC")
+
+    def _select(self, symbol: str, interval: str):
+        # The predicates match the primary key (symbol, interval, timestamp),
+        # so the database answers them with a range scan of its index.
+        return select(
+            Asset.timestamp,
+            Asset.open_,
+            Asset.close,
+            Asset.high,
+            Asset.low,
+            Asset.volume,
+        ).where(Asset.symbol == symbol, Asset.interval == interval)
+
+    def _to_frame(self, symbol: str, rows) -> pd.DataFrame:
+        data = pd.DataFrame(
+            rows, columns=["timestamp", "open_", "close", "high", "low", "volume"]
+        )
+
+        if data.empty:
+            return None
+
+        data.set_index("timestamp", inplace=True)
+        data.index = pd.DatetimeIndex(data.index).tz_localize(tz="UTC")
+        data.rename(columns={"open_": "open"}, inplace=True)
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
 
     def load(
         self,
@@ -118,48 +447,122 @@ class DBStorage(BaseStorage):
         a subset of the data if start and end are given and there is a gap
         between the last data point and the given end datetime.
 
-        If the specified interval does not exist, it will attempt to generate it by
-        aggregating data.
+        The data is read from the cached window if it covers start, and from
+        the database otherwise.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be at least
              1 minute
         :start: a datetime object
         """
 
-        with self.Session.begin() as session:
-            data = session.execute(
-                select(
-                    Asset.timestamp,
-                    Asset.open_,
-                    Asset.close,
-                    Asset.high,
-                    Asset.low,
-                    Asset.volume,
-                ).where(Asset.symbol == symbol and Asset.interval == interval)
-            )
-            data = pd.DataFrame(
-                data, columns=["timestamp", "open_", "close", "high", "low", "volume"]
-            )
+        if not interval:
+            return self._load_sql(symbol, interval, start, end)
+        if self._window(symbol, interval, start) is None:
+            return self._load_sql(symbol, interval, start, end)
+
+        start = None if start is None else self._to_utc(start)
+        end = None if end is None else self._to_utc(end)
+        data = super().load(symbol, interval, start, end)
+        return None if data is None or data.empty else data
+
+    def _load_sql(
+        self,
+        symbol: str,
+        interval: str,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+    ) -> pd.DataFrame:
+        """
+        Loads the stock data from the database. The symbol, interval and time
+        range are filtered by the database, so only the requested rows are read.
+        """
+        query = self._select(symbol, interval)
+        if start is not None:
+            query = query.where(Asset.timestamp >= self._to_db_time(start))
+        if end is not None:
+            query = query.where(Asset.timestamp <= self._to_db_time(end))
 
-            if data.empty:
-                return None
+        with self.Session.begin() as session:
+            rows = session.execute(query.order_by(Asset.timestamp)).all()
+        return self._to_frame(symbol, rows)
 
-            data.set_index("timestamp", inplace=True)
-            data.index = data.index.tz_localize(tz="UTC")
-            data.rename(columns={"open_": "open"}, inplace=True)
-            data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+    def load_last(self, symbol: str, interval: str, n: int) -> pd.DataFrame:
+        """
+        Loads the latest n data points of the given symbol and interval.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :n: the number of data points
+        """
+        if self._window(symbol, interval, n=n) is None:
+            return self._load_last_sql(symbol, interval, n)
+        data = super().load(symbol, interval, no_slice=True)
+        return None if data is None or data.empty else data.iloc[-n:]
 
-        # If the start and end are not defined, then set them to the
-        # beginning and end of the data.
-        if start is None:
-            start = data.index[0]
-        if end is None:
-            end = data.index[-1]
+    def load_asof(
+        self, symbol: str, interval: str, timestamp: dt.datetime
+    ) -> pd.DataFrame:
+        """
+        Loads the latest data point at or before the given datetime.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :timestamp: a datetime object
+        """
+        window = self._window(symbol, interval, timestamp)
+        if window is not None:
+            return super().load_asof(symbol, interval, timestamp)
+        query = (
+            self._select(symbol, interval)
+            .where(Asset.timestamp <= self._to_db_time(timestamp))
+            .order_by(Asset.timestamp.desc())
+            .limit(1)
+        )
+        with self.Session.begin() as session:
+            rows = session.execute(query).all()
+        return self._to_frame(symbol, rows)
 
-        return data.loc[(data.index >= start) & (data.index <= end)]
+    def _load_last_sql(self, symbol: str, interval: str, n: int) -> pd.DataFrame:
+        query = self._select(symbol, interval).order_by(Asset.timestamp.desc()).limit(n)
+        with self.Session.begin() as session:
+            rows = session.execute(query).all()
+        return self._to_frame(symbol, rows[::-1])
 
     def data_range(self, symbol: str, interval: str) -> Tuple[dt.datetime]:
-        return super().data_range(symbol, interval)
+        """
+        Returns the oldest and latest datetime of a particular symbol.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be atleast
+             1 minute
+        """
+        self._cache(symbol, interval)
+        with self._series_lock(symbol, interval).read():
+            window = self.storage.get(symbol, {}).get(interval)
+        with self.cache_lock:
+            first = self.first.get((symbol, interval))
+        if first is None:
+            return None, None
+        if window is None or window.empty:
+            return self._data_range_sql(symbol, interval)
+        return first, window.index[-1]
+
+    def _data_range_sql(self, symbol: str, interval: str) -> Tuple[dt.datetime]:
+        query = select(func.min(Asset.timestamp), func.max(Asset.timestamp)).where(
+            Asset.symbol == symbol, Asset.interval == interval
+        )
+        with self.Session.begin() as session:
+            first, last = session.execute(query).one()
+        if first is None:
+            return None, None
+        return pd.Timestamp(first, tz="UTC"), pd.Timestamp(last, tz="UTC")
+
+    def snapshot(self) -> dict:
+        """
+        Returns an empty snapshot, since every row is already saved in the
+        database.
+        """
+        self.flush()
+        return {}
 
     def _append(
         self,
@@ -0,0 +1,266 @@
+import re
+import time
+from os import listdir, makedirs, remove
+from os.path import isdir, join
+import pandas as pd
+import datetime as dt
+from typing import List, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from harvest.storage import BaseStorage
+from harvest.utils import *
+
+"""
+This module serves as a storage system for pandas dataframes in parquet files
+partitioned by symbol, interval and date:
+
+    {save_dir}/{symbol}/{interval}/date={YYYY-MM-DD}/part-{sequence}.parquet
+
+Each call to store writes only the new candles as a new part file, and loads
+outside of the in-memory window only read the partitions and row groups
+that overlap the requested time range.
+"""
+
+
+class ParquetStorage(BaseStorage):
+    """
+    An extension of the basic storage that saves data in partitioned parquet files.
+    """
+
+    def __init__(
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        compact_parts: int = 64,
+        memory_budget: int = None,
+    ):
+        """
+        Adds a directory to save data to. Loads the most recent data of every
+        series saved in the directory.
+
+        :compact_parts: the number of part files a date partition can have
+            before they are merged into a single file
+        :memory_budget: the number of bytes the series held in memory can
+            use. The least recently used series are dropped from memory
+            once it is exceeded, and read again on their next access.
+        """
+        super().__init__(queue_size, limit_size, memory_budget=memory_budget)
+        self.save_dir = save_dir
+        self.compact_parts = compact_parts
+        self._sequence = 0
+
+        # if the data dir does not exists, create it
+        makedirs(self.save_dir, exist_ok=True)
+
+        for symbol in listdir(self.save_dir):
+            if not isdir(join(self.save_dir, symbol)):
+                continue
+            for interval in listdir(join(self.save_dir, symbol)):
+                interval = self._parse_interval(interval)
+                data = self._open_tail(symbol, interval)
+                self.persisted.add((symbol, interval))
+                super().store(symbol, interval, data)
+
+    def _parse_interval(self, interval: str) -> Interval:
+        try:
+            return interval_string_to_enum(interval)
+        except ValueError:
+            return int(interval)
+
+    def _series_dir(self, symbol: str, interval: Interval) -> str:
+        return join(self.save_dir, symbol, interval_enum_to_string(interval))
+
+    def _partitions(self, symbol: str, interval: Interval) -> List[str]:
+        """
+        Returns the dates of the partitions of a series, in order.
+        """
+        path = self._series_dir(symbol, interval)
+        if not isdir(path):
+            return []
+        return sorted(d[len("date=") :] for d in listdir(path) if d.startswith("date="))
+
+    def _parts(self, symbol: str, interval: Interval, date: str) -> List[str]:
+        """
+        Returns the part files of a partition in the order they were written.
+        """
+        path = join(self._series_dir(symbol, interval), f"date={date}")
+        return [
+            join(path, f)
+            for f in sorted(listdir(path))
+            if re.match(r"^part-\d+\.parquet$", f)
+        ]
+
+    def _next_part(self, symbol: str, interval: Interval, date: str) -> str:
+        # Part files are named by a increasing sequence so that sorting them
+        # by name gives the order they were written in.
+        self._sequence = max(self._sequence + 1, time.time_ns())
+        path = join(self._series_dir(symbol, interval), f"date={date}")
+        makedirs(path, exist_ok=True)
+        return join(path, f"part-{self._sequence:020d}.parquet")
+
+    def store(
+        self,
+        symbol: str,
+        interval: Interval,
+        data: pd.DataFrame,
+        remove_duplicate: bool = True,
+        save_parquet: bool = True,
+    ) -> None:
+        """
+        Stores the stock data in the storage dictionary and appends it as new
+        part files to the date partitions it spans.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be atleast
+             1 minute
+        :data: a pandas dataframe that has stock data and has a datetime
+            index
+        """
+        super().store(symbol, interval, data, remove_duplicate)
+
+        if data.empty or not save_parquet:
+            return
+
+        df = data[symbol] if isinstance(data.columns, pd.MultiIndex) else data
+        index = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+        df = df.set_axis(index.tz_convert("UTC").rename("timestamp"), axis=0)
+        dates = df.index.strftime("%Y-%m-%d")
+
+        with self._series_lock(symbol, interval).write():
+            self.persisted.add((symbol, interval))
+            for date in dates.unique():
+                table = pa.Table.from_pandas(df[dates == date], preserve_index=True)
+                pq.write_table(table, self._next_part(symbol, interval, date))
+                if len(self._parts(symbol, interval, date)) > self.compact_parts:
+                    self._compact(symbol, interval, date)
+
+    def compact(self, symbol: str, interval: Interval, date: str = None) -> None:
+        """
+        Merges the part files of a partition into a single file.
+        :date: the date of the partition as YYYY-MM-DD. If not given, all
+            partitions of the series are compacted.
+        """
+        dates = self._partitions(symbol, interval) if date is None else [date]
+        with self._series_lock(symbol, interval).write():
+            for date in dates:
+                self._compact(symbol, interval, date)
+
+    def _compact(self, symbol: str, interval: Interval, date: str) -> None:
+        parts = self._parts(symbol, interval, date)
+        if len(parts) <= 1:
+            return
+        df = self._read(parts)
+        pq.write_table(
+            pa.Table.from_pandas(df, preserve_index=True),
+            self._next_part(symbol, interval, date),
+        )
+        for part in parts:
+            remove(part)
+
+    def _read(self, parts: List[str], filters=None) -> pd.DataFrame:
+        """
+        Reads part files into a single dataframe. If a candle was written
+        more than once, the last version written is kept.
+        """
+        # The date is already known from the directory names, so the
+        # partition columns are not read back from the paths.
+        tables = [
+            pq.read_table(part, filters=filters, partitioning=None) for part in parts
+        ]
+        df = pa.concat_tables(tables).to_pandas()
+        df = df[~df.index.duplicated(keep="last")]
+        return df.sort_index(kind="mergesort")
+
+    def open(
+        self,
+        symbol: str,
+        interval: Interval,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the saved data of a series between start and end, inclusive.
+        Only the date partitions overlapping the range are read, and the
+        range is pushed down to the parquet reader so that row groups
+        outside of it are skipped.
+        """
+        start = None if start is None else self._to_utc(start)
+        end = None if end is None else self._to_utc(end)
+
+        dates = [
+            d
+            for d in self._partitions(symbol, interval)
+            if (start is None or d >= start.strftime("%Y-%m-%d"))
+            and (end is None or d <= end.strftime("%Y-%m-%d"))
+        ]
+        parts = [p for d in dates for p in self._parts(symbol, interval, d)]
+        if not parts:
+            return pd.DataFrame()
+
+        filters = []
+        if start is not None:
+            filters.append(("timestamp", ">=", start))
+        if end is not None:
+            filters.append(("timestamp", "<=", end))
+
+        df = self._read(parts, filters or None)
+        df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+        return df
+
+    def _open_tail(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads the most recent partitions of a series until they hold enough
+        candles to fill the in-memory window.
+        """
+        parts, rows = [], 0
+        for date in reversed(self._partitions(symbol, interval)):
+            new_parts = self._parts(symbol, interval, date)
+            parts = new_parts + parts
+            # The row counts are read from the file footers only
+            rows += sum(pq.ParquetFile(p).metadata.num_rows for p in new_parts)
+            if self.limit_size and rows >= self.queue_size:
+                break
+        if not parts:
+            return pd.DataFrame()
+        df = self._read(parts)
+        df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+        return df
+
+    def _read_series(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        return self._open_tail(symbol, interval)
+
+    def _to_utc(self, timestamp: dt.datetime) -> pd.Timestamp:
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is None:
+            return timestamp.tz_localize("UTC")
+        return timestamp.tz_convert("UTC")
+
+    def load(
+        self,
+        symbol: str,
+        interval: Interval = None,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        no_slice=False,
+    ) -> pd.DataFrame:
+        """
+        Loads the stock data given the symbol and interval. The data is read
+        from memory if the in-memory window covers start, and from the
+        parquet files otherwise.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :start: a datetime object
+        """
+        if interval is None or start is None or no_slice:
+            return super().load(symbol, interval, start, end, no_slice)
+
+        with self._series_lock(symbol, interval).read():
+            data = self.storage.get(symbol, {}).get(interval)
+        if data is not None and not data.empty and data.index[0] <= self._to_utc(start):
+            return super().load(symbol, interval, start, end)
+
+        data = self.open(symbol, interval, start, end)
+        return None if data.empty else data
@@ -1,4 +1,7 @@
 import re
+import os
+import pickle
+import threading
 from os import listdir, makedirs
 from os.path import isfile, join
 import pandas as pd
@@ -10,6 +13,11 @@ from harvest.utils import *
 
 """
 This module serves as a storage system for pandas dataframes in with pickle files.
+
+By default the whole series is written to {symbol}@{interval}.pickle on every
+store. In write-ahead log mode, each store only appends the new rows to
+{symbol}@{interval}.wal, and a background compaction periodically folds the
+log into the pickle file, which then acts as a snapshot.
 """
 
 
@@ -18,30 +26,125 @@ class PickleStorage(BaseStorage):
     An extension of the basic storage that saves data in pickle files.
     """
 
+    # Extension of the snapshot files, see _read_snapshot and _write_snapshot
+    ext = "pickle"
+
     def __init__(
-        self, save_dir: str = "data", queue_size: int = 200, limit_size: bool = True
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        wal: bool = False,
+        compact_rows: int = 1000,
+        evict_after: float = None,
+        memory_budget: int = None,
     ):
-        super().__init__(queue_size, limit_size)
+        super().__init__(queue_size, limit_size, evict_after, memory_budget)
         """
-        Adds a directory to save data to. Loads any data that is currently in the
-        directory.
+        Adds a directory to save data to. The series currently in the
+        directory are added to the catalog and only read the first time
+        they are accessed.
+
+        :wal: if True, stores append the new rows to a log file instead of
+            rewriting the pickle file
+        :compact_rows: the number of rows a log can hold before it is folded
+            into the pickle file in the background
+        :evict_after: the number of seconds a series can go unaccessed before
+            it is dropped from memory
+        :memory_budget: the number of bytes the series held in memory can
+            use before the least recently used ones are dropped from memory
         """
         self.save_dir = save_dir
+        self.wal = wal
+        self.compact_rows = compact_rows
+        # Number of rows in the log of each series, counted when the series
+        # is first read, the series being compacted and the locks that keep
+        # two compactions of a series from running at the same time
+        self.log_rows = {}
+        self.compacting = set()
+        self.compaction_locks = {}
 
         # if the data dir does not exists, create it
         makedirs(self.save_dir, exist_ok=True)
 
-        files = [f for f in listdir(self.save_dir) if isfile(join(self.save_dir, f))]
+        for symbol, interval in self._saved_series():
+            self._catalog_series(symbol, interval)
 
-        for file in files:
-            symbol, interval = file.split("@")
-            interval = interval.split(".")[0]
-            if interval[0] == '-':
-                interval = int(interval[1:])
+    def _saved_series(self):
+        """
+        Returns the symbol and interval of every series saved in the directory.
+        """
+        series = set()
+        for file in listdir(self.save_dir):
+            file_search = re.search(
+                rf"^(.+)@([-\w]+)\.({re.escape(self.ext)}|wal|wal\.old)$", file
+            )
+            if file_search is None or not isfile(join(self.save_dir, file)):
+                continue
+            symbol, interval = file_search.group(1), file_search.group(2)
+            if re.match(r"^-?\d+$", interval):
+                interval = int(interval)
             else:
                 interval = interval_string_to_enum(interval)
+            series.add((symbol, interval))
+        return series
+
+    def _path(self, symbol: str, interval: Interval, ext: str = None) -> str:
+        ext = self.ext if ext is None else ext
+        return join(
+            self.save_dir, f"{symbol}@{interval_enum_to_string(interval)}.{ext}"
+        )
 
-            super().store(symbol, interval, pd.read_pickle(join(self.save_dir, file)))
+    def _read_snapshot(self, path: str) -> pd.DataFrame:
+        return pd.read_pickle(path)
+
+    def _write_snapshot(self, data: pd.DataFrame, path: str) -> None:
+        data.to_pickle(path)
+
+    def _read_log(self, path: str):
+        """
+        Yields the dataframes appended to a log file. A truncated last entry,
+        left by a crash in the middle of a write, is ignored.
+        """
+        if not isfile(path):
+            return
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+                except pickle.UnpicklingError:
+                    debugger.warning(f"Ignoring truncated entry at the end of {path}")
+                    return
+
+    def _replay(self, path: str, logs) -> pd.DataFrame:
+        """
+        Reads a pickle file and replays the dataframes of the given logs on
+        top of it.
+        """
+        chunks = [self._read_snapshot(path)] if isfile(path) else []
+        chunks += [chunk for log in logs for chunk in log]
+        chunks = [chunk for chunk in chunks if not chunk.empty]
+        if not chunks:
+            return pd.DataFrame()
+        data = pd.concat(chunks)
+        return data[~data.index.duplicated(keep="last")].sort_index()
+
+    def _read_series(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads a series from its pickle file and logs.
+        """
+        key = (symbol, interval)
+        log = list(self._read_log(self._path(symbol, interval, "wal")))
+        if key not in self.log_rows:
+            # Rows left in the log by a previous run count towards the next
+            # compaction
+            self.log_rows[key] = sum(len(chunk) for chunk in log)
+        return self._replay(
+            self._path(symbol, interval),
+            [self._read_log(self._path(symbol, interval, "wal.old")), log],
+        )
 
     def store(
         self,
@@ -61,20 +164,76 @@ class PickleStorage(BaseStorage):
         """
         super().store(symbol, interval, data, remove_duplicate)
 
-        if not data.empty and save_pickle:
+        if data.empty or not save_pickle:
+            return
+
+        # Hold the series' write lock so that concurrent stores to the
+        # same series do not write the file at the same time.
+        with self._series_lock(symbol, interval).write():
+            self.persisted.add((symbol, interval))
+            if not self.wal:
+                self._write_snapshot(
+                    self.storage[symbol][interval], self._path(symbol, interval)
+                )
+                return
+
+            with open(self._path(symbol, interval, "wal"), "ab") as f:
+                pickle.dump(data, f)
+            key = (symbol, interval)
+            self.log_rows[key] = self.log_rows.get(key, 0) + len(data)
+            if self.log_rows[key] < self.compact_rows or key in self.compacting:
+                return
+            self.compacting.add(key)
+
+        threading.Thread(
+            target=self.compact, args=(symbol, interval), daemon=True
+        ).start()
+
+    def compact(self, symbol: str, interval: Interval) -> None:
+        """
+        Folds the log of a series into its pickle file. The log is first
+        moved aside so that stores can keep appending to a new log while
+        the pickle file is rewritten.
+        """
+        log = self._path(symbol, interval, "wal")
+        old_log = self._path(symbol, interval, "wal.old")
+        try:
+            with self._compaction_lock(symbol, interval):
+                with self._series_lock(symbol, interval).write():
+                    # A log left aside by an interrupted compaction is folded first
+                    if isfile(log) and not isfile(old_log):
+                        os.replace(log, old_log)
+                        self.log_rows[(symbol, interval)] = 0
+
+                path = self._path(symbol, interval)
+                data = self._replay(path, [self._read_log(old_log)])
+                if not data.empty:
+                    self._write_snapshot(data, path + ".tmp")
+                    os.replace(path + ".tmp", path)
+                if isfile(old_log):
+                    os.remove(old_log)
+        finally:
+            self.compacting.discard((symbol, interval))
+
+    def _compaction_lock(self, symbol: str, interval: Interval) -> threading.Lock:
+        """
+        Returns the lock held while a series is compacted, creating it if needed.
+        """
+        key = (symbol, interval)
+        lock = self.compaction_locks.get(key)
+        if lock is None:
             self.storage_lock.acquire()
-            self.storage[symbol][interval].to_pickle(
-                self.save_dir + f"/{symbol}@{interval_enum_to_string(interval)}.pickle"
-            )
+            lock = self.compaction_locks.setdefault(key, threading.Lock())
             self.storage_lock.release()
+        return lock
 
     def open(self, symbol: str, interval: Interval):
-        if isinstance(interval, int):
-            interval = interval
-        else:
+        if isinstance(interval, str):
             interval = interval_string_to_enum(interval)
-        name = self.save_dir + f"/{symbol}@{interval}.pickle"
+        if self.wal:
+            return self._read_series(symbol, interval)
+        name = self._path(symbol, interval)
         if isfile(name):
-            return pd.read_pickle(name)
+            return self._read_snapshot(name)
         else:
             return pd.DataFrame()
@@ -0,0 +1,424 @@
+import numpy as np
+import pandas as pd
+import datetime as dt
+from typing import List, Tuple
+
+from harvest.storage import BaseStorage
+from harvest.utils import *
+
+"""
+This module serves as an in-memory storage system that keeps each series as
+preallocated numpy arrays rather than as pandas dataframes. New candles are
+written into a fixed-capacity ring buffer in O(1), and a dataframe is only
+built when the data is loaded.
+"""
+
+
+class CandleRing:
+    """
+    A ring buffer holding the candles of a single symbol and interval.
+
+    Timestamps are kept as int64 nanoseconds since the epoch and the candle
+    fields as a 2D float64 array. Every row is written twice, once at its
+    slot and once at the same slot shifted by the capacity, so that the
+    stored window is always a contiguous slice of the underlying arrays.
+    """
+
+    def __init__(
+        self,
+        fields: List[str],
+        capacity: int,
+        fixed: bool = True,
+        tz=None,
+        index_name: str = None,
+    ):
+        """
+        :fields: the names of the candle fields, e.g. open, high, low, ...
+        :capacity: the number of candles the buffer can hold
+        :fixed: if False, the buffer doubles its capacity instead of
+            overwriting the oldest candle when it is full
+        :tz: the timezone of the index of the dataframes built by this buffer
+        :index_name: the name of the index of the dataframes built by this buffer
+        """
+        self.fields = list(fields)
+        self.fixed = fixed
+        self.tz = tz
+        self.index_name = index_name
+        self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.timestamps = np.empty(2 * capacity, dtype=np.int64)
+        self.values = np.empty((2 * capacity, len(self.fields)), dtype=np.float64)
+        # Slot the next candle is written to
+        self.end = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def window(self) -> Tuple[int, int]:
+        """
+        Returns the start and stop positions of the stored candles in the
+        underlying arrays.
+        """
+        start = (self.end - self.size) % self.capacity
+        return start, start + self.size
+
+    def clear(self) -> None:
+        self.end = 0
+        self.size = 0
+
+    def epoch(self, timestamp) -> int:
+        """
+        Converts a datetime to an int64 nanosecond timestamp comparable
+        to the ones stored in the buffer.
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if self.tz is None:
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.tz_convert(None)
+        elif timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize(self.tz)
+        return timestamp.value
+
+    def write(
+        self, timestamps: np.ndarray, values: np.ndarray, remove_duplicate=True
+    ) -> None:
+        """
+        Writes candles into the buffer. Candles newer than the last stored
+        candle are appended in O(1) each, and a candle with the same
+        timestamp as the last stored one replaces it. Any other case is
+        handled by merging the new candles with the stored ones.
+        """
+        if len(timestamps) == 0:
+            return
+
+        if not remove_duplicate:
+            self._extend(timestamps, values)
+            return
+
+        if len(timestamps) > 1:
+            # Sort the new candles and keep the last of any duplicates
+            order = np.argsort(timestamps, kind="mergesort")
+            timestamps, values = timestamps[order], values[order]
+            keep = np.append(timestamps[1:] != timestamps[:-1], True)
+            timestamps, values = timestamps[keep], values[keep]
+
+        if self.size == 0:
+            self._extend(timestamps, values)
+            return
+
+        last = self.timestamps[self.window()[1] - 1]
+        if timestamps[0] > last:
+            self._extend(timestamps, values)
+        elif timestamps[0] == last and (len(timestamps) == 1 or timestamps[1] > last):
+            self._replace_last(values[0])
+            self._extend(timestamps[1:], values[1:])
+        else:
+            self._merge(timestamps, values)
+
+    def _extend(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        n = len(timestamps)
+        if n == 0:
+            return
+        if not self.fixed and self.size + n > self.capacity:
+            start, stop = self.window()
+            self._fill(
+                np.concatenate([self.timestamps[start:stop], timestamps]),
+                np.concatenate([self.values[start:stop], values]),
+            )
+            return
+        if n >= self.capacity:
+            self._fill(timestamps, values)
+            return
+
+        slots = (self.end + np.arange(n)) % self.capacity
+        self.timestamps[slots] = timestamps
+        self.timestamps[slots + self.capacity] = timestamps
+        self.values[slots] = values
+        self.values[slots + self.capacity] = values
+        self.end = (self.end + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def _replace_last(self, row: np.ndarray) -> None:
+        slot = (self.end - 1) % self.capacity
+        self.values[slot] = row
+        self.values[slot + self.capacity] = row
+
+    def _merge(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        start, stop = self.window()
+        timestamps = np.concatenate([self.timestamps[start:stop], timestamps])
+        values = np.concatenate([self.values[start:stop], values])
+        # A stable sort keeps the new candles after the stored ones
+        order = np.argsort(timestamps, kind="mergesort")
+        timestamps, values = timestamps[order], values[order]
+        keep = np.append(timestamps[1:] != timestamps[:-1], True)
+        self._fill(timestamps[keep], values[keep])
+
+    def _fill(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Replaces the content of the buffer, growing it if it is not fixed.
+        """
+        n = len(timestamps)
+        if not self.fixed and n > self.capacity:
+            capacity = self.capacity
+            while capacity < n:
+                capacity *= 2
+            self._allocate(capacity)
+        elif self.fixed and n > self.capacity:
+            timestamps, values = timestamps[-self.capacity :], values[-self.capacity :]
+            n = self.capacity
+
+        self.timestamps[:n] = timestamps
+        self.timestamps[self.capacity : self.capacity + n] = timestamps
+        self.values[:n] = values
+        self.values[self.capacity : self.capacity + n] = values
+        self.end = n % self.capacity
+        self.size = n
+
+    def range(self, start=None, end=None) -> Tuple[int, int]:
+        """
+        Returns the positions in the underlying arrays of the candles
+        between start and end, inclusive.
+        """
+        first, last = self.window()
+        timestamps = self.timestamps[first:last]
+        lo = 0 if start is None else timestamps.searchsorted(self.epoch(start), "left")
+        hi = (
+            len(timestamps)
+            if end is None
+            else timestamps.searchsorted(self.epoch(end), "right")
+        )
+        return first + lo, first + max(lo, hi)
+
+    def to_index(self, start: int, stop: int) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(
+            self.timestamps[start:stop].copy().view("datetime64[ns]"),
+            name=self.index_name,
+        )
+        if self.tz is not None:
+            index = index.tz_localize("UTC").tz_convert(self.tz)
+        return index
+
+    def to_frame(self, symbol: str, start: int, stop: int) -> pd.DataFrame:
+        """
+        Builds a dataframe from the candles stored between the given positions.
+        """
+        return pd.DataFrame(
+            self.values[start:stop].copy(),
+            index=self.to_index(start, stop),
+            columns=pd.MultiIndex.from_product([[symbol], self.fields]),
+        )
+
+
+class RingStorage(BaseStorage):
+    """
+    An extension of the basic storage that keeps the data of each symbol and
+    interval in a ring buffer of numpy arrays instead of a dataframe.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 200,
+        limit_size: bool = True,
+        memory_budget: int = None,
+    ):
+        super().__init__(queue_size, limit_size, memory_budget=memory_budget)
+
+    def _series_bytes(self, symbol: str, interval: Interval) -> int:
+        ring = self.storage.get(symbol, {}).get(interval)
+        return 0 if ring is None else ring.timestamps.nbytes + ring.values.nbytes
+
+    def _to_arrays(
+        self, symbol: str, ring: CandleRing, data: pd.DataFrame
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts a dataframe into the timestamp and value arrays of the given
+        ring buffer.
+        """
+        data = data[symbol] if isinstance(data.columns, pd.MultiIndex) else data
+        index = data.index
+        if ring.tz is not None and index.tz is None:
+            index = index.tz_localize(ring.tz)
+        elif ring.tz is None and index.tz is not None:
+            index = index.tz_convert(None)
+        values = data.reindex(columns=ring.fields).to_numpy(dtype=np.float64)
+        return index.asi8, values
+
+    def _new_ring(
+        self, data: pd.DataFrame, symbol: str, interval: Interval
+    ) -> CandleRing:
+        fields = (
+            data[symbol].columns
+            if isinstance(data.columns, pd.MultiIndex)
+            else data.columns
+        )
+        return CandleRing(
+            fields,
+            self.queue_size if self.limit_size else max(self.queue_size, len(data)),
+            fixed=self.limit_size,
+            tz=data.index.tz,
+            index_name=data.index.name,
+        )
+
+    def store(
+        self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True
+    ) -> None:
+        """
+        Stores the stock data in the ring buffer of the symbol and interval.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :data: a pandas dataframe that has stock data and has a datetime
+            index
+        """
+
+        if data.empty:
+            return None
+
+        self._access(symbol, interval)
+        with self._series_lock(symbol, interval).write():
+            ring = self.storage.get(symbol, {}).get(interval)
+            if ring is None:
+                if len(data) < self.queue_size:
+                    debugger.warning(
+                        f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points"
+                    )
+                ring = self._new_ring(data, symbol, interval)
+                self.storage_lock.acquire()
+                self.storage.setdefault(symbol, {})[interval] = ring
+                self.storage_lock.release()
+            ring.write(*self._to_arrays(symbol, ring, data), remove_duplicate)
+            self._changed(symbol, interval)
+        self._touch((symbol, interval), resize=True)
+
+    def reset(self, symbol: str, interval: Interval):
+        """
+        Empties the ring buffer of the symbol and interval.
+        """
+        with self._series_lock(symbol, interval).write():
+            ring = self.storage.get(symbol, {}).get(interval)
+            if ring is not None:
+                ring.clear()
+                self._changed(symbol, interval)
+        self._touch((symbol, interval), resize=True)
+        self._reset_aggregators(symbol, interval)
+
+    def _read_ring(self, symbol: str, interval: Interval, read):
+        """
+        Calls read with the ring buffer of the given symbol and interval
+        while holding its read lock, and returns the result. Returns None
+        if the series does not exist.
+        """
+        with self._series_lock(symbol, interval).read():
+            ring = self.storage.get(symbol, {}).get(interval)
+            if ring is None:
+                return None
+            return read(ring)
+
+    def load(
+        self,
+        symbol: str,
+        interval: Interval = None,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        no_slice=False,
+    ) -> pd.DataFrame:
+        """
+        Builds a dataframe from the ring buffer of the given symbol and
+        interval. Only the candles between start and end are copied if
+        they are given.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :start: a datetime object
+        """
+        if interval is None:
+            if symbol not in self.storage:
+                return None
+            return super().load(symbol, None, start, end)
+
+        self._access(symbol, interval)
+
+        # The dataframe is built from a copy of the buffer while holding the
+        # lock, so it is a consistent snapshot.
+        def read(ring):
+            first, last = ring.window() if no_slice else ring.range(start, end)
+            return ring.to_frame(symbol, first, last)
+
+        return self._read_ring(symbol, interval, read)
+
+    def load_last(self, symbol: str, interval: Interval, n: int) -> pd.DataFrame:
+        """
+        Builds a dataframe from the latest n candles of the ring buffer.
+        """
+        self._access(symbol, interval)
+
+        def read(ring):
+            if len(ring) == 0:
+                return None
+            first, last = ring.window()
+            return ring.to_frame(symbol, max(first, last - n), last)
+
+        return self._read_ring(symbol, interval, read)
+
+    def load_array(
+        self, symbol: str, interval: Interval, field: str = "close", n: int = None
+    ) -> np.ndarray:
+        """
+        Returns the values of a field as a read-only array. Since the ring
+        buffer is written in place, only the column is copied instead of
+        returning a view.
+        """
+        self._access(symbol, interval)
+
+        def read(ring):
+            if field not in ring.fields:
+                return np.empty(0)
+            first, last = ring.window()
+            if n is not None:
+                first = max(first, last - n)
+            return ring.values[first:last, ring.fields.index(field)].copy()
+
+        values = self._read_ring(symbol, interval, read)
+        if values is None:
+            return np.empty(0)
+        values.flags.writeable = False
+        return values
+
+    def load_asof(
+        self, symbol: str, interval: Interval, timestamp: dt.datetime
+    ) -> pd.DataFrame:
+        """
+        Builds a dataframe from the latest candle of the ring buffer at or
+        before the given datetime.
+        """
+        self._access(symbol, interval)
+
+        def read(ring):
+            if len(ring) == 0:
+                return None
+            first, last = ring.range(None, timestamp)
+            if last == first:
+                return None
+            return ring.to_frame(symbol, last - 1, last)
+
+        return self._read_ring(symbol, interval, read)
+
+    def data_range(self, symbol: str, interval: Interval) -> Tuple[dt.datetime]:
+        """
+        Returns the oldest and latest datetime of a particular symbol.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be atleast
+             1 minute
+        """
+
+        def read(ring):
+            if len(ring) == 0:
+                return None
+            start, stop = ring.window()
+            return ring.to_index(start, start + 1)[0], ring.to_index(stop - 1, stop)[0]
+
+        bounds = self._read_ring(symbol, interval, read)
+        return (None, None) if bounds is None else bounds
@@ -0,0 +1,275 @@
+import sys
+import time
+import hashlib
+from threading import Lock
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from harvest.storage.ring_storage import CandleRing, RingStorage
+from harvest.utils import *
+
+"""
+This module serves as a storage system shared by the processes of a host.
+Each series is a ring buffer, like in RingStorage, allocated in a block of
+shared memory named after the namespace, symbol and interval. A single
+writer process, e.g. the one running the streamer, stores candles, and any
+number of reader processes attach to the blocks, so the candles are only
+held once per host.
+
+Writes are coordinated with a sequence number, as in a seqlock. The writer
+makes it odd before modifying a block and even once it is done. Readers
+copy the candles they need and retry if the sequence number was odd or
+changed while they were copying, so they never block the writer.
+"""
+
+_attach_lock = Lock()
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attaches to an existing block of shared memory without registering it
+    with the resource tracker, which would free it when the process exits.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+
+        def skip(name, rtype):
+            if rtype != "shared_memory":
+                register(name, rtype)
+
+        resource_tracker.register = skip
+        try:
+            return SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedCandleRing(CandleRing):
+    """
+    A ring buffer of candles whose arrays and state are stored in a block
+    of shared memory. The block starts with a header of int64 values: the
+    sequence number, the capacity, the number of fields, the slot the next
+    candle is written to and the number of candles.
+    """
+
+    fields = ["open", "high", "low", "close", "volume"]
+    header_size = 8
+
+    def __init__(self, shm: SharedMemory, capacity: int = None):
+        """
+        :shm: the block of shared memory
+        :capacity: the number of candles the buffer can hold. If given, the
+            block is initialized, otherwise the capacity is read from it.
+        """
+        self.shm = shm
+        self.fixed = True
+        self.tz = "UTC"
+        self.index_name = "timestamp"
+        self.header = np.ndarray(self.header_size, dtype=np.int64, buffer=shm.buf)
+        if capacity is not None:
+            self.header[:] = 0
+            self.header[1] = capacity
+            self.header[2] = len(self.fields)
+        self.capacity = int(self.header[1])
+
+        offset = self.header.nbytes
+        self.timestamps = np.ndarray(
+            2 * self.capacity, dtype=np.int64, buffer=shm.buf, offset=offset
+        )
+        offset += self.timestamps.nbytes
+        self.values = np.ndarray(
+            (2 * self.capacity, int(self.header[2])),
+            dtype=np.float64,
+            buffer=shm.buf,
+            offset=offset,
+        )
+
+    @classmethod
+    def nbytes(cls, capacity: int) -> int:
+        """
+        Returns the size of the block of shared memory holding a buffer of
+        the given capacity.
+        """
+        return 8 * (cls.header_size + 2 * capacity * (1 + len(cls.fields)))
+
+    @property
+    def end(self) -> int:
+        return int(self.header[3])
+
+    @end.setter
+    def end(self, value: int) -> None:
+        self.header[3] = value
+
+    @property
+    def size(self) -> int:
+        return int(self.header[4])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self.header[4] = value
+
+    @property
+    def sequence(self) -> int:
+        return int(self.header[0])
+
+    def write(
+        self, timestamps: np.ndarray, values: np.ndarray, remove_duplicate=True
+    ) -> None:
+        self.header[0] += 1
+        try:
+            super().write(timestamps, values, remove_duplicate)
+        finally:
+            self.header[0] += 1
+
+    def clear(self) -> None:
+        self.header[0] += 1
+        try:
+            super().clear()
+        finally:
+            self.header[0] += 1
+
+    def detach(self, unlink: bool = False) -> None:
+        """
+        Closes the block of shared memory, and frees it if unlink is True.
+        The buffer can no longer be used afterwards.
+        """
+        # The block cannot be closed while arrays still point into it
+        del self.header, self.timestamps, self.values
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def read(self, read):
+        """
+        Calls read with this buffer until it runs without a concurrent
+        write, and returns the result. read must copy the data it returns.
+        """
+        while True:
+            sequence = self.sequence
+            if sequence % 2 == 0:
+                try:
+                    result = read(self)
+                except Exception:
+                    # The buffer may have been inconsistent while it was read
+                    if self.sequence == sequence:
+                        raise
+                    continue
+                if self.sequence == sequence:
+                    return result
+            time.sleep(0)
+
+
+class SharedMemoryStorage(RingStorage):
+    """
+    An extension of the ring buffer storage that keeps the buffers in shared
+    memory, so that a writer process and many reader processes use the same
+    candles.
+    """
+
+    def __init__(
+        self, namespace: str = "harvest", queue_size: int = 200, writer: bool = True
+    ):
+        """
+        :namespace: the prefix of the names of the blocks of shared memory.
+            Processes using the same namespace share their candles.
+        :queue_size: the number of candles of each series
+        :writer: if True, this storage creates the blocks and stores candles
+            in them. Otherwise it can only read the blocks of the writer.
+            There must be a single writer per namespace.
+        """
+        super().__init__(queue_size, limit_size=True)
+        self.namespace = namespace
+        self.writer = writer
+
+    def _name(self, symbol: str, interval: Interval) -> str:
+        # Symbols can hold characters that are not valid in names of blocks
+        key = f"{symbol}@{interval_enum_to_string(interval)}".encode()
+        return f"{self.namespace}-{hashlib.sha1(key).hexdigest()[:16]}"
+
+    def _new_ring(
+        self, data: pd.DataFrame, symbol: str, interval: Interval
+    ) -> SharedCandleRing:
+        name = self._name(symbol, interval)
+        size = SharedCandleRing.nbytes(self.queue_size)
+        try:
+            shm = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # A block left by a writer that did not close the storage
+            shm = SharedMemory(name)
+            if shm.size < size:
+                shm.close()
+                shm.unlink()
+                shm = SharedMemory(name, create=True, size=size)
+        return SharedCandleRing(shm, self.queue_size)
+
+    def _attach(self, symbol: str, interval: Interval) -> SharedCandleRing:
+        """
+        Attaches to the block of the writer holding a series, or returns None
+        if the series has not been stored by the writer.
+        """
+        try:
+            shm = _attach(self._name(symbol, interval))
+        except FileNotFoundError:
+            return None
+        ring = SharedCandleRing(shm)
+        self.storage_lock.acquire()
+        attached = self.storage.setdefault(symbol, {}).setdefault(interval, ring)
+        self.storage_lock.release()
+        if attached is not ring:
+            # Another thread attached first
+            ring.detach()
+        self._touch((symbol, interval), resize=True)
+        return attached
+
+    def _series_bytes(self, symbol: str, interval: Interval) -> int:
+        ring = self.storage.get(symbol, {}).get(interval)
+        return 0 if ring is None else ring.shm.size
+
+    def _read_ring(self, symbol: str, interval: Interval, read):
+        """
+        Calls read with the buffer of the given symbol and interval until it
+        runs without a concurrent write of the writer process.
+        """
+        ring = self.storage.get(symbol, {}).get(interval)
+        if ring is None and not self.writer:
+            ring = self._attach(symbol, interval)
+        if ring is None:
+            return None
+        with self._series_lock(symbol, interval).read():
+            return ring.read(read)
+
+    def _drop(self, key) -> None:
+        ring = self.storage.get(key[0], {}).get(key[1])
+        super()._drop(key)
+        if ring is not None:
+            ring.detach(unlink=self.writer)
+
+    def store(
+        self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True
+    ) -> None:
+        """
+        Stores the stock data in the shared ring buffer of the symbol and
+        interval. Only the writer can store data.
+        """
+        if not self.writer:
+            raise Exception(f"Cannot store {symbol} in a reader SharedMemoryStorage")
+        super().store(symbol, interval, data, remove_duplicate)
+
+    def reset(self, symbol: str, interval: Interval):
+        if not self.writer:
+            raise Exception(f"Cannot reset {symbol} in a reader SharedMemoryStorage")
+        super().reset(symbol, interval)
+
+    def close(self) -> None:
+        """
+        Detaches from every block. The writer also frees them, after which
+        readers can no longer attach to them.
+        """
+        for symbol in list(self.storage):
+            for interval in list(self.storage[symbol]):
+                self._drop((symbol, interval))
@@ -0,0 +1,253 @@
+import re
+from os import listdir, makedirs, remove
+from os.path import isfile, join
+import pandas as pd
+import datetime as dt
+from typing import Tuple
+
+from harvest.storage import BaseStorage
+from harvest.storage.candle_file import CandleFile
+from harvest.utils import *
+
+"""
+This module serves as a storage system with two tiers. The latest candles of
+each series are kept in memory, like in BaseStorage, and the candles that no
+longer fit in memory are moved to a candle file on disk,
+{save_dir}/{symbol}@{interval}.candles, instead of being dropped. Loads
+read from both tiers, so any amount of history can be kept with a fixed
+memory budget.
+"""
+
+
+class TieredStorage(BaseStorage):
+    """
+    An extension of the basic storage that spills the candles that do not fit
+    in memory to candle files.
+    """
+
+    def __init__(
+        self, save_dir: str = "data", queue_size: int = 200, memory_budget: int = None
+    ):
+        """
+        Adds a directory for the candle files. The series saved in it are
+        added to the catalog, and their latest candles are read into memory
+        when they are first accessed.
+
+        :queue_size: the number of candles of each series kept in memory
+        :memory_budget: the number of bytes the series held in memory can
+            use. The least recently used series are moved to their candle
+            files once it is exceeded.
+        """
+        super().__init__(queue_size, limit_size=True, memory_budget=memory_budget)
+        self.save_dir = save_dir
+        # Timestamp of the last candle in the candle file of each series
+        self.cold_last = {}
+
+        # if the data dir does not exists, create it
+        makedirs(self.save_dir, exist_ok=True)
+
+        for file in listdir(self.save_dir):
+            file_search = re.search(r"^(.+)@([-\w]+)\.candles$", file)
+            if file_search is None or not isfile(join(self.save_dir, file)):
+                continue
+            symbol, interval = file_search.group(1), file_search.group(2)
+            # Aggregations are saved with the integer value of their interval
+            if re.match(r"^-?\d+$", interval):
+                interval = int(interval)
+            else:
+                interval = interval_string_to_enum(interval)
+            # The series are not marked as persisted since the candles in
+            # memory are not saved, so evict_idle does not drop them.
+            with self.catalog_lock:
+                self._add_to_catalog(symbol, interval)
+
+    def _file(self, symbol: str, interval: Interval) -> CandleFile:
+        return CandleFile(
+            join(self.save_dir, f"{symbol}@{interval_enum_to_string(interval)}.candles")
+        )
+
+    def _last_cold(self, symbol: str, interval: Interval) -> pd.Timestamp:
+        key = (symbol, interval)
+        if key not in self.cold_last:
+            records = self._file(symbol, interval).records()
+            self.cold_last[key] = (
+                pd.Timestamp(int(records["timestamp"][-1]), tz="UTC")
+                if len(records)
+                else None
+            )
+        return self.cold_last[key]
+
+    def _read_series(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads the latest candles of a candle file into memory.
+        """
+        file = self._file(symbol, interval)
+        records = file.records()
+        if len(records) == 0:
+            return pd.DataFrame()
+        start = pd.Timestamp(
+            int(records["timestamp"][max(len(records) - self.queue_size, 0)]),
+            tz="UTC",
+        )
+        return file.read(symbol, start)
+
+    def store(
+        self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True
+    ) -> None:
+        """
+        Stores the stock data in memory. The oldest candles that no longer fit
+        in memory are appended to the candle file of the series.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :data: a pandas dataframe that has stock data and has a datetime
+            index
+        """
+
+        if data.empty:
+            return None
+
+        self._access(symbol, interval)
+        written = data.index
+        with self._series_lock(symbol, interval).write():
+            current = self.storage.get(symbol, {}).get(interval)
+            if current is not None and not current.empty:
+                data = self._append(current, data, remove_duplicate=remove_duplicate)
+            elif remove_duplicate:
+                data = data[~data.index.duplicated(keep="last")].sort_index()
+
+            self._spill(symbol, interval, data.iloc[: -self.queue_size], written)
+            self.storage_lock.acquire()
+            self.storage.setdefault(symbol, {})[interval] = data.iloc[
+                -self.queue_size :
+            ]
+            self.storage_lock.release()
+            self._changed(symbol, interval)
+        self._touch((symbol, interval), resize=True)
+
+    def _spill(
+        self,
+        symbol: str,
+        interval: Interval,
+        data: pd.DataFrame,
+        written: pd.Index = None,
+    ) -> None:
+        """
+        Appends candles to the candle file of a series. Candles that are
+        already in the file are skipped unless they are in written, the
+        index of the candles that were just stored.
+        """
+        if data.empty:
+            return
+        last = self._last_cold(symbol, interval)
+        if last is not None:
+            new = data.index > last
+            if written is not None:
+                new |= data.index.isin(written)
+            data = data[new]
+            if data.empty:
+                return
+        file = self._file(symbol, interval)
+        file.append(data)
+        self.cold_last[(symbol, interval)] = max(
+            data.index[-1] if last is None else last, data.index[-1]
+        )
+
+    def _demote(self, symbol: str, interval: Interval) -> bool:
+        """
+        Moves the candles of a series held in memory to its candle file
+        before it is evicted.
+        """
+        with self._series_lock(symbol, interval).write():
+            data = self.storage.get(symbol, {}).get(interval)
+            if data is not None:
+                self._spill(symbol, interval, data)
+        return True
+
+    def flush(self) -> None:
+        """
+        Appends the candles held in memory to the candle files, so that they
+        are read back by a new instance.
+        """
+        for symbol in list(self.storage):
+            for interval in list(self.storage[symbol]):
+                with self._series_lock(symbol, interval).write():
+                    data = self.storage[symbol][interval]
+                    self._spill(symbol, interval, data)
+
+    def reset(self, symbol: str, interval: Interval):
+        """
+        Empties both tiers of the series.
+        """
+        super().reset(symbol, interval)
+        with self._series_lock(symbol, interval).write():
+            file = self._file(symbol, interval)
+            if file.exists():
+                remove(file.path)
+            self.cold_last[(symbol, interval)] = None
+
+    def load(
+        self,
+        symbol: str,
+        interval: Interval = None,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        no_slice=False,
+    ) -> pd.DataFrame:
+        """
+        Loads the stock data given the symbol and interval. If start is
+        before the candles held in memory, the older candles are read from
+        the candle file. If start is not given, only the candles in memory
+        are returned.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be at least
+             1 minute
+        :start: a datetime object
+        """
+        hot = super().load(symbol, interval, start, end, no_slice)
+        if interval is None or start is None or no_slice:
+            return hot
+
+        start = pd.Timestamp(start)
+        if start.tzinfo is None:
+            start = start.tz_localize("UTC")
+        with self._series_lock(symbol, interval).read():
+            window = self.storage.get(symbol, {}).get(interval)
+            if window is not None and not window.empty and window.index[0] <= start:
+                return hot
+            hot_start = None if window is None or window.empty else window.index[0]
+            cold_end = end
+            if hot_start is not None:
+                cold_end = hot_start - dt.timedelta(microseconds=1)
+                if end is not None:
+                    cold_end = min(cold_end, pd.Timestamp(end))
+            cold = self._file(symbol, interval).read(symbol, start, cold_end)
+
+        if cold.empty:
+            return hot
+        if hot_start is not None:
+            # Match the columns and index of the candles in memory
+            cold = cold.reindex(columns=window.columns)
+            cold.index = cold.index.tz_convert(window.index.tz).rename(
+                window.index.name
+            )
+        if hot is None or hot.empty:
+            return cold
+        return pd.concat([cold, hot])
+
+    def data_range(self, symbol: str, interval: Interval) -> Tuple[dt.datetime]:
+        """
+        Returns the oldest and latest datetime of a particular symbol.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be atleast
+             1 minute
+        """
+        first, last = super().data_range(symbol, interval)
+        records = self._file(symbol, interval).records()
+        if len(records):
+            cold_first = pd.Timestamp(int(records["timestamp"][0]), tz="UTC")
+            if first is None or cold_first < first:
+                first = cold_first
+            if last is None:
+                last = self._last_cold(symbol, interval)
+        return first, last
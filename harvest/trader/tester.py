@@ -2,6 +2,7 @@
 import datetime as dt
 from typing import Any, Dict, List, Tuple
 import os.path
+from os import makedirs
 from pathlib import Path
 
 # External libraries
@@ -12,6 +13,7 @@ import pytz
 
 # Submodule imports
 from harvest.storage import PickleStorage
+from harvest.storage.candle_file import CandleFile
 import harvest.trader.trader as trader
 from harvest.api.yahoo import YahooStreamer
 from harvest.api.paper import PaperBroker
@@ -56,9 +58,10 @@ class BackTester(trader.PaperTrader):
             'FETCH' will pull the latest data using the broker (if specified).
             'CSV' will read data from a locally saved CSV file.
             'PICKLE' will read data from a locally saved pickle file, generated using the Trader class.
+            'MMAP' will memory-map locally saved candle files, see harvest.storage.candle_file.
             defaults to 'PICKLE'.
         :param str? path: The path to the directory which backtesting data is stored.
-            This parameter must be set accordingly if 'source' is set to 'CSV' or 'PICKLE'. defaults to './data'.
+            This parameter must be set accordingly if 'source' is set to 'CSV', 'PICKLE' or 'MMAP'. defaults to './data'.
         """
 
         debugger.debug(f"Storing asset data in {path}")
@@ -72,6 +75,7 @@ class BackTester(trader.PaperTrader):
         for a in self.algo:
             a.setup()
             a.trader = self
+            a.declare_indicators()
 
         self.run_backtest()
 
@@ -110,22 +114,37 @@ class BackTester(trader.PaperTrader):
             else:
                 end = start + period
 
+        # The first and last datetime of the series whose data was only
+        # partially read
+        bounds = {}
         if source == "PICKLE":
             self.read_pickle_data()
         elif source == "CSV":
             self.read_csv_data(path)
+        elif source == "MMAP":
+            bounds = self.read_mmap_data(
+                path,
+                start if isinstance(start, dt.datetime) else None,
+                end if isinstance(end, dt.datetime) else None,
+            )
         else:
-            raise Exception(f"Invalid source {source}. Must be 'PICKLE' or 'CSV'")
+            raise Exception(
+                f"Invalid source {source}. Must be 'PICKLE', 'CSV' or 'MMAP'"
+            )
 
         common_start = None
         common_end = None
         for s in self.interval:
             for i in [self.interval[s]["interval"]] + self.interval[s]["aggregations"]:
-                df = self.storage.load(s, i, no_slice=True)
-                if common_start is None or df.index[0] > common_start:
-                    common_start = df.index[0]
-                if common_end is None or df.index[-1] < common_end:
-                    common_end = df.index[-1]
+                if (s, i) in bounds:
+                    first, last = bounds[(s, i)]
+                else:
+                    df = self.storage.load(s, i, no_slice=True)
+                    first, last = df.index[0], df.index[-1]
+                if common_start is None or first > common_start:
+                    common_start = first
+                if common_end is None or last < common_end:
+                    common_end = last
 
         if start == "PERIOD":
             start = common_end - period
@@ -147,12 +166,18 @@ class BackTester(trader.PaperTrader):
 
         print(f"Common start: {start}, common end: {end}")
 
+        # Series read from memory-mapped files are already on disk, so they
+        # are only kept in memory
+        save_pickle = source != "MMAP"
+
         for s in self.interval:
             for i in [self.interval[s]["interval"]] + self.interval[s]["aggregations"]:
-                df = self.storage.load(s, i, no_slice=True).copy()
+                # Stored dataframes are never modified in place, so the
+                # slice does not need to be copied.
+                df = self.storage.load(s, i, no_slice=True)
                 df = df.loc[start:end]
                 self.storage.reset(s, i)
-                self.storage.store(s, i, df)
+                self.storage.store(s, i, df, save_pickle=save_pickle)
 
         conv = {
             Interval.MIN_1: 1,
@@ -176,7 +201,7 @@ class BackTester(trader.PaperTrader):
                 # tmp_path = f"{path}/{sym}-{interval_txt}+{agg_txt}.pickle"
                 tmp_path = f"{path}/{sym}@{int(agg)-16}.pickle"
                 file = Path(tmp_path)
-                if file.is_file():
+                if save_pickle and file.is_file():
                     data = self.storage.open(sym, int(agg)-16)
                     self.storage.store(sym, int(agg)-16, data, save_pickle=False)
                     continue
@@ -192,7 +217,11 @@ class BackTester(trader.PaperTrader):
                     ]  # Only get recent data, since aggregating the entire df will take too long
                     agg_df = aggregate_df(df_tmp, agg)
                     self.storage.store(
-                        sym, int(agg) - 16, agg_df.iloc[[-1]], remove_duplicate=False
+                        sym,
+                        int(agg) - 16,
+                        agg_df.iloc[[-1]],
+                        remove_duplicate=False,
+                        save_pickle=save_pickle,
                     )
         debugger.debug("Formatting complete")
 
@@ -209,13 +238,13 @@ class BackTester(trader.PaperTrader):
             inter = self.interval[sym]["interval"]
             interval_txt = interval_enum_to_string(inter)
             df = self.storage.load(sym, inter, no_slice=True)
-            self.df[sym][inter] = df.copy()
+            self.df[sym][inter] = df
 
             for agg in self.interval[sym]["aggregations"]:
                 # agg_txt = interval_enum_to_string(agg)
                 # agg_txt = f"{interval_txt}+{agg_txt}"
                 df = self.storage.load(sym, int(agg) - 16, no_slice=True)
-                self.df[sym][int(agg) - 16] = df.copy()
+                self.df[sym][int(agg) - 16] = df
 
         # Trim data so start and end dates match between assets and intervals
         # data_start = pytz.utc.localize(dt.datetime(1970, 1, 1))
@@ -249,6 +278,42 @@ class BackTester(trader.PaperTrader):
                     df = self.streamer.fetch_price_history(s, i).dropna()
                 self.storage.store(s, i, df)
 
+    def read_mmap_data(self, path: str, start=None, end=None):
+        """Function to read backtesting data from memory-mapped candle files.
+
+        Each file is named {symbol}@{interval}.candles. Only the candles between
+        start and end are read from the files, and files that are missing or
+        out of date are updated with data fetched using the streamer.
+
+        :path: Path to the directory of the candle files
+        :start: The earliest datetime to read, or None to read from the beginning
+        :end: The latest datetime to read, or None to read until the end
+        :returns: A dictionary of the first and last datetime of each file,
+            keyed by symbol and interval
+        """
+        makedirs(path, exist_ok=True)
+        bounds = {}
+        for s in self.interval:
+            for i in [self.interval[s]["interval"]] + self.interval[s]["aggregations"]:
+                i_txt = interval_enum_to_string(i)
+                file = CandleFile(f"{path}/{s}@{i_txt}.candles")
+                timestamps = file.records()["timestamp"]
+                # The file is out of date if its last candle, not the last one
+                # before end, is more than a day old
+                if len(timestamps) == 0 or now() - pd.Timestamp(
+                    int(timestamps[-1]), tz="UTC"
+                ) > dt.timedelta(days=1):
+                    file.append(self.streamer.fetch_price_history(s, i).dropna())
+                    timestamps = file.records()["timestamp"]
+                if len(timestamps):
+                    bounds[(s, i)] = (
+                        pd.Timestamp(int(timestamps[0]), tz="UTC"),
+                        pd.Timestamp(int(timestamps[-1]), tz="UTC"),
+                    )
+                del timestamps
+                self.storage.store(s, i, file.read(s, start, end), save_pickle=False)
+        return bounds
+
     def read_csv_data(self, path: str, date_format: str = "%Y-%m-%d %H:%M:%S"):
         """Function to read backtesting data from a local CSV file.
 
@@ -297,10 +362,14 @@ class BackTester(trader.PaperTrader):
         common_start = self.common_start
         common_end = self.common_end
 
+        # The timestamps of the cached data as int64 nanoseconds, so that the
+        # row of each timestamp is found with a binary search.
+        epochs = {}
         counter = {}
         for s in self.interval:
             inter = self.interval[s]["interval"]
-            start_index = list(self.df[s][inter].index).index(common_start)
+            epochs[s] = self.df[s][inter].index.asi8
+            start_index = epochs[s].searchsorted(pd.Timestamp(common_start).value)
             self.interval[s]["start"] = start_index
             counter[s] = 0
 
@@ -308,33 +377,35 @@ class BackTester(trader.PaperTrader):
 
         while self.timestamp <= common_end:
 
-            df_dict = {}
+            # Row of the current timestamp in the cached data of each symbol
+            rows = {}
             for sym in self.interval:
                 inter = self.interval[sym]["interval"]
                 if is_freq(self.timestamp, inter):
                     # If data is not in the cache, skip it
-                    if self.timestamp in self.df[sym][inter].index:
-                        df_dict[sym] = self.df[sym][inter].loc[self.timestamp]
+                    row = self._position(epochs[sym], self.timestamp)
+                    if row is not None:
+                        rows[sym] = row
+
+            df_dict = {
+                sym: self.df[sym][self.interval[sym]["interval"]].iloc[row]
+                for sym, row in rows.items()
+            }
 
             update = self._update_order_queue()
             self._update_stats(df_dict, new=update, option_update=True)
 
-            for sym in self.interval:
+            for sym, row in rows.items():
                 inter = self.interval[sym]["interval"]
-                if is_freq(self.timestamp, inter):
-
-                    # If data is not in the cache, skip it
-                    if not self.timestamp in self.df[sym][inter].index:
-                        continue
-                    df = self.df[sym][inter].loc[[self.timestamp], :]
-                    self.storage.store(s, inter, df, save_pickle=False)
-                    # Add data to aggregation queue
-                    for agg in self.interval[sym]["aggregations"]:
-                        df = self.df[s][int(agg) - 16].iloc[
-                            [self.interval[sym]["start"] + counter[sym]], :
-                        ]
-                        self.storage.store(s, agg, df)
-                    counter[sym] += 1
+                df = self.df[sym][inter].iloc[[row], :]
+                self.storage.store(sym, inter, df, save_pickle=False)
+                # Add data to aggregation queue
+                for agg in self.interval[sym]["aggregations"]:
+                    df = self.df[sym][int(agg) - 16].iloc[
+                        [self.interval[sym]["start"] + counter[sym]], :
+                    ]
+                    self.storage.store(sym, agg, df, save_pickle=False)
+                counter[sym] += 1
 
             new_algo = []
             for a in self.algo:
@@ -364,6 +435,15 @@ class BackTester(trader.PaperTrader):
 
         debugger.debug(self.account)
 
+    def _position(self, epochs: np.ndarray, timestamp: dt.datetime):
+        """Returns the position of a timestamp in a sorted array of int64
+        timestamps, or None if it is not in the array."""
+        value = pd.Timestamp(timestamp).value
+        position = epochs.searchsorted(value)
+        if position < len(epochs) and epochs[position] == value:
+            return position
+        return None
+
     def _queue_update(self, new_df: pd.DataFrame, time):
         pass
 
@@ -1,5 +1,7 @@
 # Builtins
+import os
 import re
+import pickle
 import threading
 import sys
 from sys import exit
@@ -18,6 +20,7 @@ from harvest.api.paper import PaperBroker
 from harvest.storage import BaseStorage
 from harvest.storage import BaseLogger
 from harvest.server import Server
+from harvest.indicators import IndicatorEngine
 
 
 class LiveTrader:
@@ -37,8 +40,21 @@ class LiveTrader:
         Interval.DAY_1,
     ]
 
-    def __init__(self, streamer=None, broker=None, storage=None, debug=False):
-        """Initializes the Trader."""
+    def __init__(
+        self,
+        streamer=None,
+        broker=None,
+        storage=None,
+        debug=False,
+        checkpoint=None,
+        checkpoint_interval=300,
+    ):
+        """Initializes the Trader.
+
+        :checkpoint: path of the file the state of the trader is saved to
+            periodically and on exit, and restored from on start.
+        :checkpoint_interval: number of seconds between checkpoints.
+        """
 
         self._init_checks()
 
@@ -47,6 +63,8 @@ class LiveTrader:
             BaseStorage() if storage is None else storage
         )  # Initialize the storage
         self._init_attributes()
+        self.checkpoint_path = checkpoint
+        self.checkpoint_interval = checkpoint_interval
 
         self._setup_debugger(debug)
 
@@ -85,8 +103,14 @@ class LiveTrader:
         self.order_queue = []  # Queue of unfilled orders.
 
         self.logger = BaseLogger()
+        # Technical indicators updated as new data is stored
+        self.indicators = IndicatorEngine(self.storage)
         self.server = Server(self)  # Initialize the web interface server
 
+        self.checkpoint_path = None  # File the trader state is saved to
+        self.checkpoint_interval = 300
+        self.last_checkpoint = time.monotonic()
+
         self.timezone = tzlocal.get_localzone()
         debugger.debug(f"Timezone: {self.timezone}")
 
@@ -112,6 +136,11 @@ class LiveTrader:
         """
         debugger.debug("Setting up Harvest...")
 
+        # The checkpoint only restores the data and the transactions, since
+        # positions and orders may have changed while the trader was down.
+        if self.checkpoint_path is not None:
+            self.load_checkpoint()
+
         # If sync is on, call the broker to load pending orders and all positions currently held.
         if sync:
             self._setup_stats()
@@ -149,6 +178,7 @@ class LiveTrader:
         for a in self.algo:
             a.trader = self
             a.setup()
+            a.declare_indicators()
 
         debugger.debug("Setup complete")
 
@@ -243,13 +273,20 @@ class LiveTrader:
         self.account = ret
 
     def _storage_init(self):
-        """Initializes the storage."""
+        """Initializes the storage. If the storage already holds data for a symbol
+        and interval, e.g. because it is persistent or was restored from a
+        checkpoint, only the data since the last stored timestamp is fetched."""
 
         for sym in self.interval:
             for inter in [self.interval[sym]["interval"]] + self.interval[sym][
                 "aggregations"
             ]:
-                df = self.streamer.fetch_price_history(sym, inter)
+                _, last = self.storage.data_range(sym, inter)
+                if last is None:
+                    df = self.streamer.fetch_price_history(sym, inter)
+                else:
+                    df = self.streamer.fetch_price_history(sym, inter, last)
+                    debugger.debug(f"Fetched {len(df)} rows of {sym} since {last}")
                 self.storage.store(sym, inter, df)
 
     def main(self, df_dict):
@@ -288,9 +325,51 @@ class LiveTrader:
                 )
         self.algo = new_algo
 
+        if (
+            self.checkpoint_path is not None
+            and time.monotonic() - self.last_checkpoint >= self.checkpoint_interval
+        ):
+            self.save_checkpoint()
+
         self.broker.exit()
         self.streamer.exit()
 
+    def save_checkpoint(self):
+        """Saves the data in storage and the transactions to the checkpoint
+        file. Positions and orders are not saved since they are fetched from
+        the broker on start."""
+        state = {
+            "timestamp": self.timestamp,
+            "storage": self.storage.snapshot(),
+            "transactions": self.logger.get_transactions(),
+        }
+        # Write to a temporary file first so that a crash in the middle
+        # of a write does not corrupt the last checkpoint.
+        with open(self.checkpoint_path + ".tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+        self.last_checkpoint = time.monotonic()
+        debugger.debug(f"Saved checkpoint to {self.checkpoint_path}")
+
+    def load_checkpoint(self):
+        """Restores the state saved by save_checkpoint.
+
+        :returns: False if there is no checkpoint file.
+        """
+        if not os.path.isfile(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, "rb") as f:
+            state = pickle.load(f)
+
+        self.storage.restore(state["storage"])
+        # A logger with a save path already read its transactions
+        if self.logger.get_last_transaction() is None:
+            self.logger.restore(state["transactions"])
+        debugger.debug(
+            f"Restored checkpoint of {state['timestamp']} from {self.checkpoint_path}"
+        )
+        return True
+
     def _update_order_queue(self):
         """Check to see if outstanding orders have been accepted or rejected
         and update the order queue accordingly.
@@ -444,6 +523,9 @@ class LiveTrader:
     def exit(self, signum, frame):
         # TODO: Gracefully exit
         debugger.debug("\nStopping Harvest...")
+        self.logger.flush()
+        if self.checkpoint_path is not None:
+            self.save_checkpoint()
         exit(0)
 
 
@@ -452,7 +534,14 @@ class PaperTrader(LiveTrader):
     A class for trading in the paper trading environment.
     """
 
-    def __init__(self, streamer=None, storage=None, debug=False):
+    def __init__(
+        self,
+        streamer=None,
+        storage=None,
+        debug=False,
+        checkpoint=None,
+        checkpoint_interval=300,
+    ):
         """Initializes the Trader."""
 
         self._init_checks()
@@ -465,5 +554,7 @@ class PaperTrader(LiveTrader):
             BaseStorage() if storage is None else storage
         )  # Initialize the storage
         self._init_attributes()
+        self.checkpoint_path = checkpoint
+        self.checkpoint_interval = checkpoint_interval
 
         self._setup_debugger(debug)
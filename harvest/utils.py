@@ -13,6 +13,7 @@ from zoneinfo import ZoneInfo
 import pytz
 import tzlocal
 import pandas as pd
+import numpy as np
 
 logging.basicConfig(
     level=logging.INFO,
@@ -115,6 +116,20 @@ def normalize_pandas_dt_index(df: pd.DataFrame) -> pd.Index:
     return df.index.floor("min")
 
 
+def interval_to_freq(interval: Interval) -> str:
+    """
+    Returns the pandas frequency string used to bucket candles of the given interval.
+    """
+    val, unit = expand_interval(interval)
+    if unit == "SEC":
+        return f"{val}S"
+    elif unit == "MIN":
+        return f"{val}T"
+    elif unit == "HR":
+        return f"{val}H"
+    return "D"
+
+
 def aggregate_df(df, interval: Interval) -> pd.DataFrame:
     sym = df.columns[0][0]
     df = df[sym]
@@ -125,20 +140,75 @@ def aggregate_df(df, interval: Interval) -> pd.DataFrame:
         "close": "last",
         "volume": "sum",
     }
-    val, unit = expand_interval(interval)
-    val = str(val)
-    if unit == "1HR":
-        val = "H"
-    elif unit == "MIN":
-        val += "T"
-    else:
-        val = "D"
-    df = df.resample(val).agg(op_dict)
+    df = df.resample(interval_to_freq(interval)).agg(op_dict)
     df.columns = pd.MultiIndex.from_product([[sym], df.columns])
 
     return df.dropna()
 
 
+class CandleAggregator:
+    """
+    Aggregates candles into a larger interval one base candle at a time.
+
+    The aggregator keeps the open candle of the target interval and updates
+    it in O(1) for every new base candle, so the candles it produces are the
+    same as the ones aggregate_df would produce from the whole base data.
+    The last base candle may be fed again with revised values, in which case
+    its previous contribution is undone first.
+    """
+
+    fields = ["open", "high", "low", "close", "volume"]
+
+    def __init__(self, interval: Interval):
+        self.freq = interval_to_freq(interval)
+        # Timestamp of the last base candle consumed
+        self.last = None
+        # Timestamp and values of the open target candle
+        self.bucket = None
+        self.candle = None
+        # Open target candle before the last base candle was consumed
+        self._previous = (None, None)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Consumes the base candles of df that are not older than the last
+        candle consumed.
+
+        :df: a dataframe of base candles in the same format as the one taken
+            by aggregate_df
+        :returns: the target candles that changed, in the same format as
+            the one returned by aggregate_df. The last one is the open candle.
+        """
+        sym = df.columns[0][0]
+        changed = {}
+        for timestamp, row in zip(df.index, df[sym][self.fields].to_numpy()):
+            if self.last is not None:
+                if timestamp < self.last:
+                    continue
+                if timestamp == self.last:
+                    self.bucket, self.candle = self._previous
+            self._previous = (self.bucket, self.candle)
+            self.last = timestamp
+
+            bucket = timestamp.floor(self.freq)
+            if self.candle is None or bucket != self.bucket:
+                self.bucket, self.candle = bucket, row.copy()
+            else:
+                self.candle = self.candle.copy()
+                self.candle[1] = np.fmax(self.candle[1], row[1])
+                self.candle[2] = np.fmin(self.candle[2], row[2])
+                self.candle[3] = row[3]
+                self.candle[4] = self.candle[4] + row[4]
+            changed[self.bucket] = self.candle
+
+        result = pd.DataFrame(
+            list(changed.values()),
+            index=pd.DatetimeIndex(list(changed.keys()), name=df.index.name),
+            columns=pd.MultiIndex.from_product([[sym], self.fields]),
+        )
+        return result.dropna()
+
+
 def now() -> dt.datetime:
     """
     Returns the current time precise to the minute in the UTC timezone
@@ -237,7 +307,7 @@ def convert_input_to_datetime(datetime, timezone: ZoneInfo):
         raise ValueError(f"Cannot convert {datetime} to datetime.")
 
     datetime = datetime.replace(tzinfo=timezone)
-    datetime = datetime.astimezone(tz.utc)
+    return datetime.astimezone(tz.utc)
 
 
 def convert_input_to_timedelta(period):
@@ -262,10 +332,20 @@ def pandas_timestamp_to_local(df: pd.DataFrame, timezone: ZoneInfo) -> pd.DataFr
     Converts the timestamp of a dataframe to local time, represented as a
     timezone naive datetime object.
     """
-    df.index = df.index.map(lambda x: datetime_utc_to_local(x, timezone))
+    df.index = index_utc_to_local(df.index, timezone)
     return df
 
 
+def index_utc_to_local(index: pd.DatetimeIndex, timezone: ZoneInfo) -> pd.DatetimeIndex:
+    """
+    Converts a datetime index in UTC to local time, represented as timezone
+    naive datetimes. Naive indexes are assumed to be in UTC.
+    """
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    return index.tz_convert(timezone).tz_localize(None)
+
+
 def datetime_utc_to_local(datetime: dt.datetime, timezone: ZoneInfo) -> dt.datetime:
     """
     Converts a datetime object in UTC to local time, represented as a
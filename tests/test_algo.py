@@ -48,8 +48,9 @@ class TestAlgo(unittest.TestCase):
         # should return the symbol specified in the Algo class
         prices1 = algo1.get_asset_price_list()
         self.assertListEqual(
-            prices1, list(t.storage.load("A", Interval.MIN_5)["A"]["close"])
+            list(prices1), list(t.storage.load("A", Interval.MIN_5)["A"]["close"])
         )
+        self.assertFalse(prices1.flags.writeable)
 
     # PaperTrader class should be able to run algorithms at the individually specified intervals
     def test_config_interval(self):
@@ -147,6 +148,67 @@ class TestAlgo(unittest.TestCase):
 
         self.assertEqual(True, True)
 
+    def test_indicators_all(self):
+        """
+        Test that batch indicators match the indicators of each symbol.
+        """
+        streamer = DummyStreamer()
+        t = PaperTrader(streamer)
+        t.set_symbol(["A", "B", "C"])
+        t.set_algo(BaseAlgo())
+        t.start("1MIN")
+        streamer.tick()
+        algo = t.algo[0]
+
+        rsi = algo.rsi_all()
+        self.assertListEqual(sorted(rsi.index), ["A", "B", "C"])
+        self.assertEqual(rsi.shape[1], len(algo.get_asset_price_list("A")))
+        for symbol in ["A", "B", "C"]:
+            self.assertAlmostEqual(rsi.loc[symbol].iloc[-1], algo.rsi(symbol)[-1])
+            self.assertAlmostEqual(
+                algo.sma_all().loc[symbol].iloc[-1], algo.sma(symbol)[-1]
+            )
+            self.assertAlmostEqual(
+                algo.ema_all(["A", "B", "C"]).loc[symbol].iloc[-1],
+                algo.ema(symbol)[-1],
+            )
+            upper, middle, lower = algo.bbands_all(dev=2.0)
+            self.assertAlmostEqual(
+                upper.loc[symbol].iloc[-1], algo.bbands(symbol, dev=2.0)[0][-1]
+            )
+
+    def test_config_indicators(self):
+        """
+        Test that the indicators declared in config are computed together.
+        """
+
+        class Algo(BaseAlgo):
+            def config(self):
+                self.watchlist = ["A", "B"]
+                self.indicators = [
+                    {"name": "sma", "period": 20},
+                    {"name": "bbands", "period": 20, "dev": 2.0},
+                    {"name": "macd"},
+                ]
+
+        streamer = DummyStreamer()
+        t = PaperTrader(streamer)
+        t.set_algo(Algo())
+        t.start("1MIN")
+        streamer.tick()
+        algo = t.algo[0]
+
+        self.assertEqual(len(t.indicators.pipelines), 2)
+        upper, middle, lower = algo.bbands("A", period=20, dev=2.0)
+        self.assertAlmostEqual(middle[-1], algo.sma("A", period=20)[-1])
+        line, signal = algo.macd("A")
+        expected_line, expected_signal = algo.macd(
+            prices=algo.get_asset_price_list("A")
+        )
+        self.assertAlmostEqual(line[-1], expected_line[-1])
+        self.assertAlmostEqual(signal[-1], expected_signal[-1])
+        self.assertEqual(t.indicators.cache_info()["misses"], 1)
+
     def test_get_asset_quantity(self):
         s = DummyStreamer()
         t = PaperTrader(s)
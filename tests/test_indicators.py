@@ -0,0 +1,237 @@
+# Builtins
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from harvest import indicators
+from harvest.indicators import SMA, EMA, RSI, BBands, MACD, Pipeline, IndicatorEngine
+from harvest.storage import BaseStorage
+from harvest.utils import *
+
+
+def expected(name: str, prices, period: int = 14, dev: float = 1.0) -> np.ndarray:
+    """
+    Computes an indicator over the whole series with pandas.
+    """
+    close = pd.Series(np.asarray(prices, dtype=np.float64))
+    if name == "sma":
+        return close.rolling(period).mean().to_numpy()[:, None]
+    if name == "ema":
+        return close.ewm(span=period).mean().to_numpy()[:, None]
+    if name == "rsi":
+        delta = close.diff()
+        gain = delta.clip(lower=0).ewm(alpha=1 / period).mean()
+        loss = (-delta).clip(lower=0).ewm(alpha=1 / period).mean()
+        return (100 - 100 / (1 + gain / loss)).to_numpy()[:, None]
+    middle = close.rolling(period).mean()
+    std = close.rolling(period).std()
+    return np.column_stack([middle + dev * std, middle, middle - dev * std])
+
+
+class TestIndicators(unittest.TestCase):
+    def test_match_pandas(self):
+        prices = 100 + np.cumsum(np.random.randn(300))
+        for name, indicator in [
+            ("sma", SMA(14)),
+            ("ema", EMA(14)),
+            ("rsi", RSI(14)),
+            ("bbands", BBands(14, 2.0)),
+        ]:
+            values = np.array([indicator.update(price) for price in prices])
+            np.testing.assert_allclose(
+                values, expected(name, prices, 14, 2.0), rtol=1e-9, equal_nan=True
+            )
+
+    def test_revert(self):
+        prices = 100 + np.cumsum(np.random.randn(300))
+        specs = (
+            ("sma", (("period", 14),)),
+            ("bbands", (("dev", 2.0), ("period", 14))),
+            ("macd", (("fast", 12), ("signal", 9), ("slow", 26))),
+        )
+        for make in [
+            lambda: SMA(14),
+            lambda: EMA(14),
+            lambda: RSI(14),
+            lambda: BBands(14, 2.0),
+            lambda: MACD(12, 26, 9),
+            lambda: Pipeline(specs),
+        ]:
+            indicator, revised = make(), make()
+            values = []
+            for price in prices:
+                # Each data point is first added with a wrong value
+                revised.update(price * 2)
+                revised.revert()
+                values.append(revised.update(price))
+            np.testing.assert_allclose(
+                np.array(values),
+                np.array([indicator.update(price) for price in prices]),
+                rtol=1e-9,
+                equal_nan=True,
+            )
+
+    def test_pipeline(self):
+        prices = 100 + np.cumsum(np.random.randn(300))
+        specs = (
+            ("sma", (("period", 14),)),
+            ("bbands", (("dev", 2.0), ("period", 14))),
+            ("ema", (("period", 12),)),
+            ("macd", (("fast", 12), ("signal", 9), ("slow", 26))),
+        )
+        pipeline = Pipeline(specs)
+        # The rolling mean and the EMA of period 12 are shared
+        self.assertEqual(len(pipeline.nodes), 8)
+        self.assertEqual(len(pipeline.outputs), 7)
+
+        values = np.array([pipeline.update(price) for price in prices])
+        macd = MACD(12, 26, 9)
+        line, signal = indicators.macd(prices, 12, 26, 9)
+        np.testing.assert_allclose(
+            np.array([macd.update(price) for price in prices]),
+            np.column_stack([line, signal]),
+            rtol=1e-9,
+        )
+        np.testing.assert_allclose(
+            values,
+            np.column_stack(
+                [
+                    expected("sma", prices, 14),
+                    expected("bbands", prices, 14, 2.0),
+                    expected("ema", prices, 12),
+                    line,
+                    signal,
+                ]
+            ),
+            rtol=1e-9,
+            equal_nan=True,
+        )
+
+    def test_declare(self):
+        storage = BaseStorage(queue_size=100)
+        engine = IndicatorEngine(storage)
+        engine.declare("A", Interval.MIN_1, "sma", period=5)
+        engine.declare("A", Interval.MIN_1, "bbands", period=5)
+        engine.declare("A", Interval.MIN_1, "bbands", period=5, dev=1.0)
+        self.assertEqual(len(engine.pipelines[("A", Interval.MIN_1, "close")]), 2)
+
+        data = gen_data("A", 200)
+        storage.store("A", Interval.MIN_1, data.iloc[:50])
+        for i in range(50, 200):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]])
+            middle = engine.compute("A", Interval.MIN_1, "bbands", period=5)[:, 1]
+            sma = engine.compute("A", Interval.MIN_1, "sma", period=5)[:, 0]
+            np.testing.assert_allclose(middle, sma, rtol=1e-9, equal_nan=True)
+
+        # The declared indicators are computed once per data point
+        info = engine.cache_info()
+        self.assertEqual(info["misses"], 150)
+        self.assertEqual(info["hits"], 150)
+        np.testing.assert_allclose(
+            engine.compute("A", Interval.MIN_1, "bbands", period=5),
+            expected("bbands", data["A"]["close"], 5)[-100:],
+            rtol=1e-9,
+        )
+
+        # Indicators that are not declared have their own stream, computed
+        # over the data points held by the storage
+        values = engine.compute("A", Interval.MIN_1, "ema", period=5)
+        np.testing.assert_allclose(
+            values, expected("ema", data["A"]["close"][-100:], 5), rtol=1e-9
+        )
+
+    def test_kernels(self):
+        prices = 100 + np.cumsum(np.random.randn(3, 300), axis=1)
+        # A symbol whose series starts later
+        prices[2, :40] = np.nan
+        for name in ["sma", "ema", "rsi", "bbands"]:
+            params = {"dev": 2.0} if name == "bbands" else {}
+            batch = getattr(indicators, name)(prices, 14, **params)
+            single = getattr(indicators, name)(prices[0], 14, **params)
+            if name == "bbands":
+                batch, single = np.stack(batch, axis=-1), np.column_stack(single)
+            else:
+                batch, single = batch[..., None], single[:, None]
+            np.testing.assert_allclose(single, batch[0], equal_nan=True)
+            for i in range(len(prices)):
+                np.testing.assert_allclose(
+                    batch[i],
+                    expected(name, prices[i], 14, 2.0),
+                    rtol=1e-9,
+                    equal_nan=True,
+                )
+
+        close = pd.Series(prices[0])
+        line, signal = indicators.macd(prices[0])
+        expected_line = close.ewm(span=12).mean() - close.ewm(span=26).mean()
+        np.testing.assert_allclose(line, expected_line, rtol=1e-9)
+        np.testing.assert_allclose(signal, expected_line.ewm(span=9).mean(), rtol=1e-9)
+
+        high, low = close + 1, close - np.random.rand(300)
+        volume = pd.Series(np.random.rand(300) * 1000)
+        ranges = pd.concat(
+            [high - low, (high - close.shift()).abs(), (close.shift() - low).abs()],
+            axis=1,
+        ).max(axis=1)
+        np.testing.assert_allclose(
+            indicators.atr(high, low, close, 14),
+            ranges.rolling(14).mean(),
+            rtol=1e-9,
+            equal_nan=True,
+        )
+        typical = (high + low + close) / 3
+        np.testing.assert_allclose(
+            indicators.vwap(high, low, close, volume),
+            (volume * typical).cumsum() / volume.cumsum(),
+            rtol=1e-9,
+        )
+
+    def test_engine(self):
+        storage = BaseStorage(queue_size=100)
+        engine = IndicatorEngine(storage)
+        data = gen_data("A", 200)
+        storage.store("A", Interval.MIN_1, data.iloc[:50])
+        self.assertEqual(len(engine.compute("A", Interval.MIN_1, "sma", period=5)), 50)
+
+        for i in range(50, 200):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]])
+            values = engine.compute("A", Interval.MIN_1, "ema", period=5)
+            engine.compute("A", Interval.MIN_1, "sma", period=5)
+        np.testing.assert_allclose(
+            values, expected("ema", data["A"]["close"], 5)[-100:], rtol=1e-9
+        )
+        values = engine.compute("A", Interval.MIN_1, "sma", period=5)
+        np.testing.assert_allclose(
+            values, expected("sma", data["A"]["close"], 5)[-100:], rtol=1e-9
+        )
+
+        # Calls made before a new data point is stored share the values
+        self.assertIs(engine.compute("A", Interval.MIN_1, "sma", period=5), values)
+        self.assertFalse(values.flags.writeable)
+        info = engine.cache_info()
+        self.assertEqual(info["hits"], 2)
+        self.assertEqual(info["misses"], 301)
+        self.assertEqual(info["entries"], 2)
+
+        # Revising the last data point replaces its value
+        revised = data.iloc[[-1]].copy(True)
+        revised["A", "close"] = 2.0
+        storage.store("A", Interval.MIN_1, revised)
+        prices = data["A"]["close"].to_numpy().copy()
+        prices[-1] = 2.0
+        values = engine.compute("A", Interval.MIN_1, "ema", period=5)
+        np.testing.assert_allclose(values, expected("ema", prices, 5)[-100:], rtol=1e-9)
+
+        # Resetting the series rebuilds the indicator
+        storage.reset("A", Interval.MIN_1)
+        self.assertIsNone(engine.compute("A", Interval.MIN_1, "ema", period=5))
+        storage.store("A", Interval.MIN_1, data.iloc[:20])
+        values = engine.compute("A", Interval.MIN_1, "ema", period=5)
+        np.testing.assert_allclose(
+            values, expected("ema", data["A"]["close"][:20], 5), rtol=1e-9
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+# Builtins
+import os
+import unittest
+import datetime as dt
+
+import pandas as pd
+
+from harvest.storage import BaseLogger
+
+
+class TestBaseLogger(unittest.TestCase):
+    def test_add_transaction(self):
+        logger = BaseLogger()
+        self.assertIsNone(logger.get_last_transaction())
+        self.assertTrue(logger.get_transactions().empty)
+
+        timestamp = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+        logger.add_transaction(timestamp, "buy", "stock", "A", 1)
+        logger.add_transaction(timestamp, "sell", "stock", "A", 1)
+
+        transactions = logger.get_transactions()
+        self.assertEqual(
+            list(transactions.columns),
+            ["action", "asset_type", "symbol", "timestamp", "price"],
+        )
+        self.assertEqual(list(transactions["action"]), ["buy", "sell"])
+        self.assertEqual(logger.get_last_transaction()["action"], "sell")
+        # The dataframe is only rebuilt when a transaction was added
+        self.assertIs(logger.get_transactions(), transactions)
+
+    def test_persist(self):
+        path = "test_transactions.jsonl"
+        timestamp = pd.Timestamp("2021-01-01", tz="UTC")
+        logger = BaseLogger(path)
+        logger.add_transaction(timestamp, "buy", "crypto", "@BTC", 0.5)
+        logger.flush()
+
+        logger = BaseLogger(path)
+        last = logger.get_last_transaction()
+        self.assertEqual(last["symbol"], "@BTC")
+        self.assertEqual(last["price"], 0.5)
+        self.assertEqual(last["timestamp"], timestamp)
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
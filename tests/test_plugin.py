@@ -6,7 +6,7 @@ from harvest.plugin._base import Plugin
 
 class TestPlugin(unittest.TestCase):
     def test_init(self):
-        plugin = Plugin("my_plugin", ["pandas", "finta", "yaml"])
+        plugin = Plugin("my_plugin", ["pandas", "numpy", "yaml"])
         self.assertEqual(plugin.name, "my_plugin")
 
 
@@ -1,10 +1,12 @@
 # Builtins
 import unittest
+import threading
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
 from harvest.storage import BaseStorage
+from harvest.storage.base_storage import RWLock
 from harvest.utils import *
 
 
@@ -104,6 +106,181 @@ class TestBaseStorage(unittest.TestCase):
         self.assertTrue(not pd.isnull(loaded_data.iloc[0]["A"]["low"]))
         assert_frame_equal(loaded_data, data.iloc[:25].append(data.iloc[75:]))
 
+    def test_aggregate(self):
+        storage = BaseStorage()
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:50])
+        storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+        for i in range(50, 100):
+            storage.store("A", Interval.MIN_1, data.copy(True).iloc[[i]])
+            storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+        loaded_data = storage.load("A", Interval.MIN_5)
+
+        assert_frame_equal(
+            loaded_data, aggregate_df(data, Interval.MIN_5), check_freq=False
+        )
+
+    def test_rwlock(self):
+        lock = RWLock()
+        acquired = threading.Event()
+
+        def write():
+            with lock.write():
+                acquired.set()
+
+        with lock.read():
+            # Several readers can hold the lock at once
+            with lock.read():
+                pass
+            writer = threading.Thread(target=write)
+            writer.start()
+            self.assertFalse(acquired.wait(0.1))
+        writer.join(1)
+        self.assertTrue(acquired.is_set())
+
+    def test_load_while_other_series_written(self):
+        storage = BaseStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        storage.store("B", Interval.MIN_1, gen_data("B", 50))
+
+        result = []
+        with storage._series_lock("B", Interval.MIN_1).write():
+            reader = threading.Thread(
+                target=lambda: result.append(storage.load("A", Interval.MIN_1))
+            )
+            reader.start()
+            reader.join(1)
+            self.assertEqual(len(result), 1)
+
+        assert_frame_equal(result[0], data)
+
+    def test_snapshot_restore(self):
+        storage = BaseStorage(queue_size=20)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        storage2 = BaseStorage(queue_size=20)
+        storage2.restore(storage.snapshot())
+        assert_frame_equal(storage2.load("A", Interval.MIN_1), data.iloc[-20:])
+
+    def test_load_last_asof(self):
+        storage = BaseStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        assert_frame_equal(storage.load_last("A", Interval.MIN_1, 5), data.iloc[-5:])
+        assert_frame_equal(
+            storage.load_asof("A", Interval.MIN_1, data.index[10]), data.iloc[10:11]
+        )
+        assert_frame_equal(
+            storage.load_asof(
+                "A", Interval.MIN_1, data.index[10] + dt.timedelta(seconds=30)
+            ),
+            data.iloc[10:11],
+        )
+        self.assertIsNone(
+            storage.load_asof(
+                "A", Interval.MIN_1, data.index[0] - dt.timedelta(minutes=1)
+            )
+        )
+        # Naive datetimes are compared in the timezone of the data
+        start = data.index[10].tz_convert(None)
+        assert_frame_equal(storage.load("A", Interval.MIN_1, start), data.iloc[10:])
+
+    def test_load_array_local(self):
+        storage = BaseStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        prices = storage.load_array("A", Interval.MIN_1, "close")
+        self.assertListEqual(list(prices), list(data["A"]["close"]))
+        self.assertFalse(prices.flags.writeable)
+        self.assertEqual(len(storage.load_array("A", Interval.MIN_1, "close", 5)), 5)
+
+        timezone = ZoneInfo("America/New_York")
+        version = storage.version("A", Interval.MIN_1)
+        local = storage.load_local("A", Interval.MIN_1, timezone)
+        expected = data.index.tz_convert(timezone).tz_localize(None)
+        self.assertTrue(local.index.equals(expected))
+        self.assertIs(
+            storage.load_local("A", Interval.MIN_1, timezone).index, local.index
+        )
+        # The stored data is not modified
+        self.assertTrue(storage.load("A", Interval.MIN_1).index.equals(data.index))
+
+        new = gen_data("A", 1)
+        new.index = new.index + dt.timedelta(hours=1)
+        storage.store("A", Interval.MIN_1, new)
+        self.assertGreater(storage.version("A", Interval.MIN_1), version)
+        local = storage.load_local("A", Interval.MIN_1, timezone)
+        self.assertEqual(
+            local.index[-1], new.index[0].tz_convert(timezone).tz_localize(None)
+        )
+        self.assertTrue(
+            storage.load_local("A", Interval.MIN_1, timezone, 1).index.equals(
+                local.index[-1:]
+            )
+        )
+
+    def test_memory_budget(self):
+        storage = BaseStorage()
+        storage.store("A", Interval.MIN_1, gen_data("A", 50))
+        size = storage.memory_info()["bytes"]
+        self.assertEqual(storage.memory_info()["series"], {("A", Interval.MIN_1): size})
+
+        storage.memory_budget = 2 * size
+        storage.store("B", Interval.MIN_1, gen_data("B", 50))
+        # Accessing A makes B the least recently used series
+        storage.load("A", Interval.MIN_1)
+        storage.store("C", Interval.MIN_1, gen_data("C", 50))
+
+        info = storage.memory_info()
+        self.assertEqual(
+            set(info["series"]), {("A", Interval.MIN_1), ("C", Interval.MIN_1)}
+        )
+        self.assertEqual(info["bytes"], 2 * size)
+        self.assertEqual(info["evictions"], 1)
+        self.assertIsNone(storage.load("B", Interval.MIN_1))
+
+    def test_load_panel(self):
+        storage = BaseStorage()
+        data_a = gen_data("A", 10)
+        # B misses the first two and the fifth timestamps of A
+        data_b = gen_data("B", 10).iloc[2:].drop(data_a.index[4])
+        storage.store("A", Interval.MIN_1, data_a.copy(True))
+        storage.store("B", Interval.MIN_1, data_b.copy(True))
+
+        index, values = storage.load_panel(["A", "B"], Interval.MIN_1, ["close"])
+        self.assertTrue(index.equals(data_a.index))
+        self.assertEqual(values.shape, (2, 10, 1))
+        self.assertListEqual(list(values[0, :, 0]), list(data_a["A"]["close"]))
+        self.assertTrue(np.isnan(values[1, [0, 1, 4], 0]).all())
+        self.assertEqual(values[1, 5, 0], data_b["B"]["close"].iloc[2])
+
+        index, values = storage.load_panel(
+            ["A", "B"], Interval.MIN_1, ["close"], fill="ffill"
+        )
+        self.assertTrue(np.isnan(values[1, [0, 1], 0]).all())
+        self.assertEqual(values[1, 4, 0], values[1, 3, 0])
+
+        df = storage.load_panel(
+            ["A", "B"], Interval.MIN_1, start=data_a.index[5], as_frame=True
+        )
+        self.assertEqual(df.shape, (5, 10))
+        assert_frame_equal(
+            df["A"], data_a["A"].iloc[5:][df["A"].columns], check_freq=False
+        )
+
+        # No symbols, or symbols without data, give an empty panel
+        index, values = storage.load_panel([], Interval.MIN_1)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(values.shape, (0, 0, 5))
+        index, values = storage.load_panel(["C"], Interval.MIN_1, ["close"])
+        self.assertEqual(values.shape, (1, 0, 1))
+        df = storage.load_panel(["C"], Interval.MIN_1, as_frame=True)
+        self.assertEqual(df.shape, (0, 5))
+
     # def test_agg_load(self):
     #     storage = BaseStorage()
     #     data = gen_data("A", 100)
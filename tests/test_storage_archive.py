@@ -0,0 +1,83 @@
+# Builtins
+import os
+import shutil
+import pathlib
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage import ArchiveStorage, BaseStorage
+from harvest.storage.archive_storage import (
+    encode,
+    decode,
+    export_archive,
+    import_archive,
+)
+from harvest.utils import *
+
+
+class TestArchiveStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_archive_data"
+
+    def test_encode_decode(self):
+        data = gen_data("A", 50)
+        data.iloc[3, 0] = np.nan
+        assert_frame_equal(decode(encode(data, "zlib")), data)
+        assert_frame_equal(decode(encode(data.iloc[:1])), data.iloc[:1])
+        assert_frame_equal(decode(encode(data.iloc[:0])), data.iloc[:0])
+
+    def test_compression(self):
+        index = pd.date_range(
+            "2021-01-01", periods=10000, freq="1min", tz="UTC", name="timestamp"
+        )
+        price = np.round(100 + np.cumsum(np.random.randn(10000) * 0.05), 2)
+        data = pd.DataFrame(
+            {
+                "open": price,
+                "high": np.round(price + 0.01, 2),
+                "low": np.round(price - 0.01, 2),
+                "close": price,
+                "volume": np.random.randint(0, 1000, 10000).astype(float),
+            },
+            index=index,
+        )
+        data.columns = pd.MultiIndex.from_product([["A"], data.columns])
+
+        encoded = encode(data)
+        assert_frame_equal(decode(encoded), data, check_freq=False)
+        # Prices in cents and evenly spaced timestamps take about 3 bytes
+        # per value
+        self.assertLess(len(encoded), data.size * 4)
+
+    def test_saved_load(self):
+        storage1 = ArchiveStorage(self.storage_dir)
+        data = gen_data("A", 50)
+        storage1.store("A", Interval.MIN_1, data.copy(True))
+        self.assertTrue(os.path.isfile(f"{self.storage_dir}/A@1MIN.hca"))
+
+        storage2 = ArchiveStorage(self.storage_dir)
+        assert_frame_equal(storage2.load("A", Interval.MIN_1), data)
+
+    def test_export_import(self):
+        storage1 = BaseStorage()
+        data = gen_data("B", 50)
+        storage1.store("B", Interval.MIN_5, data.copy(True))
+        export_archive(storage1, self.storage_dir + "_export")
+
+        storage2 = BaseStorage()
+        import_archive(storage2, self.storage_dir + "_export")
+        assert_frame_equal(storage2.load("B", Interval.MIN_5), data)
+        shutil.rmtree(pathlib.Path(self.storage_dir + "_export"))
+
+    @classmethod
+    def tearDownClass(self):
+        path = pathlib.Path(self.storage_dir)
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
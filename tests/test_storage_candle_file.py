@@ -0,0 +1,62 @@
+# Builtins
+import os
+import shutil
+import pathlib
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage.candle_file import CandleFile
+from harvest.utils import *
+
+
+class TestCandleFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_candle_data"
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    def _data(self, points):
+        data = gen_data("A", points)
+        return data[[("A", f) for f in CandleFile.fields]]
+
+    def test_write_read(self):
+        file = CandleFile(f"{self.storage_dir}/A@1MIN.candles")
+        data = self._data(50)
+        file.write(data)
+
+        self.assertIsInstance(file.records(), np.memmap)
+        assert_frame_equal(file.read("A"), data)
+
+    def test_read_range(self):
+        file = CandleFile(f"{self.storage_dir}/B@1MIN.candles")
+        data = self._data(50)
+        file.write(data)
+        start, end = data.index[10], data.index[20]
+
+        assert_frame_equal(file.read("A", start, end), data.loc[start:end])
+
+    def test_append(self):
+        file = CandleFile(f"{self.storage_dir}/C@1MIN.candles")
+        data = self._data(50)
+        file.append(data.iloc[:30])
+        size = os.path.getsize(file.path)
+        file.append(data.iloc[30:])
+
+        # New candles are appended without rewriting the existing ones
+        self.assertEqual(
+            os.path.getsize(file.path), size + 20 * CandleFile.dtype.itemsize
+        )
+        # Overlapping candles are merged
+        file.append(data.iloc[20:40])
+        assert_frame_equal(file.read("A"), data)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(pathlib.Path(self.storage_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
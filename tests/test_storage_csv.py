@@ -39,6 +39,18 @@ class TestCSVStorage(unittest.TestCase):
 
         assert_frame_equal(loaded_data, data)
 
+    def test_lazy_load(self):
+        storage1 = CSVStorage(self.storage_dir)
+        data = gen_data("C", 50)
+        storage1.store("C", Interval.MIN_1, data.copy(True))
+
+        storage2 = CSVStorage(self.storage_dir)
+        self.assertNotIn("C", storage2.storage)
+        self.assertIn(Interval.MIN_1, storage2.catalog["C"])
+        storage2.load("C", Interval.MIN_1)
+        self.assertIn("C", storage2.storage)
+        self.assertNotIn("C", storage2.catalog)
+
     @classmethod
     def tearDownClass(self):
         path = pathlib.Path(self.storage_dir)
@@ -1,12 +1,13 @@
 # Builtins
 import os
 import unittest
+import datetime as dt
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
 from harvest.storage.database_storage import DBStorage
-from harvest.utils import gen_data
+from harvest.utils import gen_data, Interval
 
 
 class TestDBStorage(unittest.TestCase):
@@ -37,6 +38,131 @@ class TestDBStorage(unittest.TestCase):
 
         self.assertTrue(loaded_data is None)
 
+    def test_upsert(self):
+        storage = DBStorage("sqlite:///foo.db", batch_size=7)
+        data = gen_data("B", 50)
+        original = data.copy(True)
+        storage.store("B", "1MIN", data)
+        # The caller's dataframe is not modified
+        assert_frame_equal(data, original)
+
+        # Storing rows again updates them instead of failing or duplicating
+        new_data = data.copy(True)
+        new_data["B", "close"] = 2.0
+        storage.store("B", "1MIN", new_data.iloc[-20:])
+        loaded_data = storage.load("B", "1MIN")
+
+        self.assertEqual(len(loaded_data), 50)
+        self.assertTrue((loaded_data["B"]["close"].iloc[-20:] == 2.0).all())
+        assert_frame_equal(
+            loaded_data.iloc[:30].sort_index(axis=1),
+            data.iloc[:30].sort_index(axis=1),
+        )
+
+    def test_copy_buffer(self):
+        storage = DBStorage("sqlite:///foo.db")
+        data = gen_data("A", 5)
+        buffer = storage._copy_buffer(storage._rows("A", Interval.MIN_1, data))
+        lines = buffer.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 5)
+        symbol, interval, timestamp = lines[0].split(",")[:3]
+        self.assertEqual(symbol, "A")
+        # Intervals are keyed by their value, as in the upsert statements
+        self.assertEqual(interval, str(Interval.MIN_1.value))
+        self.assertEqual(
+            pd.Timestamp(timestamp), data.index[0].tz_convert("UTC").tz_localize(None)
+        )
+        self.assertNotIn("+", timestamp)
+
+    def test_load_range(self):
+        storage = DBStorage("sqlite:///foo.db")
+        data = gen_data("C", 50)
+        storage.store("C", "1MIN", data.copy(True))
+        storage.store("C", "5MIN", gen_data("C", 10))
+
+        loaded_data = storage.load("C", "1MIN", data.index[10], data.index[19])
+        assert_frame_equal(
+            loaded_data.sort_index(axis=1), data.iloc[10:20].sort_index(axis=1)
+        )
+        self.assertEqual(len(storage.load("C", "5MIN")), 10)
+        self.assertEqual(
+            storage.data_range("C", "1MIN"), (data.index[0], data.index[-1])
+        )
+
+        storage.reset("C", "5MIN")
+        self.assertIsNone(storage.load("C", "5MIN"))
+        self.assertEqual(len(storage.load("C", "1MIN")), 50)
+
+    def test_load_last(self):
+        storage = DBStorage("sqlite:///foo.db")
+        data = gen_data("D", 50)
+        storage.store("D", "1MIN", data.copy(True))
+
+        loaded_data = storage.load_last("D", "1MIN", 5)
+        assert_frame_equal(
+            loaded_data.sort_index(axis=1), data.iloc[-5:].sort_index(axis=1)
+        )
+
+    def test_cache(self):
+        storage = DBStorage("sqlite:///foo.db", queue_size=20)
+        data = gen_data("E", 50)
+        storage.store("E", "1MIN", data.copy(True))
+
+        # Reads covered by the cached window do not query the database
+        storage.load("E", "1MIN", data.index[-10])
+        storage.load_last("E", "1MIN", 5)
+        self.assertEqual(storage.cache_info()["hits"], 2)
+        self.assertEqual(storage.cache_info()["misses"], 0)
+
+        # Reads before the window are served by the database
+        loaded_data = storage.load("E", "1MIN")
+        self.assertEqual(len(loaded_data), 50)
+        self.assertEqual(storage.cache_info()["misses"], 1)
+
+        # A new storage reads the latest window from the database
+        storage2 = DBStorage("sqlite:///foo.db", queue_size=20)
+        assert_frame_equal(
+            storage2.load("E", "1MIN", data.index[-20]).sort_index(axis=1),
+            data.iloc[-20:].sort_index(axis=1),
+        )
+        self.assertEqual(storage2.cache_info()["hits"], 1)
+
+    def test_cache_eviction(self):
+        storage = DBStorage("sqlite:///foo.db")
+        storage.store("F", "1MIN", gen_data("F", 50))
+        size = storage.cache_info()["bytes"]
+
+        storage.memory_budget = size
+        storage.store("G", "1MIN", gen_data("G", 50))
+        self.assertEqual(storage.cache_info()["series"], 1)
+        self.assertNotIn("F", storage.storage)
+        self.assertEqual(len(storage.load("F", "1MIN")), 50)
+        self.assertNotIn("G", storage.storage)
+
+    def test_write_behind(self):
+        storage = DBStorage("sqlite:///foo.db", write_behind=True, flush_interval=60)
+        data = gen_data("H", 50)
+        storage.store("H", "1MIN", data.copy(True))
+        self.assertEqual(len(storage.pending), 1)
+        self.assertIsNone(DBStorage("sqlite:///foo.db").load("H", "1MIN"))
+
+        storage.flush()
+        self.assertEqual(storage.pending, [])
+        loaded_data = DBStorage("sqlite:///foo.db").load("H", "1MIN")
+        assert_frame_equal(loaded_data.sort_index(axis=1), data.sort_index(axis=1))
+
+        # Closing the storage writes the pending rows and stops the thread
+        thread = storage.flush_thread
+        new = gen_data("H", 1)
+        new.index = new.index + dt.timedelta(hours=1)
+        storage.store("H", "1MIN", new)
+        storage.close()
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(storage.flush_thread)
+        self.assertEqual(storage.pending, [])
+        self.assertEqual(len(DBStorage("sqlite:///foo.db").load("H", "1MIN")), 51)
+
     @classmethod
     def tearDownClass(self):
         if os.path.exists(self.db_file):
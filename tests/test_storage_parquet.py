@@ -0,0 +1,70 @@
+# Builtins
+import shutil
+import pathlib
+import unittest
+from os import listdir
+from os.path import join
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage.parquet_storage import ParquetStorage
+from harvest.utils import *
+
+
+class TestParquetStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_parquet_data"
+
+    def tearDown(self):
+        shutil.rmtree(pathlib.Path(self.storage_dir), ignore_errors=True)
+
+    def test_create_storage(self):
+        storage = ParquetStorage(self.storage_dir)
+
+        self.assertEqual(storage.storage, {})
+
+    def test_saved_load(self):
+        storage1 = ParquetStorage(self.storage_dir)
+        data = gen_data("A", 50)
+        storage1.store("A", Interval.MIN_1, data.iloc[:25].copy(True))
+        storage1.store("A", Interval.MIN_1, data.iloc[25:].copy(True))
+
+        storage2 = ParquetStorage(self.storage_dir)
+        loaded_data = storage2.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data)
+
+    def test_append_only(self):
+        storage = ParquetStorage(self.storage_dir)
+        data = gen_data("A", 10)
+        for i in range(10):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]].copy(True))
+        # Every store adds a part file holding only the new candle
+        parts = [
+            p
+            for d in storage._partitions("A", Interval.MIN_1)
+            for p in storage._parts("A", Interval.MIN_1, d)
+        ]
+        self.assertEqual(len(parts), 10)
+
+        storage.compact("A", Interval.MIN_1)
+        for date in storage._partitions("A", Interval.MIN_1):
+            self.assertEqual(len(storage._parts("A", Interval.MIN_1, date)), 1)
+        assert_frame_equal(storage.open("A", Interval.MIN_1), data)
+
+    def test_load_outside_window(self):
+        storage = ParquetStorage(self.storage_dir, queue_size=20)
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        start, end = data.index[10], data.index[30]
+
+        # Only the last 20 candles are in memory, the rest are read from disk
+        self.assertEqual(len(storage.load("A", Interval.MIN_1)), 20)
+        loaded_data = storage.load("A", Interval.MIN_1, start, end)
+        assert_frame_equal(loaded_data, data.loc[start:end])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,11 @@
 # Builtins
+import os
+import time
+import threading
 import shutil
 import pathlib
 import unittest
+import datetime as dt
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
@@ -47,6 +51,123 @@ class TestCSVStorage(unittest.TestCase):
         loaded_data = storage.open("A", Interval.MIN_1)
         assert_frame_equal(loaded_data, data)
 
+    def test_lazy_load(self):
+        storage_dir = self.storage_dir + "_lazy"
+        storage1 = PickleStorage(storage_dir)
+        data = gen_data("A", 50)
+        storage1.store("A", Interval.MIN_1, data.copy(True))
+        storage1.store("B", Interval.MIN_1, gen_data("B", 50))
+
+        # The series are only read when they are first accessed
+        storage2 = PickleStorage(storage_dir)
+        self.assertEqual(storage2.storage, {})
+        self.assertEqual(
+            storage2.catalog, {"A": {Interval.MIN_1}, "B": {Interval.MIN_1}}
+        )
+        assert_frame_equal(storage2.load("A", Interval.MIN_1), data)
+        self.assertEqual(list(storage2.storage.keys()), ["A"])
+        self.assertEqual(storage2.catalog, {"B": {Interval.MIN_1}})
+
+        # Storing to a series in the catalog merges with the saved data
+        new_data = gen_data("B", 10)
+        new_data.index = new_data.index + dt.timedelta(hours=1)
+        storage2.store("B", Interval.MIN_1, new_data)
+        self.assertEqual(len(storage2.load("B", Interval.MIN_1)), 60)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
+    def test_evict_idle(self):
+        storage_dir = self.storage_dir + "_evict"
+        storage = PickleStorage(storage_dir, evict_after=60)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        storage.evict_idle(0)
+        self.assertEqual(storage.storage, {})
+        self.assertEqual(storage.catalog, {"A": {Interval.MIN_1}})
+        assert_frame_equal(storage.load("A", Interval.MIN_1), data)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
+    def test_memory_budget(self):
+        storage_dir = self.storage_dir + "_budget"
+        storage = PickleStorage(storage_dir)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        storage.memory_budget = storage.memory_info()["bytes"]
+
+        storage.store("B", Interval.MIN_1, gen_data("B", 50))
+        # A is demoted to the catalog and read back from its file
+        self.assertNotIn("A", storage.storage)
+        self.assertEqual(storage.catalog, {"A": {Interval.MIN_1}})
+        assert_frame_equal(storage.load("A", Interval.MIN_1), data)
+        self.assertNotIn("B", storage.storage)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
+    def test_wal_store(self):
+        storage_dir = self.storage_dir + "_wal"
+        storage1 = PickleStorage(storage_dir, wal=True, compact_rows=1000)
+        data = gen_data("A", 50)
+        for i in range(50):
+            storage1.store("A", Interval.MIN_1, data.iloc[[i]].copy(True))
+
+        # Only the log is written, the pickle file is not created until compaction
+        self.assertFalse(os.path.isfile(f"{storage_dir}/A@1MIN.pickle"))
+        self.assertTrue(os.path.isfile(f"{storage_dir}/A@1MIN.wal"))
+
+        # The rows of the log are only counted once the series is read
+        storage2 = PickleStorage(storage_dir, wal=True)
+        self.assertNotIn(("A", Interval.MIN_1), storage2.log_rows)
+        assert_frame_equal(storage2.load("A", Interval.MIN_1), data)
+        self.assertEqual(storage2.log_rows[("A", Interval.MIN_1)], 50)
+
+        storage1.compact("A", Interval.MIN_1)
+        self.assertFalse(os.path.isfile(f"{storage_dir}/A@1MIN.wal"))
+        assert_frame_equal(pd.read_pickle(f"{storage_dir}/A@1MIN.pickle"), data)
+
+        storage3 = PickleStorage(storage_dir, wal=True)
+        assert_frame_equal(storage3.load("A", Interval.MIN_1), data)
+        self.assertEqual(storage3.log_rows[("A", Interval.MIN_1)], 0)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
+    def test_wal_background_compaction(self):
+        storage_dir = self.storage_dir + "_compact"
+        storage = PickleStorage(storage_dir, wal=True, compact_rows=10)
+        data = gen_data("A", 25)
+        for i in range(25):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]].copy(True))
+        for _ in range(100):
+            if not storage.compacting:
+                break
+            time.sleep(0.05)
+
+        self.assertTrue(os.path.isfile(f"{storage_dir}/A@1MIN.pickle"))
+        assert_frame_equal(storage.open("A", Interval.MIN_1), data)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
+    def test_wal_concurrent_compaction(self):
+        storage_dir = self.storage_dir + "_concurrent"
+        storage = PickleStorage(storage_dir, wal=True, compact_rows=5)
+        data = gen_data("A", 50)
+        threads = []
+        for i in range(50):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]].copy(True))
+            # Manual compactions race the ones started in the background
+            thread = threading.Thread(
+                target=storage.compact, args=("A", Interval.MIN_1)
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        storage.compact("A", Interval.MIN_1)
+        for _ in range(100):
+            if not storage.compacting:
+                break
+            time.sleep(0.05)
+
+        self.assertFalse(os.path.isfile(f"{storage_dir}/A@1MIN.pickle.tmp"))
+        assert_frame_equal(pd.read_pickle(f"{storage_dir}/A@1MIN.pickle"), data)
+        shutil.rmtree(pathlib.Path(storage_dir))
+
     @classmethod
     def tearDownClass(self):
         path = pathlib.Path(self.storage_dir)
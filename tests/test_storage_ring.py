@@ -0,0 +1,120 @@
+# Builtins
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage import RingStorage
+from harvest.utils import *
+
+
+class TestRingStorage(unittest.TestCase):
+    def test_create_storage(self):
+        storage = RingStorage()
+        self.assertEqual(storage.storage, {})
+
+    def test_simple_load(self):
+        storage = RingStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data)
+
+    def test_store_no_overlap(self):
+        storage = RingStorage()
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:50])
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[50:])
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data)
+
+    def test_store_overlap(self):
+        storage = RingStorage()
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[25:])
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:75])
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data)
+
+    def test_store_gap(self):
+        storage = RingStorage()
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:25])
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[75:])
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data.iloc[:25].append(data.iloc[75:]))
+
+    def test_replace_last(self):
+        storage = RingStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        update = data.iloc[[-1]].copy(True)
+        update[("A", "close")] = 42.0
+        storage.store("A", Interval.MIN_1, update)
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        self.assertEqual(len(loaded_data), 50)
+        self.assertEqual(loaded_data["A"]["close"][-1], 42.0)
+
+    def test_wrap_around(self):
+        storage = RingStorage(queue_size=20)
+        data = gen_data("A", 100)
+        for i in range(100):
+            storage.store("A", Interval.MIN_1, data.iloc[[i]].copy(True))
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data.iloc[-20:])
+
+    def test_unlimited_size(self):
+        storage = RingStorage(queue_size=20, limit_size=False)
+        data = gen_data("A", 100)
+        for i in range(0, 100, 10):
+            storage.store("A", Interval.MIN_1, data.iloc[i : i + 10].copy(True))
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data)
+
+    def test_load_range(self):
+        storage = RingStorage()
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        start, end = data.index[10], data.index[20]
+        loaded_data = storage.load("A", Interval.MIN_1, start, end)
+
+        assert_frame_equal(loaded_data, data.loc[start:end])
+        self.assertEqual(
+            storage.data_range("A", Interval.MIN_1), (data.index[0], data.index[-1])
+        )
+
+    def test_load_last_asof(self):
+        storage = RingStorage(queue_size=20)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        assert_frame_equal(storage.load_last("A", Interval.MIN_1, 5), data.iloc[-5:])
+        assert_frame_equal(
+            storage.load_asof("A", Interval.MIN_1, data.index[40]), data.iloc[40:41]
+        )
+        self.assertIsNone(storage.load_asof("A", Interval.MIN_1, data.index[10]))
+
+    def test_load_array(self):
+        storage = RingStorage(queue_size=20)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        prices = storage.load_array("A", Interval.MIN_1, "close")
+        self.assertListEqual(list(prices), list(data["A"]["close"].iloc[-20:]))
+        self.assertFalse(prices.flags.writeable)
+        self.assertListEqual(
+            list(storage.load_array("A", Interval.MIN_1, "open", 3)),
+            list(data["A"]["open"].iloc[-3:]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
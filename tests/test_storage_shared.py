@@ -0,0 +1,66 @@
+# Builtins
+import os
+import unittest
+import multiprocessing
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage import SharedMemoryStorage
+from harvest.utils import *
+
+
+def read_close(namespace, queue):
+    storage = SharedMemoryStorage(namespace, queue_size=20, writer=False)
+    queue.put(list(storage.load_array("A", Interval.MIN_1, "close")))
+    storage.close()
+
+
+class TestSharedMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.namespace = f"harvest-test-{os.getpid()}"
+        self.writer = SharedMemoryStorage(self.namespace, queue_size=20)
+
+    def test_store_load(self):
+        reader = SharedMemoryStorage(self.namespace, queue_size=20, writer=False)
+        self.assertIsNone(reader.load("A", Interval.MIN_1))
+
+        data = gen_data("A", 50)
+        self.writer.store("A", Interval.MIN_1, data.copy(True))
+        expected = data.iloc[-20:][self.writer.load("A", Interval.MIN_1).columns]
+        assert_frame_equal(reader.load("A", Interval.MIN_1), expected)
+
+        # The reader sees the candles stored after it attached
+        new_data = gen_data("A", 1)
+        new_data.index = new_data.index + dt.timedelta(hours=1)
+        self.writer.store("A", Interval.MIN_1, new_data)
+        self.assertEqual(
+            reader.load_last("A", Interval.MIN_1, 1).index[0], new_data.index[0]
+        )
+        self.assertEqual(
+            reader.data_range("A", Interval.MIN_1),
+            (data.index[-19], new_data.index[0]),
+        )
+
+        with self.assertRaises(Exception):
+            reader.store("A", Interval.MIN_1, data)
+        reader.close()
+
+    def test_other_process(self):
+        data = gen_data("A", 50)
+        self.writer.store("A", Interval.MIN_1, data.copy(True))
+
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=read_close, args=(self.namespace, queue))
+        process.start()
+        prices = queue.get(timeout=60)
+        process.join()
+        self.assertListEqual(prices, list(data["A"]["close"].iloc[-20:]))
+
+    def tearDown(self):
+        self.writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
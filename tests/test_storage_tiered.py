@@ -0,0 +1,105 @@
+# Builtins
+import shutil
+import pathlib
+import unittest
+import datetime as dt
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.storage import TieredStorage
+from harvest.utils import *
+
+
+class TestTieredStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_tiered_data"
+
+    def test_spill(self):
+        storage = TieredStorage(self.storage_dir + "_spill", queue_size=20)
+        data = gen_data("A", 100)
+        for i in range(0, 100, 10):
+            storage.store("A", Interval.MIN_1, data.iloc[i : i + 10].copy(True))
+
+        # Only the latest candles are kept in memory
+        self.assertEqual(len(storage.storage["A"][Interval.MIN_1]), 20)
+        assert_frame_equal(storage.load("A", Interval.MIN_1), data.iloc[-20:])
+
+        # Loads before the window read from the candle file
+        loaded_data = storage.load("A", Interval.MIN_1, data.index[5])
+        assert_frame_equal(loaded_data, data.iloc[5:], check_freq=False)
+        loaded_data = storage.load("A", Interval.MIN_1, data.index[5], data.index[9])
+        assert_frame_equal(loaded_data, data.iloc[5:10][data.columns], check_freq=False)
+        self.assertEqual(
+            storage.data_range("A", Interval.MIN_1), (data.index[0], data.index[-1])
+        )
+        shutil.rmtree(pathlib.Path(self.storage_dir + "_spill"))
+
+    def test_revise_spilled(self):
+        storage = TieredStorage(self.storage_dir + "_revise", queue_size=20)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+
+        revised = data.iloc[[3]].copy(True)
+        revised["A", "close"] = 2.0
+        storage.store("A", Interval.MIN_1, revised)
+        loaded_data = storage.load("A", Interval.MIN_1, data.index[0])
+        self.assertEqual(len(loaded_data), 50)
+        self.assertEqual(loaded_data["A"]["close"].iloc[3], 2.0)
+        shutil.rmtree(pathlib.Path(self.storage_dir + "_revise"))
+
+    def test_memory_budget(self):
+        storage = TieredStorage(self.storage_dir + "_budget", queue_size=20)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        storage.memory_budget = storage.memory_info()["bytes"]
+
+        storage.store("B", Interval.MIN_1, gen_data("B", 50))
+        # The window of A is moved to its candle file
+        self.assertNotIn("A", storage.storage)
+        assert_frame_equal(
+            storage.load("A", Interval.MIN_1), data.iloc[-20:], check_like=True
+        )
+        loaded_data = storage.load("A", Interval.MIN_1, data.index[0])
+        assert_frame_equal(loaded_data, data, check_freq=False, check_like=True)
+        shutil.rmtree(pathlib.Path(self.storage_dir + "_budget"))
+
+    def test_reopen(self):
+        storage1 = TieredStorage(self.storage_dir, queue_size=20)
+        data = gen_data("A", 50)
+        storage1.store("A", Interval.MIN_1, data.copy(True))
+        storage1.flush()
+
+        storage2 = TieredStorage(self.storage_dir, queue_size=20)
+        self.assertEqual(len(storage2.load("A", Interval.MIN_1)), 20)
+        loaded_data = storage2.load("A", Interval.MIN_1, data.index[0])
+        assert_frame_equal(loaded_data, data, check_freq=False, check_like=True)
+
+        # Storing again does not duplicate the candles read from the file
+        new_data = gen_data("A", 30)
+        new_data.index = new_data.index + dt.timedelta(hours=1)
+        storage2.store("A", Interval.MIN_1, new_data)
+        self.assertEqual(len(storage2.load("A", Interval.MIN_1, data.index[0])), 80)
+
+    def test_reopen_aggregation(self):
+        storage1 = TieredStorage(self.storage_dir + "_agg", queue_size=20)
+        interval = int(Interval.DAY_1) - 16
+        data = gen_data("A", 30)
+        storage1.store("A", interval, data.copy(True))
+        storage1.flush()
+
+        # Aggregations are saved with integer intervals
+        storage2 = TieredStorage(self.storage_dir + "_agg", queue_size=20)
+        self.assertIn(interval, storage2.catalog["A"])
+        self.assertEqual(len(storage2.load("A", interval)), 20)
+        shutil.rmtree(self.storage_dir + "_agg")
+
+    @classmethod
+    def tearDownClass(self):
+        path = pathlib.Path(self.storage_dir)
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,13 @@
 import unittest
 import pathlib
 import shutil
+import os
 
 # Submodule imports
 from harvest.trader import BackTester
 from harvest.algo import BaseAlgo
 from harvest.api.dummy import DummyStreamer
+from harvest.storage.candle_file import CandleFile
 from harvest.utils import *
 
 
@@ -51,6 +53,7 @@ class TestTester(unittest.TestCase):
     @tear_up_down
     def test_check_run(self):
         """ """
+
         class TestAlgo(BaseAlgo):
             def main(self):
                 print(self.get_datetime())
@@ -62,5 +65,72 @@ class TestTester(unittest.TestCase):
 
         self.assertTrue(True)
 
+    @tear_up_down
+    def test_declare_indicators(self):
+        """Indicators declared in config should be computed by a pipeline,
+        as in live trading."""
+
+        class TestAlgo(BaseAlgo):
+            def config(self):
+                self.indicators = [{"name": "sma", "period": 5}]
+
+            def main(self):
+                self.sma(period=5)
+
+        t = BackTester(DummyStreamer())
+        t.set_symbol("A")
+        t.set_algo(TestAlgo())
+        t.start("1MIN", period="1HR")
+
+        self.assertIn(("A", Interval.MIN_1, "close"), t.indicators.pipelines)
+        self.assertTrue(any(key[2] == "pipeline" for key in t.indicators.streams))
+
+    @tear_up_down
+    def test_check_run_mmap(self):
+        """Backtesting from memory-mapped candle files should simulate the
+        aggregations from the minute candles without writing pickle files."""
+        t = BackTester(DummyStreamer())
+        t.set_symbol("A")
+        t.set_algo(BaseAlgo())
+        t.start("1MIN", ["1DAY"], source="MMAP", path="data", period="1DAY")
+
+        self.assertTrue(os.path.isfile("data/A@1MIN.candles"))
+        self.assertFalse([f for f in os.listdir("data") if f.endswith(".pickle")])
+        minutes = list(t.storage.load("A", Interval.MIN_1)["A"]["close"])[-200:]
+        days_agg = list(t.storage.load("A", int(Interval.DAY_1) - 16)["A"]["close"])[
+            -200:
+        ]
+        self.assertListEqual(minutes, days_agg)
+
+    @tear_up_down
+    def test_run_mmap_start_between_bars(self):
+        """Backtesting from memory-mapped candle files should accept a start
+        time that is not the timestamp of a candle."""
+        streamer = DummyStreamer()
+        os.makedirs("data", exist_ok=True)
+        first = None
+        for interval in [Interval.MIN_1, Interval.DAY_1]:
+            df = streamer.fetch_price_history("A", interval)
+            CandleFile(f"data/A@{interval_enum_to_string(interval)}.candles").write(df)
+            first = df.index[0] if first is None else max(first, df.index[0])
+
+        # Backtesting dates are in local time
+        start = first + dt.timedelta(seconds=30)
+        t = BackTester(streamer)
+        t.set_symbol("A")
+        t.set_algo(BaseAlgo())
+        t.start(
+            "1MIN",
+            ["1DAY"],
+            source="MMAP",
+            path="data",
+            start=datetime_utc_to_local(start, t.timezone),
+            period="1DAY",
+        )
+
+        self.assertEqual(t.common_start, start)
+        self.assertGreater(t.df["A"][Interval.MIN_1].index[0], start)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,6 @@
 # Builtins
+import os
+import shutil
 import unittest
 import time
 
@@ -7,12 +9,13 @@ from harvest.trader import PaperTrader
 from harvest.algo import BaseAlgo
 from harvest.api.dummy import DummyStreamer
 from harvest.api.paper import PaperBroker
+from harvest.storage import PickleStorage
 
 # from harvest.api.robinhood import Robinhood
 
 import datetime as dt
 
-from harvest.utils import gen_data
+from harvest.utils import *
 
 
 class TestPaperTrader(unittest.TestCase):
@@ -60,6 +63,57 @@ class TestPaperTrader(unittest.TestCase):
         with self.assertRaises(Exception):
             t.start("30MIN", ["5MIN", "1DAY"])
 
+    def test_checkpoint(self):
+        path = "test_checkpoint.pickle"
+        t = PaperTrader(DummyStreamer(), checkpoint=path)
+        t.set_symbol("A")
+        t.set_algo(BaseAlgo())
+        t.start("1MIN")
+        t.stock_positions = [{"symbol": "A", "avg_price": 1.0, "quantity": 2}]
+        t.logger.add_transaction(t.timestamp, "buy", "stock", "A", 2)
+        t.save_checkpoint()
+        data = t.storage.load("A", Interval.MIN_1)
+
+        streamer = DummyStreamer()
+        fetched = []
+        fetch_price_history = streamer.fetch_price_history
+        streamer.fetch_price_history = lambda *args: fetched.append(args) or (
+            fetch_price_history(*args)
+        )
+        t = PaperTrader(streamer, checkpoint=path)
+        t.set_symbol("A")
+        t.set_algo(BaseAlgo())
+        t.start("1MIN")
+
+        # Only the data since the last stored timestamp is fetched
+        self.assertEqual(fetched, [("A", Interval.MIN_1, data.index[-1])])
+        # Positions are fetched from the broker, not restored
+        self.assertEqual(t.stock_positions, t.broker.fetch_stock_positions())
+        self.assertEqual(t.logger.get_last_transaction()["symbol"], "A")
+        self.assertEqual(t.storage.load("A", Interval.MIN_1).index[0], data.index[0])
+        os.remove(path)
+
+    def test_storage_init_delta(self):
+        storage_dir = "test_trader_data"
+        streamer = DummyStreamer()
+        data = streamer.fetch_price_history("A", Interval.MIN_1)
+        PickleStorage(storage_dir).store("A", Interval.MIN_1, data.iloc[:-10])
+
+        fetched = []
+        fetch_price_history = streamer.fetch_price_history
+        streamer.fetch_price_history = lambda *args: fetched.append(args) or (
+            fetch_price_history(*args)
+        )
+        t = PaperTrader(streamer, storage=PickleStorage(storage_dir))
+        t.set_symbol("A")
+        t.set_algo(BaseAlgo())
+        t.start("1MIN")
+
+        # Only the bars after the last saved one are fetched
+        self.assertEqual(fetched, [("A", Interval.MIN_1, data.index[-11])])
+        self.assertEqual(t.storage.load("A", Interval.MIN_1).index[-1], data.index[-1])
+        shutil.rmtree(storage_dir)
+
 
 if __name__ == "__main__":
     unittest.main()
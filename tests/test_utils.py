@@ -6,6 +6,7 @@ import time
 from harvest.utils import *
 
 import datetime as dt
+from pandas.testing import assert_frame_equal
 
 
 class TestUtils(unittest.TestCase):
@@ -31,6 +32,34 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(is_freq(dt.datetime(2000, 1, 1, 1, 0, 0), Interval.HR_1))
         self.assertFalse(is_freq(dt.datetime(2000, 1, 1, 1, 40, 0), Interval.HR_1))
 
+    def test_candle_aggregator(self):
+        """Feeding candles one at a time should produce the same candles
+        as aggregating all of them at once"""
+        data = gen_data("A", 100)
+        aggregator = CandleAggregator(Interval.MIN_15)
+        result = None
+        for i in range(len(data)):
+            candles = aggregator.update(data.iloc[[i]])
+            self.assertEqual(len(candles), 1)
+            result = candles if result is None else result.append(candles)
+        result = result[~result.index.duplicated(keep="last")]
+
+        assert_frame_equal(
+            result, aggregate_df(data, Interval.MIN_15), check_freq=False
+        )
+
+    def test_candle_aggregator_revision(self):
+        """Feeding the last candle again should replace its contribution"""
+        data = gen_data("A", 30)
+        aggregator = CandleAggregator(Interval.MIN_30)
+        aggregator.update(data.iloc[:-1])
+        aggregator.update(data.iloc[[-1]] * 2)
+        result = aggregator.update(data.iloc[[-1]])
+
+        assert_frame_equal(
+            result, aggregate_df(data, Interval.MIN_30).iloc[[-1]], check_freq=False
+        )
+
 
 if __name__ == "__main__":
     unittest.main()